@@ -0,0 +1,409 @@
+"""Calls CRUD functions directly against generated datasets of several sizes
+and reports, per call, wall time, SQL statements, rows fetched and Python
+memory allocated, so functions which scale badly with data size stand out.
+
+Usage:
+    python -m benchmarks.crud --sizes 1000 10000 100000
+    python -m benchmarks.crud --database postgresql+psycopg2://... --output crud.json
+    python -m benchmarks.crud --cases get_books get_reviews_of_book
+
+Without --database every size gets its own SQLite file in a temporary
+directory. A --database is emptied and refilled for every size, never point
+it at data you want to keep.
+
+Every call runs in a transaction which is rolled back afterwards, so write
+cases see the same data on every repeat, and caches are invalidated before
+it, so cached functions are measured against the database. Wall time is the
+median of --repeat calls; statements, rows and memory come from one more call
+with tracemalloc on, which would distort the timing.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.generator import Dataset
+from benchmarks.generator import write_database
+from project import models
+from project.authors import crud as authors_crud
+from project.books import crud as books_crud
+from project.books import schemas as books_schemas
+from project.cache import get_cache
+from project.database import create_database_engine
+from project.reviews import crud as reviews_crud
+from project.reviews import schemas as reviews_schemas
+from project.users import crud as users_crud
+
+NAMESPACES = ("authors", "books", "reviews", "users")
+SAVEPOINT_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class Targets:
+    """
+    Targets are rows the cases work on, the most reviewed book and the most
+    active user, so costs which grow with the number of reviews show up
+    """
+
+    def __init__(self, dataset: Dataset):
+        self.book_id = max(
+            range(1, dataset.sizes["books"] + 1),
+            key=lambda book_id: dataset.rating_counts[book_id],
+        )
+        self.user_id = max(
+            range(1, dataset.sizes["users"] + 1),
+            key=lambda user_id: dataset.user_counts[user_id],
+        )
+        self.username = f"user{self.user_id}"
+        self.author_id = 1
+        self.genre = books_schemas.BookGenre.FANTASY.value
+
+
+# name of case, call of CRUD function
+CASES: Dict[str, Callable[[Session, Targets], object]] = {
+    "get_book_by_id": lambda db, t: books_crud.get_book_by_id(db, t.book_id),
+    "get_books": lambda db, t: books_crud.get_books(db, 0, 20, None, None),
+    "get_books_deep_page": lambda db, t: books_crud.get_books(db, 1000, 20, None, None),
+    "count_books": lambda db, t: books_crud.count_books(db, None, None),
+    "get_books_by_rating": lambda db, t: books_crud.get_books_by_rating(
+        db, 4, 0, 20, None
+    ),
+    "get_books_by_author_id": lambda db, t: books_crud.get_books_by_author_id(
+        db, t.author_id
+    ),
+    "get_recommendations": lambda db, t: books_crud.get_recommendations(
+        db, t.genre, 0, 20
+    ),
+    "update_book": lambda db, t: books_crud.update_book(
+        db, t.book_id, books_schemas.BookUpdate(pages=321)
+    ),
+    "get_review_by_id": lambda db, t: reviews_crud.get_review_by_id(db, 1),
+    "get_reviews": lambda db, t: reviews_crud.get_reviews(db, 0, 20),
+    "get_reviews_of_book": lambda db, t: reviews_crud.get_reviews(
+        db, 0, 20, book_id=t.book_id
+    ),
+    "count_reviews_of_book": lambda db, t: reviews_crud.count_reviews(
+        db, book_id=t.book_id
+    ),
+    "create_review": lambda db, t: reviews_crud.create_review(
+        db,
+        reviews_schemas.ReviewCreate(
+            book_id=t.book_id, rating=reviews_schemas.ReviewRating.FIVE, text="bench"
+        ),
+        models.User(id=t.user_id),
+    ),
+    "update_book_rating": lambda db, t: reviews_crud.update_book_rating(
+        db, [t.book_id]
+    ),
+    "update_user_rank": lambda db, t: reviews_crud.update_user_rank(db, t.user_id),
+    "get_user_by_username": lambda db, t: users_crud.get_user_by_username(
+        db, t.username
+    ),
+    "get_users": lambda db, t: users_crud.get_users(db, 0, 20),
+    "count_users": lambda db, t: users_crud.count_users(db),
+    "get_author_by_id": lambda db, t: authors_crud.get_author_by_id(db, t.author_id),
+    "get_authors": lambda db, t: authors_crud.get_authors(db, 0, 20),
+    "count_authors": lambda db, t: authors_crud.count_authors(db),
+}
+
+
+class CountingCursor:
+    """
+    CountingCursor wraps a DBAPI cursor and counts rows fetched from it
+    """
+
+    def __init__(self, cursor, counter: "StatementCounter"):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._counter.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._counter.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._counter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._counter.rows += len(rows)
+        return rows
+
+
+class StatementCounter:
+    """
+    StatementCounter counts statements executed with an engine and rows
+    fetched by them while enabled
+    """
+
+    def __init__(self, bind: Engine):
+        self.enabled = False
+        self.statements = 0
+        self.rows = 0
+        event.listen(bind, "after_cursor_execute", self.after_cursor_execute)
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):  # pylint: disable=unused-argument,too-many-arguments
+        # savepoints belong to the rollback around the case, not to the case
+        if not self.enabled or statement.startswith(SAVEPOINT_STATEMENTS):
+            return
+        self.statements += 1
+        # the result is built from context.cursor after this event
+        if context is not None and cursor.description is not None:
+            context.cursor = CountingCursor(cursor, self)
+
+    def reset(self) -> None:
+        """zeroes counters"""
+        self.statements = 0
+        self.rows = 0
+
+
+def call(
+    bind: Engine,
+    case: Callable[[Session, Targets], object],
+    targets: Targets,
+    counter: Union[StatementCounter, None] = None,
+) -> float:
+    """runs case in a transaction which is rolled back afterwards,
+    commits of the case only release a savepoint
+
+    Args:
+        bind (Engine): database engine
+        case (Callable[[Session, Targets], object]): call of CRUD function
+        targets (Targets): rows to work on
+        counter (Union[StatementCounter, None], optional): counts statements
+        of the case only, not the ones managing the transaction
+
+    Returns:
+        float: seconds spent in the case
+    """
+    get_cache().invalidate(*NAMESPACES)
+    connection = bind.connect()
+    transaction = connection.begin()
+    db = sessionmaker(autocommit=False, autoflush=False)(bind=connection)
+    nested = connection.begin_nested()
+
+    @event.listens_for(db, "after_transaction_end")
+    def restart_savepoint(session, transaction):  # pylint: disable=unused-argument
+        nonlocal nested
+        if not nested.is_active:
+            nested = connection.begin_nested()
+
+    if counter is not None:
+        counter.enabled = True
+    try:
+        started = time.perf_counter()
+        case(db, targets)
+        return time.perf_counter() - started
+    finally:
+        if counter is not None:
+            counter.enabled = False
+        db.close()
+        transaction.rollback()
+        connection.close()
+
+
+def measure(
+    bind: Engine,
+    case: Callable[[Session, Targets], object],
+    targets: Targets,
+    counter: StatementCounter,
+    repeat: int,
+) -> dict:
+    """measures one case on a seeded database
+
+    Args:
+        bind (Engine): database engine
+        case (Callable[[Session, Targets], object]): call of CRUD function
+        targets (Targets): rows to work on
+        counter (StatementCounter): counter attached to bind
+        repeat (int): number of timed calls
+
+    Returns:
+        dict: wall time, statements, rows and allocated memory of one call
+    """
+    # fills statement caches and the connection pool
+    call(bind, case, targets)
+    durations = [call(bind, case, targets) for _ in range(repeat)]
+
+    counter.reset()
+    tracemalloc.start()
+    try:
+        call(bind, case, targets, counter)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(durations) * 1000, 3),
+        "min_ms": round(min(durations) * 1000, 3),
+        "statements": counter.statements,
+        "rows": counter.rows,
+        "allocated_kib": round(current / 1024, 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def seed(url: str, reviews: int, seed_value: int) -> Targets:
+    """recreates tables of url and fills them with a generated dataset
+
+    Args:
+        url (str): database url
+        reviews (int): number of reviews, sizes of other tables follow from it
+        seed_value (int): seed of the generator
+
+    Returns:
+        Targets: rows the cases work on
+    """
+    bind = create_database_engine(url)
+    models.Base.metadata.drop_all(bind=bind)
+    models.Base.metadata.create_all(bind=bind)
+    dataset = Dataset.from_reviews(reviews, seed=seed_value)
+    write_database(dataset, bind)
+    bind.dispose()
+    return Targets(dataset)
+
+
+def summarize(results: Dict[str, Dict[int, dict]]) -> Dict[str, dict]:
+    """compares the smallest and the largest dataset of every case
+
+    Args:
+        results (Dict[str, Dict[int, dict]]): measurements by case and size
+
+    Returns:
+        Dict[str, dict]: growth of time, rows and memory, and whether the number
+        of statements depends on data size, which points to an N+1 pattern
+    """
+    summary = {}
+    for name, by_size in results.items():
+        sizes = sorted(by_size)
+        first, last = by_size[sizes[0]], by_size[sizes[-1]]
+
+        def growth(metric: str) -> Union[float, None]:
+            # pylint: disable=cell-var-from-loop
+            if not first[metric]:
+                return None
+            return round(last[metric] / first[metric], 2)
+
+        summary[name] = {
+            "data_growth": round(sizes[-1] / sizes[0], 2),
+            "time_growth": growth("median_ms"),
+            "rows_growth": growth("rows"),
+            "memory_growth": growth("peak_kib"),
+            "statements_vary": len({by_size[size]["statements"] for size in sizes}) > 1,
+        }
+    return summary
+
+
+def print_table(results: Dict[str, Dict[int, dict]], summary: Dict[str, dict]):
+    """prints measurements, one line per case and size"""
+    print(
+        f"{'case':<24}{'reviews':>10}{'median ms':>12}{'stmts':>7}"
+        f"{'rows':>8}{'peak KiB':>10}{'time x':>9}"
+    )
+    for name, by_size in results.items():
+        for size in sorted(by_size):
+            stats = by_size[size]
+            print(
+                f"{name:<24}{size:>10}{stats['median_ms']:>12.3f}"
+                f"{stats['statements']:>7}{stats['rows']:>8}{stats['peak_kib']:>10.1f}",
+                end="",
+            )
+            if size == max(by_size):
+                print(f"{summary[name]['time_growth'] or 0:>9.2f}", end="")
+                if summary[name]["statements_vary"]:
+                    print("  statements grow with data", end="")
+            print()
+
+
+def run(
+    sizes: List[int],
+    cases: List[str],
+    database: Union[str, None] = None,
+    repeat: int = 5,
+    seed_value: int = 42,
+) -> dict:
+    """seeds a database of every size and measures cases on it
+
+    Args:
+        sizes (List[int]): numbers of reviews
+        cases (List[str]): names from CASES
+        database (Union[str, None], optional): url of a scratch database,
+        a SQLite file per size when None
+        repeat (int, optional): Defaults to 5.
+        seed_value (int, optional): Defaults to 42.
+
+    Returns:
+        dict: results by case and size, and their summary
+    """
+    directory = tempfile.mkdtemp()
+    results: Dict[str, Dict[int, dict]] = {name: {} for name in cases}
+    for size in sorted(sizes):
+        url = database or f"sqlite:///{os.path.join(directory, f'crud_{size}.db')}"
+        targets = seed(url, size, seed_value)
+        bind = create_database_engine(url)
+        counter = StatementCounter(bind)
+        try:
+            for name in cases:
+                results[name][size] = measure(
+                    bind, CASES[name], targets, counter, repeat
+                )
+        finally:
+            bind.dispose()
+    return {"results": results, "summary": summarize(results)}
+
+
+def main() -> None:
+    """command line entrypoint"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="numbers of reviews, other tables are sized from them",
+    )
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=None)
+    parser.add_argument(
+        "--database", help="scratch database url, it is emptied for every size"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    result = run(
+        args.sizes, args.cases or list(CASES), args.database, args.repeat, args.seed
+    )
+    print_table(result["results"], result["summary"])
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(result, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""Generates a deterministic synthetic dataset of any size.
+
+Usage:
+    python -m benchmarks.generator --reviews 1000000 [--seed 42] [--database URL]
+    python -m benchmarks.generator --reviews 1000000 --output data/
+
+Popularity is skewed like in a real catalog: books and authors are picked
+by a Zipf distribution, so a few books get most reviews, and users review
+with Zipf distributed activity. The same arguments always produce the same
+rows. Every user has the password "password", hashed once for all of them.
+
+Rows are streamed in batches, so 10^7 reviews need memory only for per book
+and per user aggregates. Ratings of books and ranks of users are computed
+from the generated reviews. Rows are inserted with explicit ids into empty
+tables, without outbox events, consumers should rebuild from the tables.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+from datetime import timedelta
+from itertools import accumulate
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Union
+
+from sqlalchemy import bindparam
+from sqlalchemy import insert
+from sqlalchemy import update
+from sqlalchemy.engine import Engine
+
+from project import models
+from project.books.schemas import BookGenre
+from project.books.schemas import BookType
+from project.database import create_database_engine
+from project.database import DATABASE_URL
+from project.reviews.schemas import ReviewRating
+from project.startup import create_schema
+from project.utils import get_password_hash
+from project.utils import get_user_rank
+
+PASSWORD = "password"
+
+ADJECTIVES = [
+    "Silent",
+    "Broken",
+    "Hidden",
+    "Last",
+    "Crimson",
+    "Endless",
+    "Forgotten",
+    "Golden",
+    "Distant",
+    "Wild",
+    "Secret",
+    "Burning",
+]
+NOUNS = [
+    "River",
+    "Empire",
+    "Garden",
+    "Shadow",
+    "Letter",
+    "Kingdom",
+    "Voyage",
+    "Storm",
+    "Promise",
+    "Mirror",
+    "Orchard",
+    "Machine",
+]
+FIRST_NAMES = ["Anna", "Boris", "Clara", "Dmytro", "Elena", "Felix", "Greta", "Ivan"]
+LAST_NAMES = ["Kowalski", "Novak", "Petrenko", "Schmidt", "Moreau", "Rossi", "Berg"]
+PHRASES = [
+    "could not put it down",
+    "slow start but worth it",
+    "characters felt flat",
+    "beautifully written",
+    "not my kind of book",
+    "the ending surprised me",
+    "too long",
+    "would read again",
+]
+
+
+class Dataset:
+    """
+    Dataset produces rows of every table in batches, ids start from 1
+    """
+
+    def __init__(
+        self,
+        reviews: int,
+        books: int,
+        users: int,
+        authors: int,
+        seed: int = 42,
+        skew: float = 1.1,
+        batch_size: int = 10_000,
+        days: int = 365,
+    ):
+        self.sizes = {
+            "reviews": reviews,
+            "books": books,
+            "users": users,
+            "authors": authors,
+        }
+        self.seed = seed
+        self.skew = skew
+        self.batch_size = batch_size
+        self.started_at = datetime(2022, 1, 1)
+        self.span = timedelta(days=days)
+        # filled while reviews are generated
+        self.rating_sums = [0] * (books + 1)
+        self.rating_counts = [0] * (books + 1)
+        self.user_counts = [0] * (users + 1)
+
+    @classmethod
+    def from_reviews(
+        cls,
+        reviews: int,
+        books: Union[int, None] = None,
+        users: Union[int, None] = None,
+        authors: Union[int, None] = None,
+        **kwargs,
+    ) -> "Dataset":
+        """creates dataset with sizes of other tables derived from reviews,
+        20 reviews per book, 10 per user and 5 books per author by default"""
+        books = books or max(reviews // 20, 10)
+        return cls(
+            reviews=reviews,
+            books=books,
+            users=users or max(reviews // 10, 10),
+            authors=authors or max(books // 5, 2),
+            **kwargs,
+        )
+
+    def rng(self, table: str) -> random.Random:
+        """gets generator of a table, so every table is reproducible on its own"""
+        return random.Random(f"{self.seed}:{table}")
+
+    def zipf_ids(self, table: str, size: int) -> List[int]:
+        """gets cumulative weights of ids, id popularity follows a Zipf law
+        with ranks shuffled, so popular rows are not just the first ones"""
+        ids = list(range(1, size + 1))
+        self.rng(f"{table}:ranks").shuffle(ids)
+        weights = [0.0] * size
+        for rank, row_id in enumerate(ids, start=1):
+            weights[row_id - 1] = 1 / rank**self.skew
+        return list(accumulate(weights))
+
+    def batches(self, rows: Iterator[dict]) -> Iterator[List[dict]]:
+        """groups rows into lists of batch_size"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def authors(self) -> Iterator[List[dict]]:
+        """generates rows of authors table"""
+        rng = self.rng("authors")
+        return self.batches(
+            {
+                "id": author_id,
+                "first_name": rng.choice(FIRST_NAMES),
+                "last_name": rng.choice(LAST_NAMES),
+                "middle_name": None,
+                "image_file": f"http://dummyimage.com/{author_id}.png",
+            }
+            for author_id in range(1, self.sizes["authors"] + 1)
+        )
+
+    def books(self) -> Iterator[List[dict]]:
+        """generates rows of books table, ratings are known after reviews()"""
+        rng = self.rng("books")
+        genres = list(BookGenre)
+        types = list(BookType)
+        return self.batches(
+            {
+                "id": book_id,
+                "title": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {book_id}",
+                "description": rng.choice(PHRASES).capitalize(),
+                "year": rng.randint(1900, 2022),
+                "image_file": f"http://dummyimage.com/{book_id}.png",
+                "rating": self.rating(book_id),
+                "pages": rng.randint(50, 1200),
+                "genre": rng.choice(genres).value,
+                "type": rng.choice(types).value,
+            }
+            for book_id in range(1, self.sizes["books"] + 1)
+        )
+
+    def author_links(self) -> Iterator[List[dict]]:
+        """generates rows of author_book table, every fifth book has two authors"""
+        rng = self.rng("author_book")
+        author_weights = self.zipf_ids("authors", self.sizes["authors"])
+        author_ids = range(1, self.sizes["authors"] + 1)
+
+        def links():
+            for book_id in range(1, self.sizes["books"] + 1):
+                count = 2 if book_id % 5 == 0 else 1
+                chosen = rng.choices(author_ids, cum_weights=author_weights, k=count)
+                for author_id in set(chosen):
+                    yield {"book_id": book_id, "author_id": author_id}
+
+        return self.batches(links())
+
+    def users(self, password_hash: str) -> Iterator[List[dict]]:
+        """generates rows of users table, ranks are known after reviews()"""
+        return self.batches(
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@mail.com",
+                "password": password_hash,
+                "rank": get_user_rank(self.user_counts[user_id]),
+            }
+            for user_id in range(1, self.sizes["users"] + 1)
+        )
+
+    def reviews(self) -> Iterator[List[dict]]:
+        """generates rows of reviews table, created_at grows with id"""
+        rng = self.rng("reviews")
+        book_weights = self.zipf_ids("books", self.sizes["books"])
+        user_weights = self.zipf_ids("users", self.sizes["users"])
+        book_ids = range(1, self.sizes["books"] + 1)
+        user_ids = range(1, self.sizes["users"] + 1)
+        # every book has its own quality, ratings are spread around it
+        quality_rng = self.rng("quality")
+        quality = [quality_rng.uniform(1.5, 4.8) for _ in range(len(book_ids) + 1)]
+        total = self.sizes["reviews"]
+        step = self.span / max(total, 1)
+        review_id = 0
+        while review_id < total:
+            size = min(self.batch_size, total - review_id)
+            books = rng.choices(book_ids, cum_weights=book_weights, k=size)
+            users = rng.choices(user_ids, cum_weights=user_weights, k=size)
+            batch = []
+            for book_id, user_id in zip(books, users):
+                review_id += 1
+                rating = min(
+                    max(round(rng.gauss(quality[book_id], 1)), ReviewRating.ONE),
+                    ReviewRating.FIVE,
+                )
+                self.rating_sums[book_id] += rating
+                self.rating_counts[book_id] += 1
+                self.user_counts[user_id] += 1
+                batch.append(
+                    {
+                        "id": review_id,
+                        "user_id": user_id,
+                        "book_id": book_id,
+                        "rating": rating,
+                        "text": rng.choice(PHRASES),
+                        "created_at": self.started_at + step * review_id,
+                    }
+                )
+            yield batch
+
+    def rating(self, book_id: int) -> float:
+        """gets average rating of generated reviews of a book"""
+        if not self.rating_counts[book_id]:
+            return 0
+        return round(self.rating_sums[book_id] / self.rating_counts[book_id], 2)
+
+
+def write_files(dataset: Dataset, directory: str) -> Dict[str, int]:
+    """writes dataset as JSON lines files, one per table
+
+    Args:
+        dataset (Dataset)
+        directory (str): output directory, created if missing
+
+    Returns:
+        Dict[str, int]: number of rows per table
+    """
+    os.makedirs(directory, exist_ok=True)
+    password_hash = get_password_hash(PASSWORD)
+    counts = {}
+    # reviews go first, so books and users carry their aggregates
+    tables = [
+        ("reviews", dataset.reviews),
+        ("authors", dataset.authors),
+        ("books", dataset.books),
+        ("author_book", dataset.author_links),
+        ("users", lambda: dataset.users(password_hash)),
+    ]
+    for table, batches in tables:
+        counts[table] = 0
+        path = os.path.join(directory, f"{table}.jsonl")
+        with open(path, "w", encoding="utf8") as file:
+            for batch in batches():
+                for row in batch:
+                    file.write(json.dumps(row, default=str) + "\n")
+                counts[table] += len(batch)
+    return counts
+
+
+def write_database(dataset: Dataset, bind: Engine) -> Dict[str, int]:
+    """inserts dataset into empty tables with multi-row inserts, then stores
+    aggregates and moves id sequences past the inserted ids
+
+    Args:
+        dataset (Dataset)
+        bind (Engine): database engine
+
+    Returns:
+        Dict[str, int]: number of rows per table
+    """
+    password_hash = get_password_hash(PASSWORD)
+    counts = {}
+    tables = [
+        (models.Author.__table__, dataset.authors),
+        (models.Book.__table__, dataset.books),
+        (models.AuthorBook, dataset.author_links),
+        (models.User.__table__, lambda: dataset.users(password_hash)),
+        (models.Review.__table__, dataset.reviews),
+    ]
+    with bind.begin() as conn:
+        for table, batches in tables:
+            counts[table.name] = 0
+            for batch in batches():
+                conn.execute(insert(table), batch)
+                counts[table.name] += len(batch)
+
+        books = models.Book.__table__
+        for batch in dataset.batches(
+            {"book_id": book_id, "new_rating": dataset.rating(book_id)}
+            for book_id in range(1, dataset.sizes["books"] + 1)
+        ):
+            conn.execute(
+                update(books)
+                .where(books.c.id == bindparam("book_id"))
+                .values(rating=bindparam("new_rating")),
+                batch,
+            )
+        users = models.User.__table__
+        for batch in dataset.batches(
+            {"user_id": user_id, "new_rank": get_user_rank(count)}
+            for user_id, count in enumerate(dataset.user_counts)
+            if user_id
+        ):
+            conn.execute(
+                update(users)
+                .where(users.c.id == bindparam("user_id"))
+                .values(rank=bindparam("new_rank")),
+                batch,
+            )
+
+        if bind.dialect.name == "postgresql":
+            for table in ("authors", "books", "users", "reviews"):
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+                )
+    return counts
+
+
+def main() -> None:
+    """command line entrypoint"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--reviews", type=int, default=10_000)
+    parser.add_argument("--books", type=int, help="defaults to reviews / 20")
+    parser.add_argument("--users", type=int, help="defaults to reviews / 10")
+    parser.add_argument("--authors", type=int, help="defaults to books / 5")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Zipf exponent of popularity"
+    )
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--output", help="write JSON lines files to this directory")
+    parser.add_argument("--database", help="database url, defaults to DATABASE_URL")
+    parser.add_argument(
+        "--create-schema",
+        action="store_true",
+        help="create tables and stamp the head revision of an empty database",
+    )
+    args = parser.parse_args()
+
+    dataset = Dataset.from_reviews(
+        args.reviews,
+        books=args.books,
+        users=args.users,
+        authors=args.authors,
+        seed=args.seed,
+        skew=args.skew,
+        batch_size=args.batch_size,
+    )
+    started = time.perf_counter()
+    if args.output:
+        counts = write_files(dataset, args.output)
+    else:
+        bind = create_database_engine(args.database or DATABASE_URL)
+        if args.create_schema:
+            create_schema(bind)
+        counts = write_database(dataset, bind)
+    print(
+        json.dumps(
+            {**counts, "seconds": round(time.perf_counter() - started, 2)}, indent=4
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
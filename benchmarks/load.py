@@ -0,0 +1,380 @@
+"""Replays a weighted mix of realistic requests against the API and reports
+throughput, latency percentiles and database queries per route.
+
+Usage:
+    python -m benchmarks.load --database sqlite:///./load.db --seed-reviews 100000
+    python -m benchmarks.load --url http://localhost:8000 --duration 60
+    python -m benchmarks.load --output new.json --baseline old.json
+
+Without --url the app is started with gunicorn against --database (defaults
+to DATABASE_URL), after seeding it with benchmarks.generator if asked to.
+Login rate limits of the started app are lifted, all virtual users come from
+one address. Queries per request are read from the Server-Timing header.
+
+With --baseline every route is compared to a saved result, a route whose
+p95 latency grew or whose throughput dropped by more than --tolerance is a
+regression, and the exit code is 1.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+from benchmarks.generator import Dataset
+from benchmarks.generator import PASSWORD
+from benchmarks.generator import write_database
+from project.books.schemas import BookGenre
+from project.database import create_database_engine
+from project.database import DATABASE_URL
+from project.reviews.schemas import ReviewRating
+from project.startup import create_schema
+
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+
+# name of route, weight in the mix
+SCENARIOS = {
+    "GET /books/": 30,
+    "GET /books/{book_id}": 25,
+    "GET /reviews/": 15,
+    "GET /books/recommendations/{genre}": 10,
+    "GET /books/rating/{rating}": 5,
+    "POST /users/login": 5,
+    "POST /reviews/": 10,
+}
+
+
+class Client:
+    """
+    Client is one virtual user with a keep-alive connection
+    """
+
+    def __init__(self, url: str, users: int, books: int, rng: random.Random):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        self.users = users
+        self.books = books
+        self.rng = rng
+        self.token = None
+
+    def request(
+        self, method: str, path: str, body: Union[str, None] = None, headers=None
+    ) -> Tuple[int, bytes, int]:
+        """sends request and reads the whole response
+
+        Returns:
+            Tuple[int, bytes, int]: status, body and number of database queries
+        """
+        self.connection.request(method, path, body=body, headers=headers or {})
+        response = self.connection.getresponse()
+        data = response.read()
+        match = QUERIES_PATTERN.search(response.getheader("Server-Timing", ""))
+        return response.status, data, int(match.group(1)) if match else 0
+
+    def count(self, path: str) -> int:
+        """gets number of rows of a list endpoint from X-Total-Count"""
+        self.connection.request("GET", f"{path}?total=true&limit=1")
+        response = self.connection.getresponse()
+        response.read()
+        return max(int(response.getheader("X-Total-Count", 1)), 1)
+
+    def login(self) -> Tuple[int, bytes, int]:
+        """logs in as a random user and keeps its token"""
+        username = f"user{self.rng.randint(1, self.users)}"
+        result = self.request(
+            "POST",
+            "/users/login",
+            body=urlencode({"username": username, "password": PASSWORD}),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        if result[0] == 201:
+            self.token = json.loads(result[1])["access_token"]
+        return result
+
+    def run(self, scenario: str) -> Tuple[int, bytes, int]:
+        """sends request of a scenario with random parameters"""
+        rng = self.rng
+        if scenario == "GET /books/":
+            return self.request("GET", f"/books/?offset={rng.randint(0, 200)}")
+        if scenario == "GET /books/{book_id}":
+            return self.request("GET", f"/books/{rng.randint(1, self.books)}")
+        if scenario == "GET /reviews/":
+            return self.request(
+                "GET", f"/reviews/?book_id={rng.randint(1, self.books)}"
+            )
+        if scenario == "GET /books/recommendations/{genre}":
+            genre = rng.choice(list(BookGenre)).value
+            return self.request("GET", f"/books/recommendations/{genre}")
+        if scenario == "GET /books/rating/{rating}":
+            return self.request(
+                "GET", f"/books/rating/{rng.choice(list(ReviewRating))}"
+            )
+        if scenario == "POST /users/login":
+            return self.login()
+        if scenario == "POST /reviews/":
+            if self.token is None:
+                self.login()
+            review = {
+                "text": "load test",
+                "rating": rng.choice(list(ReviewRating)),
+                "book_id": rng.randint(1, self.books),
+            }
+            return self.request(
+                "POST",
+                "/reviews/",
+                body=json.dumps(review),
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.token}",
+                },
+            )
+        raise ValueError(f"unknown scenario {scenario}")
+
+
+def percentile(values: List[float], share: float) -> float:
+    """gets nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(share * len(values))) - 1))
+    return values[index]
+
+
+def summarize(samples: Dict[str, list], seconds: float) -> Dict[str, dict]:
+    """turns samples of (latency, status, queries) into stats per route"""
+    routes = {}
+    for route, route_samples in sorted(samples.items()):
+        latencies = sorted(sample[0] * 1000 for sample in route_samples)
+        routes[route] = {
+            "requests": len(route_samples),
+            "errors": sum(sample[1] >= 400 for sample in route_samples),
+            "rps": round(len(route_samples) / seconds, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "queries": round(
+                sum(sample[2] for sample in route_samples) / len(route_samples), 2
+            ),
+        }
+    return routes
+
+
+def run_load(
+    url: str,
+    duration: float,
+    concurrency: int,
+    warmup: float,
+    seed: int,
+    mix: Union[Dict[str, int], None] = None,
+) -> dict:
+    """runs virtual users in threads for duration seconds after warmup
+
+    Args:
+        url (str): base url of the app
+        duration (float): seconds of measurement
+        concurrency (int): number of virtual users
+        warmup (float): seconds of requests which are not measured
+        seed (int): seed of random parameters
+        mix (Union[Dict[str, int], None], optional): weights of scenarios.
+        Defaults to SCENARIOS.
+
+    Returns:
+        dict: stats of the run
+    """
+    mix = mix or SCENARIOS
+    probe = Client(url, 1, 1, random.Random(seed))
+    books = probe.count("/books/")
+    users = probe.count("/users/")
+    probe.connection.close()
+
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def virtual_user(number: int) -> None:
+        rng = random.Random(f"{seed}:{number}")
+        client = Client(url, users, books, rng)
+        scenarios, weights = zip(*mix.items())
+        while True:
+            scenario = rng.choices(scenarios, weights=weights)[0]
+            request_started = time.perf_counter()
+            if request_started >= stop_at:
+                break
+            try:
+                status, _, queries = client.run(scenario)
+            except (OSError, http.client.HTTPException):
+                client.connection.close()
+                status, queries = 599, 0
+            finished = time.perf_counter()
+            if request_started >= measure_from:
+                with lock:
+                    samples[scenario].append(
+                        (finished - request_started, status, queries)
+                    )
+        client.connection.close()
+
+    threads = [
+        threading.Thread(target=virtual_user, args=(number,))
+        for number in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    routes = summarize(samples, duration)
+    return {
+        "duration": duration,
+        "concurrency": concurrency,
+        "books": books,
+        "users": users,
+        "rps": round(sum(route["rps"] for route in routes.values()), 2),
+        "errors": sum(route["errors"] for route in routes.values()),
+        "routes": routes,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """finds routes which got slower than baseline
+
+    Args:
+        result (dict): stats of this run
+        baseline (dict): stats of a saved run
+        tolerance (float): allowed relative change, e.g. 0.1
+
+    Returns:
+        List[str]: descriptions of regressions
+    """
+    regressions = []
+    print(f"{'route':40} {'rps':>18} {'p95 ms':>20} {'queries':>14}")
+    for route, stats in result["routes"].items():
+        old = baseline["routes"].get(route)
+        if old is None:
+            continue
+        print(
+            f"{route:40} {old['rps']:>8} -> {stats['rps']:<8}"
+            f" {old['p95_ms']:>9} -> {stats['p95_ms']:<9}"
+            f" {old['queries']:>5} -> {stats['queries']:<5}"
+        )
+        if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        if stats["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: rps {old['rps']} -> {stats['rps']}")
+        if stats["queries"] > old["queries"]:
+            regressions.append(
+                f"{route}: queries {old['queries']} -> {stats['queries']}"
+            )
+    return regressions
+
+
+def start_server(
+    database: str, port: int, workers: int, log: Union[str, None] = None
+) -> subprocess.Popen:
+    """starts the app with gunicorn and waits till it answers"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": database,
+        "BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": str(workers),
+        "MAX_REQUESTS": "0",
+        "LOGIN_IP_BURST": "1000000",
+        "LOGIN_IP_PER_MINUTE": "1000000",
+        "LOGIN_USERNAME_BURST": "1000000",
+        "LOGIN_USERNAME_PER_MINUTE": "1000000",
+    }
+    output = open(  # pylint: disable=consider-using-with
+        log or os.devnull, "w", encoding="utf8"
+    )
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"],
+        env=env,
+        stdout=output,
+        stderr=subprocess.STDOUT,
+    )
+    output.close()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/openapi.json")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start, see its output with --server-log")
+
+
+def main() -> None:
+    """command line entrypoint"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="benchmark a running app instead of starting one")
+    parser.add_argument("--database", help="database url, defaults to DATABASE_URL")
+    parser.add_argument(
+        "--seed-reviews",
+        type=int,
+        help="create schema and fill the empty database with this many reviews",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--server-log", help="write output of the started app here")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        database = args.database or DATABASE_URL
+        if args.seed_reviews:
+            engine = create_database_engine(database)
+            create_schema(engine)
+            write_database(
+                Dataset.from_reviews(args.seed_reviews, seed=args.seed), engine
+            )
+            engine.dispose()
+        server = start_server(database, args.port, args.workers, args.server_log)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        result = run_load(url, args.duration, args.concurrency, args.warmup, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(result, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(result, file, indent=4)
+    if args.baseline:
+        with open(args.baseline, encoding="utf8") as file:
+            regressions = compare(result, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
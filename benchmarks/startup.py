@@ -0,0 +1,87 @@
+"""Measures how long a worker needs to import the app and run its startup hooks.
+
+Usage:
+    python -m benchmarks.startup [--runs 10] [--output startup.json]
+
+Every run is a fresh interpreter, so module caches of earlier runs do not help.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MEASURE = """
+import json
+import time
+
+import anyio
+
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+# hooks run in an event loop like under uvicorn
+anyio.run(main.app.router.startup)
+finished = time.perf_counter()
+print(json.dumps({"import": imported - started, "startup": finished - imported}))
+"""
+
+
+def measure(runs: int, check_revision: bool) -> dict:
+    """runs the measurement in fresh interpreters
+
+    Args:
+        runs (int): number of interpreters to start
+        check_revision (bool): verify the database revision on startup
+
+    Returns:
+        dict: median, min and max of import and startup time in milliseconds
+    """
+    env = {"CHECK_SCHEMA_REVISION": "1" if check_revision else "0"}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE],
+            check=True,
+            capture_output=True,
+            text=True,
+            env={**os.environ, **env},
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    result = {}
+    for phase in ("import", "startup"):
+        values = [sample[phase] * 1000 for sample in samples]
+        result[phase] = {
+            "median_ms": round(statistics.median(values), 2),
+            "min_ms": round(min(values), 2),
+            "max_ms": round(max(values), 2),
+        }
+    return result
+
+
+def main() -> None:
+    """command line entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--no-check-revision",
+        action="store_true",
+        help="skip the database revision check, no database is needed then",
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    result = {
+        "runs": args.runs,
+        "check_revision": not args.no_check_revision,
+        **measure(args.runs, not args.no_check_revision),
+    }
+    print(json.dumps(result, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(result, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
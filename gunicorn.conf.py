@@ -0,0 +1,32 @@
+"""Production server settings, used with
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Every value can be overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+# one worker per core, the application is imported once in the master
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+preload_app = True
+# recycle workers after this many requests, jitter avoids restarting all at once
+max_requests = int(os.environ.get("MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 100))
+# on SIGTERM workers finish in-flight requests for up to this many seconds
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+accesslog = "-"
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """connection pools must not be shared between processes, the child
+    starts with empty pools and leaves connections of the master alone"""
+    from project.database import (  # pylint: disable=import-outside-toplevel
+        dispose_engines,
+    )
+
+    dispose_engines(close=False)
@@ -1,13 +1,14 @@
 from fastapi import FastAPI
 
-from project.database import Base
-from project.database import engine
+from project.compression import CompressionMiddleware
+from project.profiling import QueryCountMiddleware
 from project.routers import authors
 from project.routers import books
 from project.routers import reviews
+from project.routers import sync
 from project.routers import users
-
-Base.metadata.create_all(bind=engine)
+from project.startup import on_shutdown
+from project.startup import on_startup
 
 tags_metadata = [
     {
@@ -17,6 +18,9 @@ tags_metadata = [
 Things you can do:
 * **Get all authors**
 * **Create new author**
+* **Search authors by name, tolerating typos**
+* **Autocomplete author names**
+* **Get many authors by ids at once**
 * **Get author by id**
 * **Update author by id**
 * **Delete author by id**""",
@@ -27,9 +31,12 @@ Things you can do:
 
 Things you can do:
 * **Get all books (available filters by genre and type)**
+* **Count books per genre, type, rating and decade**
 * **Create new book**
 * **Get books by specific rating**
 * **Get books recommendations by genre**
+* **Autocomplete book titles**
+* **Get many books by ids at once**
 * **Get book by id**
 * **Update book by id**
 * **Delete book by id**
@@ -39,11 +46,19 @@ Things you can do:
         "name": "Reviews",
         "description": """
 Things you can do:
-* **Get all reviews**
+* **Get all reviews (available filters by book, user, rating and creation time)**
 * **Create new review if you authorized**
+* **Create many reviews at once if you authorized**
+* **Get many reviews by ids at once**
 * **Get review by id**
 * **Update review by id if you authorized**
 * **Delete review by id if you authorized**""",
+    },
+    {
+        "name": "Sync",
+        "description": """
+Things you can do:
+* **Get ids of authors, books, reviews and users changed or deleted since the last sync**""",
     },
     {
         "name": "Users",
@@ -66,9 +81,16 @@ app = FastAPI(
     docs_url="/",
 )
 
+app.add_event_handler("startup", on_startup)
+app.add_event_handler("shutdown", on_shutdown)
+app.add_middleware(QueryCountMiddleware)
+# outermost, so Server-Timing of the queries is already set when compressing
+app.add_middleware(CompressionMiddleware)
+
 app.include_router(authors.router)
 app.include_router(books.router)
 app.include_router(reviews.router)
+app.include_router(sync.router)
 app.include_router(users.router)
 
 
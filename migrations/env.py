@@ -16,8 +16,15 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 from project import models
+from project.database import DATABASE_URL
 
 target_metadata = models.Base.metadata
+
+if not config.get_main_option("sqlalchemy.url"):
+    config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+# SQLite cannot alter constraints in place, autogenerated migrations
+# recreate the table in batch mode instead
+render_as_batch = config.get_main_option("sqlalchemy.url").startswith("sqlite")
 # target_metadata = None
 
 # other values from the config, defined by the needs of env.py,
@@ -44,6 +51,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=render_as_batch,
     )
 
     with context.begin_transaction():
@@ -64,7 +72,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=render_as_batch,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,33 @@
+"""added book documents
+
+Revision ID: 3d8a6c1f0e47
+Revises: 9a4f1c6e2b58
+Create Date: 2026-10-19 19:02:41.118305
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3d8a6c1f0e47"
+down_revision = "9a4f1c6e2b58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # documents are rendered when books, their authors or reviews change,
+    # reads of books without a current document render it without storing
+    op.create_table(
+        "book_documents",
+        sa.Column("book_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("body", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["book_id"], ["books.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("book_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("book_documents")
@@ -0,0 +1,41 @@
+"""added review listing indexes
+
+Revision ID: 3f9c2a7d5e41
+Revises: b676193b9b18
+Create Date: 2026-10-19 10:12:31.408215
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3f9c2a7d5e41"
+down_revision = "b676193b9b18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_reviews_book_id_created_at", "reviews", ["book_id", "created_at", "id"]
+    )
+    op.create_index(
+        "ix_reviews_book_id_rating_created_at",
+        "reviews",
+        ["book_id", "rating", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_reviews_user_id_created_at", "reviews", ["user_id", "created_at", "id"]
+    )
+    op.create_index(
+        "ix_reviews_rating_created_at", "reviews", ["rating", "created_at", "id"]
+    )
+    op.create_index("ix_reviews_created_at", "reviews", ["created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reviews_created_at", table_name="reviews")
+    op.drop_index("ix_reviews_rating_created_at", table_name="reviews")
+    op.drop_index("ix_reviews_user_id_created_at", table_name="reviews")
+    op.drop_index("ix_reviews_book_id_rating_created_at", table_name="reviews")
+    op.drop_index("ix_reviews_book_id_created_at", table_name="reviews")
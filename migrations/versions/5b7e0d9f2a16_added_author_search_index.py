@@ -0,0 +1,34 @@
+"""added author search index
+
+Revision ID: 5b7e0d9f2a16
+Revises: c41e7f93b2d8
+Create Date: 2026-10-19 16:21:05.118342
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "5b7e0d9f2a16"
+down_revision = "c41e7f93b2d8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # other databases search authors in memory
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "CREATE INDEX ix_authors_search_name ON authors USING gin (("
+        "coalesce(first_name, '') || ' ' || coalesce(middle_name, '') || ' ' || "
+        "coalesce(last_name, '')) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # the extension is left installed, other objects may depend on it
+    op.execute("DROP INDEX ix_authors_search_name")
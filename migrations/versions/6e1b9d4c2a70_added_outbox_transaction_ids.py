@@ -0,0 +1,39 @@
+"""added outbox transaction ids
+
+Revision ID: 6e1b9d4c2a70
+Revises: 3d8a6c1f0e47
+Create Date: 2026-10-19 21:14:09.562803
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "6e1b9d4c2a70"
+down_revision = "3d8a6c1f0e47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing events and checkpoints come first with transaction id 0
+    op.add_column(
+        "outbox",
+        sa.Column(
+            "transaction_id", sa.BigInteger(), server_default="0", nullable=False
+        ),
+    )
+    op.create_index("ix_outbox_transaction_id", "outbox", ["transaction_id", "id"])
+    op.add_column(
+        "outbox_checkpoints",
+        sa.Column(
+            "transaction_id", sa.BigInteger(), server_default="0", nullable=False
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("outbox_checkpoints", "transaction_id")
+    op.drop_index("ix_outbox_transaction_id", table_name="outbox")
+    op.drop_column("outbox", "transaction_id")
@@ -0,0 +1,34 @@
+"""added aggregate jobs
+
+Revision ID: 8d2e4b6a1c73
+Revises: 3f9c2a7d5e41
+Create Date: 2026-10-19 12:40:05.117342
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "8d2e4b6a1c73"
+down_revision = "3f9c2a7d5e41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "aggregate_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("target_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "kind", "target_id", name="uq_aggregate_jobs_kind_target_id"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("aggregate_jobs")
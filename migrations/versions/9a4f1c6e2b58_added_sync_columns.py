@@ -0,0 +1,50 @@
+"""added sync columns
+
+Revision ID: 9a4f1c6e2b58
+Revises: 5b7e0d9f2a16
+Create Date: 2026-10-19 17:48:13.402715
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9a4f1c6e2b58"
+down_revision = "5b7e0d9f2a16"
+branch_labels = None
+depends_on = None
+
+TABLES = ("authors", "books", "reviews", "users")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        # existing rows are reported by the first sync of every client
+        op.add_column(
+            table,
+            sa.Column(
+                "updated_at",
+                sa.DateTime(),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+        )
+        op.create_index(f"ix_{table}_updated_at", table, ["updated_at", "id"])
+    op.create_table(
+        "tombstones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("entity", sa.String(), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tombstones_deleted_at", "tombstones", ["deleted_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tombstones_deleted_at", table_name="tombstones")
+    op.drop_table("tombstones")
+    for table in reversed(TABLES):
+        op.drop_index(f"ix_{table}_updated_at", table_name=table)
+        op.drop_column(table, "updated_at")
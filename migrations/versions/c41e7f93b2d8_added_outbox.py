@@ -0,0 +1,51 @@
+"""added outbox
+
+Revision ID: c41e7f93b2d8
+Revises: 8d2e4b6a1c73
+Create Date: 2026-10-19 14:02:47.530916
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "c41e7f93b2d8"
+down_revision = "8d2e4b6a1c73"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "books",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "reviews",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("entity", sa.String(), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("operation", sa.String(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "outbox_checkpoints",
+        sa.Column("consumer", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("consumer"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("outbox_checkpoints")
+    op.drop_table("outbox")
+    op.drop_column("reviews", "version")
+    op.drop_column("books", "version")
@@ -1,12 +1,23 @@
 from typing import List
+from typing import Tuple
 
 from fastapi import HTTPException
 from fastapi import status
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm import Session
 
+from project import invalidation
 from project import models
+from project import outbox
+from project import sync
 from project.authors import schemas
+from project.authors.search import get_author_index
+from project.books import documents
+from project.cache import get_cache
 from project.models import Book
+from project.pagination import count_rows
+from project.utils import order_by_ids
 
 
 def create_author(db: Session, author: schemas.AuthorCreate) -> models.Author:
@@ -26,8 +37,12 @@ def create_author(db: Session, author: schemas.AuthorCreate) -> models.Author:
         image_file=author.image_file,
     )
     db.add(new_author)
+    db.flush()
+    invalidation.notify(db, "authors", [new_author.id], "authors")
     db.commit()
+    get_cache().invalidate("authors")
     db.refresh(new_author)
+    get_author_index().add(new_author)
     return new_author
 
 
@@ -45,6 +60,18 @@ def get_authors(db: Session, offset: int, limit: int) -> List[models.Author]:
     return db.query(models.Author).offset(offset).limit(limit).all()
 
 
+def count_authors(db: Session) -> Tuple[int, bool]:
+    """counts authors, approximately for large tables
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+
+    Returns:
+        Tuple[int, bool]: number of authors and true if the number is exact
+    """
+    return count_rows(db, db.query(models.Author), "authors")
+
+
 def get_author_by_id(db: Session, author_id: int) -> models.Author:
     """gets instance of Author model from database by its id
 
@@ -67,6 +94,23 @@ def get_author_by_id(db: Session, author_id: int) -> models.Author:
     return author
 
 
+def get_authors_by_ids(
+    db: Session, author_ids: List[int]
+) -> Tuple[List[models.Author], List[int]]:
+    """gets instances of Author model by a list of ids with one IN query
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        author_ids (List[int]): Primary keys of Author model
+
+    Returns:
+        Tuple[List[models.Author], List[int]]: authors in the requested order
+        and ids of missing authors
+    """
+    authors = db.query(models.Author).filter(models.Author.id.in_(author_ids)).all()
+    return order_by_ids(authors, author_ids)
+
+
 def update_author(
     db: Session, author_id: int, updated_author: schemas.AuthorUpdate
 ) -> models.Author:
@@ -93,8 +137,18 @@ def update_author(
         setattr(author, key, value)
 
     db.add(author)
+    # books show names of their authors
+    author_books = select(models.AuthorBook.c.book_id).where(
+        models.AuthorBook.c.author_id == author_id
+    )
+    documents.touch_books(db, Book.id.in_(author_books))
+    db.flush()
+    documents.render_documents(db, author_books)
+    invalidation.notify(db, "authors", [author_id], "authors", "books")
     db.commit()
+    get_cache().invalidate("authors", "books")
     db.refresh(author)
+    get_author_index().add(author)
 
     return author
 
@@ -110,14 +164,34 @@ def delete_author(db: Session, author_id: int) -> None:
         HTTPException: Handles no value
     """
     author = db.query(models.Author).filter(models.Author.id == author_id)
-    if not author.first():
+    found = author.options(
+        selectinload(models.Author.books).selectinload(Book.authors)
+    ).first()
+    if not found:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Author with id {author_id} is not found",
         )
-    for book in author.first().books:
-        if len(book.authors) <= 1:
-            delete_book = db.query(Book).filter(Book.id == book.id)
-            delete_book.delete()
+    co_authored, sole = [], []
+    for book in found.books:
+        (co_authored if len(book.authors) > 1 else sole).append(book.id)
+    if sole:
+        # reviews go with the books by the foreign key cascade
+        outbox.record_change(
+            db, models.Review, outbox.DELETE, models.Review.book_id.in_(sole)
+        )
+        outbox.record_change(db, Book, outbox.DELETE, Book.id.in_(sole))
+        sync.record_deletion(db, models.Review, models.Review.book_id.in_(sole))
+        sync.record_deletion(db, Book, Book.id.in_(sole))
+        db.query(Book).filter(Book.id.in_(sole)).delete(synchronize_session=False)
+    if co_authored:
+        # the author disappears from books written with others
+        documents.touch_books(db, Book.id.in_(co_authored))
+    sync.record_deletion(db, models.Author, models.Author.id == author_id)
     author.delete()
+    if co_authored:
+        documents.render_documents(db, co_authored)
+    invalidation.notify(db, "authors", [author_id], "authors", "books")
     db.commit()
+    get_author_index().remove(author_id)
+    get_cache().invalidate("authors", "books")
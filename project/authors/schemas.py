@@ -1,3 +1,4 @@
+from typing import List
 from typing import Union
 
 from pydantic import BaseModel
@@ -42,3 +43,22 @@ class Author(AuthorBase):
         """config class for user"""
 
         orm_mode = True
+
+
+class AuthorSuggestion(BaseModel):
+    """
+    AuthorSuggestion schema to show autocompleted author with its id and full name
+    """
+
+    id: int
+    name: str
+
+
+class AuthorBatch(BaseModel):
+    """
+    AuthorBatch schema to show requested authors in the requested order and ids
+    of authors which were not found
+    """
+
+    items: List[Author]
+    missing: List[int]
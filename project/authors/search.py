@@ -0,0 +1,358 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from bisect import insort
+from functools import lru_cache
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from project import models
+from project.database import ReadSessionLocal
+from project.utils import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# other workers see authors changed elsewhere after the index gets this old
+AUTHOR_INDEX_MAX_AGE = float(os.environ.get("AUTHOR_INDEX_MAX_AGE", 60))
+# lowest trigram similarity of a search match, pg_trgm uses 0.3 for %
+AUTHOR_SEARCH_SIMILARITY = float(os.environ.get("AUTHOR_SEARCH_SIMILARITY", 0.3))
+
+
+def full_name(author: models.Author) -> str:
+    """joins first, middle and last name of author, skipping empty parts
+
+    Args:
+        author (models.Author)
+
+    Returns:
+        str
+    """
+    parts = (author.first_name, author.middle_name, author.last_name)
+    return " ".join(part for part in parts if part)
+
+
+def trigrams(word: str) -> Set[str]:
+    """gets trigrams of a word padded the way pg_trgm pads it
+
+    Args:
+        word (str): normalized word
+
+    Returns:
+        Set[str]
+    """
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(query: str, name: str) -> float:
+    """scores how well every query word matches some word of name,
+    words are compared by the share of common trigrams like pg_trgm does
+
+    Args:
+        query (str): search query
+        name (str): full name of author
+
+    Returns:
+        float: from 0 to 1
+    """
+    query_words = tokenize(query)
+    name_grams = [trigrams(word) for word in tokenize(name)]
+    if not query_words or not name_grams:
+        return 0.0
+    total = 0.0
+    for word in query_words:
+        grams = trigrams(word)
+        total += max(len(grams & other) / len(grams | other) for other in name_grams)
+    return total / len(query_words)
+
+
+class AuthorIndex:
+    """
+    AuthorIndex keeps words of author names sorted in memory for prefix lookups.
+    It is rebuilt from the table on startup and when older than max_age,
+    and updated in place by author writes of this process
+    """
+
+    def __init__(self, max_age: float = AUTHOR_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self.built_at: Union[float, None] = None
+        # (word, author id), sorted
+        self.words: List[Tuple[str, int]] = []
+        self.names: Dict[int, str] = {}
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        # writes made while a rebuild reads the table, replayed after it
+        self.pending: Union[List[Tuple[int, Union[str, None]]], None] = None
+
+    def _apply(self, author_id: int, name: Union[str, None]) -> None:
+        """replaces words of author, removes the author when name is None"""
+        old_name = self.names.pop(author_id, None)
+        if old_name is not None:
+            for word in set(tokenize(old_name)):
+                position = bisect_left(self.words, (word, author_id))
+                if self.words[position : position + 1] == [(word, author_id)]:
+                    del self.words[position]
+        if name is not None:
+            self.names[author_id] = name
+            for word in set(tokenize(name)):
+                insort(self.words, (word, author_id))
+
+    def _change(self, author_id: int, name: Union[str, None]) -> None:
+        with self.lock:
+            self._apply(author_id, name)
+            if self.pending is not None:
+                self.pending.append((author_id, name))
+
+    def add(self, author: models.Author) -> None:
+        """adds author or replaces its words after an update
+
+        Args:
+            author (models.Author)
+        """
+        self._change(author.id, full_name(author))
+
+    def remove(self, author_id: int) -> None:
+        """removes author
+
+        Args:
+            author_id (int): Primary key of Author model
+        """
+        self._change(author_id, None)
+
+    def _rebuild(self, db: Session) -> int:
+        with self.lock:
+            self.pending = []
+        try:
+            names = {
+                author.id: full_name(author)
+                for author in db.query(
+                    models.Author.id,
+                    models.Author.first_name,
+                    models.Author.middle_name,
+                    models.Author.last_name,
+                )
+            }
+            words = sorted(
+                (word, author_id)
+                for author_id, name in names.items()
+                for word in set(tokenize(name))
+            )
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+        with self.lock:
+            pending, self.pending = self.pending, None
+            self.words, self.names = words, names
+            for author_id, name in pending:
+                self._apply(author_id, name)
+            self.built_at = time.monotonic()
+        logger.info("indexed %d author names", len(names))
+        return len(names)
+
+    def rebuild(self, db: Session) -> int:
+        """reads all author names, lookups keep using the old words meanwhile
+
+        Args:
+            db (Session): Manages persistence operations for ORM-mapped objects
+
+        Returns:
+            int: number of indexed authors
+        """
+        with self.rebuild_lock:
+            return self._rebuild(db)
+
+    def ensure(self, db: Session) -> None:
+        """builds the index on first use and rebuilds it when it got old,
+        a stale index is rebuilt by one caller while others read the old one
+
+        Args:
+            db (Session): Manages persistence operations for ORM-mapped objects
+        """
+        if self.built_at is None:
+            # waits for a build already in progress, e.g. the startup one
+            with self.rebuild_lock:
+                if self.built_at is None:
+                    self._rebuild(db)
+        elif (
+            time.monotonic() - self.built_at > self.max_age
+            and not self.rebuild_lock.locked()
+        ):
+            # another request which got here meanwhile finds it rebuilt
+            with self.rebuild_lock:
+                if time.monotonic() - self.built_at > self.max_age:
+                    self._rebuild(db)
+
+    def complete(self, query: str, limit: int) -> List[Tuple[int, str]]:
+        """finds authors with a word starting with every word of query
+
+        Args:
+            query (str): beginning of a name, e.g. "j tolk"
+            limit (int): maximum number of authors
+
+        Returns:
+            List[Tuple[int, str]]: id and full name of authors,
+            ordered by the matched word
+        """
+        query_words = tokenize(query)
+        if not query_words:
+            return []
+        # the longest word is the most selective one
+        longest = max(query_words, key=len)
+        found = []
+        seen = set()
+        with self.lock:
+            position = bisect_left(self.words, (longest,))
+            while position < len(self.words) and len(found) < limit:
+                word, author_id = self.words[position]
+                if not word.startswith(longest):
+                    break
+                position += 1
+                if author_id in seen:
+                    continue
+                seen.add(author_id)
+                name = self.names[author_id]
+                name_words = tokenize(name)
+                if all(
+                    any(other.startswith(part) for other in name_words)
+                    for part in query_words
+                ):
+                    found.append((author_id, name))
+        return found
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """finds authors whose names are similar to query, tolerating typos
+
+        Args:
+            query (str): search query
+            limit (int): maximum number of authors
+
+        Returns:
+            List[int]: ids of authors, best match first
+        """
+        with self.lock:
+            names = list(self.names.items())
+        scored = sorted(
+            (-similarity(query, name), author_id) for author_id, name in names
+        )
+        return [
+            author_id
+            for score, author_id in scored[:limit]
+            if -score >= AUTHOR_SEARCH_SIMILARITY
+        ]
+
+
+@lru_cache(maxsize=None)
+def get_author_index() -> AuthorIndex:
+    """gets index of author names, created once per process
+
+    Returns:
+        AuthorIndex
+    """
+    return AuthorIndex()
+
+
+def warm_author_index() -> threading.Thread:
+    """builds the index in the background, so startup does not wait for it
+
+    Returns:
+        threading.Thread
+    """
+
+    def build() -> None:
+        db = ReadSessionLocal()
+        try:
+            get_author_index().ensure(db)
+        except Exception:  # pylint: disable=broad-except
+            # the first lookup builds it then
+            logger.exception("could not build author index")
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=build, name="author-index", daemon=True)
+    thread.start()
+    return thread
+
+
+def search_name():
+    """expression of the full name which the trigram index of authors is built on
+
+    Returns:
+        ColumnElement
+    """
+    return (
+        func.coalesce(models.Author.first_name, "")
+        + " "
+        + func.coalesce(models.Author.middle_name, "")
+        + " "
+        + func.coalesce(models.Author.last_name, "")
+    )
+
+
+def search_authors(db: Session, query: str, limit: int) -> List[models.Author]:
+    """finds authors by a fuzzy match of their full name, on postgres with
+    the pg_trgm index, elsewhere with trigrams of the in-memory index
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        query (str): search query, typos are tolerated
+        limit (int): maximum number of authors
+
+    Returns:
+        List[models.Author]: best match first
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # <% filters by this setting, a cutoff in WHERE could not use the index
+        db.execute(
+            text(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', :value, true)"
+            ),
+            {"value": str(AUTHOR_SEARCH_SIMILARITY)},
+        )
+        name = search_name()
+        return (
+            db.query(models.Author)
+            .filter(literal(query).op("<%")(name.self_group()))
+            .order_by(func.word_similarity(query, name).desc(), models.Author.id)
+            .limit(limit)
+            .all()
+        )
+
+    index = get_author_index()
+    index.ensure(db)
+    author_ids = index.search(query, limit)
+    if not author_ids:
+        return []
+    authors = {
+        author.id: author
+        for author in db.query(models.Author).filter(models.Author.id.in_(author_ids))
+    }
+    return [authors[author_id] for author_id in author_ids if author_id in authors]
+
+
+def autocomplete_authors(db: Session, query: str, limit: int) -> List[Tuple[int, str]]:
+    """completes author names from the in-memory index, the database is
+    only read when the index has to be built
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        query (str): beginning of a name
+        limit (int): maximum number of authors
+
+    Returns:
+        List[Tuple[int, str]]: id and full name of authors
+    """
+    index = get_author_index()
+    index.ensure(db)
+    return index.complete(query, limit)
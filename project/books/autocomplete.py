@@ -0,0 +1,669 @@
+import fcntl
+import hashlib
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+from typing import Union
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from project import models
+from project.database import DATABASE_URL
+from project.database import engine
+from project.utils import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# snapshot file shared by workers of one host, named after the database
+BOOK_TITLES_SNAPSHOT = os.environ.get(
+    "BOOK_TITLES_SNAPSHOT",
+    os.path.join(
+        tempfile.gettempdir(),
+        f"book_titles_{hashlib.sha1(DATABASE_URL.encode()).hexdigest()[:12]}.idx",
+    ),
+)
+# ratings and review counts in the snapshot are refreshed after this many seconds
+BOOK_TITLES_MAX_AGE = float(os.environ.get("BOOK_TITLES_MAX_AGE", 300))
+# book writes arriving within this many seconds share one snapshot rebuild
+BOOK_TITLES_REBUILD_DELAY = float(os.environ.get("BOOK_TITLES_REBUILD_DELAY", 1))
+# how often a worker looks for a snapshot written by another worker
+BOOK_TITLES_CHECK_SECONDS = 1.0
+
+# best books of prefixes matching more keys than this are stored in the snapshot
+HEAVY_PREFIX_KEYS = 256
+# most suggestions of one lookup
+TOP_BOOKS = 10
+# books with few reviews are ranked as if they had these extra reviews
+PRIOR_RATING = 3.0
+PRIOR_REVIEWS = 10
+
+MAGIC = b"BKT1"
+# magic, start of the build as unix time, numbers of books, keys and heavy prefixes
+HEADER = struct.Struct("<4sdIII")
+EMPTY = 0xFFFFFFFF
+KEY_SUFFIX = struct.Struct(">xI")
+# arrays of the snapshot in file order, titles and normalized titles follow them
+PARTS = (
+    "ids",
+    "scores",
+    "title_offsets",
+    "norm_offsets",
+    "key_positions",
+    "key_entries",
+    "heavy_keys",
+    "heavy_lengths",
+    "heavy_top",
+)
+
+
+def normalize_title(title: str) -> str:
+    """gets words of title, lowercased and without accents and punctuation
+
+    Args:
+        title (str): title of book or typed prefix
+
+    Returns:
+        str: words joined with single spaces
+    """
+    return " ".join(tokenize(title))
+
+
+def rank_score(rating: Union[float, None], reviews: int) -> float:
+    """weights rating by number of reviews, a book with a single five
+    does not outrank a book rated 4.8 by thousands
+
+    Args:
+        rating (Union[float, None]): average rating of book
+        reviews (int): number of reviews of book
+
+    Returns:
+        float
+    """
+    total = (rating or 0) * reviews + PRIOR_RATING * PRIOR_REVIEWS
+    return total / (reviews + PRIOR_REVIEWS)
+
+
+def matches(normalized_title: str, prefix: str) -> bool:
+    """checks if prefix starts the title or one of its words
+
+    Args:
+        normalized_title (str)
+        prefix (str): normalized prefix
+
+    Returns:
+        bool
+    """
+    return f" {normalized_title}".find(f" {prefix}") != -1
+
+
+def word_keys(norm: bytes, entry: int) -> List[bytes]:
+    """gets a key for every word start of a normalized title. A key is the rest
+    of the title from a word start, followed by a zero byte and the book
+    position, which sorts like (rest, position) in one object
+
+    Args:
+        norm (bytes): normalized title
+        entry (int): position of the book
+
+    Returns:
+        List[bytes]
+    """
+    suffix = KEY_SUFFIX.pack(entry)
+    keys = []
+    position = 0 if norm else -1
+    while position != -1:
+        keys.append(norm[position:] + suffix)
+        position = norm.find(b" ", position)
+        position = position + 1 if position != -1 else -1
+    return keys
+
+
+def rank_books(
+    books: Iterable[Tuple[int, str, Union[float, None], int]]
+) -> Tuple[Dict[str, array], bytearray, bytearray, List[bytes]]:
+    """stores books best ranked first, so the position of a book is its rank
+
+    Args:
+        books (Iterable[Tuple[int, str, Union[float, None], int]]): id, title,
+        rating and number of reviews of every book
+
+    Returns:
+        Tuple[Dict[str, array], bytearray, bytearray, List[bytes]]: parts with
+        ids, scores and offsets of titles, titles, normalized titles and
+        unsorted keys
+    """
+    ranked = sorted(
+        (-rank_score(rating, reviews), book_id, title)
+        for book_id, title, rating, reviews in books
+    )
+    parts = {
+        "ids": array("I"),
+        "scores": array("f"),
+        "title_offsets": array("I", [0]),
+        "norm_offsets": array("I", [0]),
+    }
+    titles, norms = bytearray(), bytearray()
+    keys: List[bytes] = []
+    for entry, (score, book_id, title) in enumerate(ranked):
+        parts["ids"].append(book_id)
+        parts["scores"].append(-score)
+        titles += title.encode()
+        parts["title_offsets"].append(len(titles))
+        norm = normalize_title(title).encode()
+        norms += norm
+        parts["norm_offsets"].append(len(norms))
+        keys.extend(word_keys(norm, entry))
+    return parts, titles, norms, keys
+
+
+def heavy_prefixes(
+    keys: List[bytes], key_entries: array, heavy_prefix_keys: int
+) -> Dict[str, array]:
+    """finds best books of prefixes matching more than heavy_prefix_keys keys
+
+    Args:
+        keys (List[bytes]): sorted keys
+        key_entries (array): book position of every key
+        heavy_prefix_keys (int)
+
+    Returns:
+        Dict[str, array]: parts with the first key and length of every heavy
+        prefix, sorted by prefix, and their TOP_BOOKS best books
+    """
+    heavy: List[Tuple[bytes, int, int, List[int]]] = []
+
+    def best_books(low: int, high: int, length: int) -> List[int]:
+        """gets best books of keys sharing their first length bytes and
+        stores best books of their heavy prefixes one byte longer, the best
+        of a heavy prefix come from its children, so every key is read once"""
+        candidates = []
+        i = low
+        while i < high:
+            if len(keys[i]) - KEY_SUFFIX.size <= length:
+                candidates.append(key_entries[i])
+                i += 1
+                continue
+            prefix = keys[i][: length + 1]
+            # utf-8 has no 0xff bytes, so the incremented prefix bounds the range
+            j = bisect_left(keys, prefix[:-1] + bytes([prefix[-1] + 1]), i, high)
+            if j - i > heavy_prefix_keys:
+                top = best_books(i, j, length + 1)
+                heavy.append((prefix, i, length + 1, top))
+                candidates.extend(top)
+            else:
+                candidates.extend(key_entries[i:j])
+            i = j
+        return sorted(set(candidates))[:TOP_BOOKS]
+
+    best_books(0, len(keys), 0)
+    heavy.sort()
+    parts = {
+        "heavy_keys": array("I", [key for _, key, _, _ in heavy]),
+        "heavy_lengths": array("I", [length for _, _, length, _ in heavy]),
+        "heavy_top": array("I"),
+    }
+    for _, _, _, top in heavy:
+        parts["heavy_top"].extend(top + [EMPTY] * (TOP_BOOKS - len(top)))
+    return parts
+
+
+def write_snapshot(
+    books: Iterable[Tuple[int, str, Union[float, None], int]],
+    path: str,
+    started_at: float,
+    heavy_prefix_keys: int = HEAVY_PREFIX_KEYS,
+) -> int:
+    """writes titles into a snapshot file, replacing it atomically.
+    Books are stored best ranked first, so the position of a book is its rank.
+    Every word start of a normalized title is a key, keys are sorted for
+    binary search of a prefix. Prefixes matching more than heavy_prefix_keys
+    keys get their TOP_BOOKS best books stored, so no lookup scans more keys.
+    Arrays are in native byte order, the file is only shared within a host
+
+    Args:
+        books (Iterable[Tuple[int, str, Union[float, None], int]]): id, title,
+        rating and number of reviews of every book
+        path (str): snapshot file
+        started_at (float): unix time when reading books started
+        heavy_prefix_keys (int, optional): Defaults to HEAVY_PREFIX_KEYS.
+
+    Returns:
+        int: number of books
+    """
+    parts, titles, norms, keys = rank_books(books)
+    keys.sort()
+    parts["key_positions"], parts["key_entries"] = array("I"), array("I")
+    for key in keys:
+        entry = KEY_SUFFIX.unpack_from(key, len(key) - KEY_SUFFIX.size)[0]
+        parts["key_entries"].append(entry)
+        parts["key_positions"].append(
+            parts["norm_offsets"][entry + 1] - len(key) + KEY_SUFFIX.size
+        )
+    parts.update(heavy_prefixes(keys, parts["key_entries"], heavy_prefix_keys))
+    del keys
+
+    counts = (len(parts["ids"]), len(parts["key_entries"]), len(parts["heavy_keys"]))
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, started_at, *counts))
+        for name in PARTS:
+            parts[name].tofile(file)
+        file.write(titles)
+        file.write(norms)
+    os.replace(temporary, path)
+    return counts[0]
+
+
+def build_snapshot(db: Session, path: str) -> int:
+    """reads titles, ratings and review counts of all books into a snapshot file
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        path (str): snapshot file
+
+    Returns:
+        int: number of books
+    """
+    started_at = time.time()
+    reviews = (
+        select(models.Review.book_id, func.count().label("reviews"))
+        .group_by(models.Review.book_id)
+        .subquery()
+    )
+    books = (
+        db.query(
+            models.Book.id,
+            models.Book.title,
+            models.Book.rating,
+            func.coalesce(reviews.c.reviews, 0),
+        )
+        .outerjoin(reviews, reviews.c.book_id == models.Book.id)
+        .yield_per(10_000)
+    )
+    return write_snapshot(books, path, started_at)
+
+
+def part_lengths(books: int, keys: int, heavy: int) -> Dict[str, int]:
+    """gets number of 4 byte items of every array of a snapshot
+
+    Args:
+        books (int): number of books
+        keys (int): number of keys
+        heavy (int): number of heavy prefixes
+
+    Returns:
+        Dict[str, int]: in file order
+    """
+    lengths = {
+        "ids": books,
+        "scores": books,
+        "title_offsets": books + 1,
+        "norm_offsets": books + 1,
+        "key_positions": keys,
+        "key_entries": keys,
+        "heavy_keys": heavy,
+        "heavy_lengths": heavy,
+        "heavy_top": heavy * TOP_BOOKS,
+    }
+    return {name: lengths[name] for name in PARTS}
+
+
+def search_titles(db: Session, prefix: str, limit: int) -> List[Tuple[int, str]]:
+    """finds books in the database while there is no snapshot, best rated first.
+    Titles are only lowercased, a prefix of a word after punctuation is missed
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        prefix (str): normalized prefix
+        limit (int)
+
+    Returns:
+        List[Tuple[int, str]]: id and title of books
+    """
+    title = func.lower(models.Book.title)
+    books = (
+        db.query(models.Book.id, models.Book.title)
+        .filter(
+            title.startswith(prefix, autoescape=True)
+            | title.contains(f" {prefix}", autoescape=True)
+        )
+        .order_by(func.coalesce(models.Book.rating, 0).desc(), models.Book.id)
+        .limit(limit)
+    )
+    return [(book.id, book.title) for book in books]
+
+
+def read_started_at(path: str) -> float:
+    """gets build time of the snapshot file, 0 when there is none
+
+    Args:
+        path (str): snapshot file
+
+    Returns:
+        float: unix time
+    """
+    try:
+        with open(path, "rb") as file:
+            magic, started_at, *_ = HEADER.unpack(file.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return 0.0
+    return started_at if magic == MAGIC else 0.0
+
+
+class TitleSnapshot:
+    """
+    TitleSnapshot reads a snapshot file through mmap, pages are shared
+    by all workers which mapped the same file
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        magic, self.started_at, books, keys, heavy = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot of book titles")
+        view = memoryview(self.buffer)
+        offset = HEADER.size
+        self.parts: Dict[str, memoryview] = {}
+        for name, count in part_lengths(books, keys, heavy).items():
+            self.parts[name] = view[offset : offset + 4 * count].cast(
+                "f" if name == "scores" else "I"
+            )
+            offset += 4 * count
+        self.titles_at = offset
+        self.norms_at = offset + self.parts["title_offsets"][books]
+
+    def key(self, index: int, length: int) -> bytes:
+        """gets first length bytes of a key"""
+        parts = self.parts
+        entry = parts["key_entries"][index]
+        start = self.norms_at + parts["key_positions"][index]
+        end = self.norms_at + parts["norm_offsets"][entry + 1]
+        return self.buffer[start : min(end, start + length)]
+
+    def bound(self, prefix: bytes, upper: bool) -> int:
+        """gets index of the first key starting with prefix,
+        or of the first key after them when upper"""
+        low, high = 0, len(self.parts["key_entries"])
+        while low < high:
+            middle = (low + high) // 2
+            key = self.key(middle, len(prefix))
+            if key < prefix or (upper and key == prefix):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def heavy_top_entries(self, prefix: bytes) -> Union[List[int], None]:
+        """gets stored best books of prefix, None when prefix is not heavy"""
+        heavy_keys, heavy_lengths = (
+            self.parts["heavy_keys"],
+            self.parts["heavy_lengths"],
+        )
+        low, high = 0, len(heavy_keys)
+        while low < high:
+            middle = (low + high) // 2
+            key = self.key(heavy_keys[middle], heavy_lengths[middle])
+            if key < prefix:
+                low = middle + 1
+            elif key > prefix:
+                high = middle
+            else:
+                top = self.parts["heavy_top"][
+                    middle * TOP_BOOKS : (middle + 1) * TOP_BOOKS
+                ]
+                return [entry for entry in top if entry != EMPTY]
+        return None
+
+    def entries(self, prefix: bytes, limit: int) -> List[int]:
+        """gets positions of best ranked books matching prefix
+
+        Args:
+            prefix (bytes): normalized prefix
+            limit (int): at most TOP_BOOKS are found for a heavy prefix
+
+        Returns:
+            List[int]: best first
+        """
+        top = self.heavy_top_entries(prefix)
+        if top is not None:
+            return top[:limit]
+        low, high = self.bound(prefix, False), self.bound(prefix, True)
+        return heapq.nsmallest(limit, set(self.parts["key_entries"][low:high]))
+
+    def book(self, entry: int) -> Tuple[int, str, float]:
+        """gets id, title and score of the book at a position"""
+        title_offsets = self.parts["title_offsets"]
+        start = self.titles_at + title_offsets[entry]
+        end = self.titles_at + title_offsets[entry + 1]
+        return (
+            self.parts["ids"][entry],
+            self.buffer[start:end].decode(),
+            self.parts["scores"][entry],
+        )
+
+
+class TitleIndex:
+    """
+    TitleIndex completes book titles from the newest snapshot file. Book writes
+    of this process are kept in an overlay until a snapshot includes them,
+    a rebuild is scheduled after every write and when the snapshot gets old
+    """
+
+    def __init__(self, path: str = BOOK_TITLES_SNAPSHOT):
+        self.path = path
+        self.snapshot: Union[TitleSnapshot, None] = None
+        self.checked_at = 0.0
+        # book id, time of the write and normalized title, title and score,
+        # None for a deleted book
+        self.overlay: Dict[int, Tuple[float, Union[Tuple[str, str, float], None]]] = {}
+        self.lock = threading.Lock()
+        # database and unix time the next snapshot has to be newer than
+        self.pending: Union[Tuple[Engine, float], None] = None
+        self.thread: Union[threading.Thread, None] = None
+
+    def load(self) -> bool:
+        """maps the snapshot file, if it is there
+
+        Returns:
+            bool: true if a snapshot is loaded
+        """
+        try:
+            snapshot = TitleSnapshot(self.path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return False
+        with self.lock:
+            self.snapshot = snapshot
+            self.overlay = {
+                book_id: change
+                for book_id, change in self.overlay.items()
+                if change[0] > snapshot.started_at
+            }
+        return True
+
+    def rebuild(self, bind: Union[Engine, Connection], needed_after: float) -> None:
+        """builds a snapshot unless another worker built one which started
+        after needed_after, workers of the host take turns on a file lock
+
+        Args:
+            bind (Union[Engine, Connection]): database to read books from
+            needed_after (float): unix time the snapshot has to be newer than
+        """
+        if isinstance(bind, Connection):
+            bind = bind.engine
+        with open(f"{self.path}.lock", "w", encoding="utf8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if read_started_at(self.path) <= needed_after:
+                # binds of writing sessions would hold the write lock of SQLite
+                reader = bind.execution_options(sqlite_begin="DEFERRED")
+                with Session(bind=reader) as db:
+                    count = build_snapshot(db, self.path)
+                logger.info("wrote %d book titles to %s", count, self.path)
+        self.load()
+
+    def schedule(self, bind: Union[Engine, Connection], needed_after: float) -> None:
+        """rebuilds the snapshot in the background after BOOK_TITLES_REBUILD_DELAY
+
+        Args:
+            bind (Union[Engine, Connection]): database to read books from
+            needed_after (float): unix time the snapshot has to be newer than
+        """
+        if isinstance(bind, Connection):
+            bind = bind.engine
+        with self.lock:
+            if self.pending is not None:
+                needed_after = max(self.pending[1], needed_after)
+            self.pending = (bind, needed_after)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="book-titles", daemon=True
+                )
+                self.thread.start()
+
+    def run(self) -> None:
+        """rebuilds snapshots while they are needed"""
+        while True:
+            time.sleep(BOOK_TITLES_REBUILD_DELAY)
+            with self.lock:
+                pending, self.pending = self.pending, None
+                if pending is None:
+                    self.thread = None
+                    return
+            try:
+                self.rebuild(*pending)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("could not rebuild book titles")
+
+    def refresh(self, bind: Union[Engine, Connection]) -> None:
+        """picks up a snapshot written by another worker and schedules a build
+        of a missing or old one, requests do not wait for it
+
+        Args:
+            bind (Union[Engine, Connection]): database to read books from
+        """
+        now = time.time()
+        if self.snapshot is not None and now - self.checked_at < (
+            BOOK_TITLES_CHECK_SECONDS
+        ):
+            return
+        self.checked_at = now
+        try:
+            stat = os.stat(self.path)
+            identity = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            identity = None
+        if identity is not None and (
+            self.snapshot is None or identity != self.snapshot.identity
+        ):
+            self.load()
+        if self.snapshot is None:
+            self.schedule(bind, 0.0)
+        elif self.snapshot.started_at < now - BOOK_TITLES_MAX_AGE:
+            self.schedule(bind, now - BOOK_TITLES_MAX_AGE)
+
+    def changed(self, db: Session, book: models.Book) -> None:
+        """adds a created or updated book to the overlay, call after commit.
+        Its review count is not known here, it is ranked as unreviewed
+        until the next snapshot
+
+        Args:
+            db (Session): session which wrote the book
+            book (models.Book)
+        """
+        entry = (normalize_title(book.title), book.title, rank_score(book.rating, 0))
+        with self.lock:
+            self.overlay[book.id] = (time.time(), entry)
+        self.schedule(db.get_bind(), time.time())
+
+    def removed(self, db: Session, book_id: int) -> None:
+        """hides a deleted book, call after commit
+
+        Args:
+            db (Session): session which deleted the book
+            book_id (int): Primary key of Book model
+        """
+        with self.lock:
+            self.overlay[book_id] = (time.time(), None)
+        self.schedule(db.get_bind(), time.time())
+
+    def complete(self, db: Session, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        """finds best ranked books whose title or one of its words starts with
+        prefix, the database is only read while there is no snapshot yet
+
+        Args:
+            db (Session): Manages persistence operations for ORM-mapped objects
+            prefix (str): typed beginning of a title
+            limit (int): at most TOP_BOOKS
+
+        Returns:
+            List[Tuple[int, str]]: id and title of books
+        """
+        self.refresh(db.get_bind())
+        normalized = normalize_title(prefix)
+        if not normalized:
+            return []
+        with self.lock:
+            snapshot, overlay = self.snapshot, dict(self.overlay)
+        if snapshot is None:
+            return search_titles(db, normalized, limit)
+        found = []
+        # books of the overlay may take some of the places
+        for entry in snapshot.entries(normalized.encode(), limit + len(overlay)):
+            book_id, title, score = snapshot.book(entry)
+            if book_id not in overlay:
+                found.append((-score, book_id, title))
+        for book_id, (_, book) in overlay.items():
+            if book is not None and matches(book[0], normalized):
+                found.append((-book[2], book_id, book[1]))
+        found.sort()
+        return [(book_id, title) for _, book_id, title in found[:limit]]
+
+
+@lru_cache(maxsize=None)
+def get_title_index() -> TitleIndex:
+    """gets index of book titles, created once per process
+
+    Returns:
+        TitleIndex
+    """
+    return TitleIndex()
+
+
+def warm_title_index() -> threading.Thread:
+    """maps or builds the snapshot in the background, so startup does not wait
+
+    Returns:
+        threading.Thread
+    """
+
+    def build() -> None:
+        index = get_title_index()
+        try:
+            if not index.load():
+                index.rebuild(engine, 0.0)
+        except Exception:  # pylint: disable=broad-except
+            # lookups read the database and schedule it then
+            logger.exception("could not load book titles")
+
+    thread = threading.Thread(target=build, name="book-titles-warmup", daemon=True)
+    thread.start()
+    return thread
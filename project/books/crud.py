@@ -1,15 +1,33 @@
+from typing import Dict
 from typing import List
+from typing import Tuple
 from typing import Union
 
 from fastapi import HTTPException
 from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import case
+from sqlalchemy import literal
+from sqlalchemy.orm import Query
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
+from project import invalidation
 from project import models
+from project import outbox
+from project import sync
+from project.books import documents
 from project.books import schemas
+from project.books.autocomplete import get_title_index
+from project.books.documents import book_relationships
+from project.cache import get_cache
 from project.models import Author
 from project.models import Review
+from project.pagination import count_rows
+from project.utils import order_by_ids
+
+
+RECOMMENDATIONS_TTL = 60
 
 
 def get_book_by_id(db: Session, book_id: int) -> models.Book:
@@ -34,6 +52,29 @@ def get_book_by_id(db: Session, book_id: int) -> models.Book:
     return book
 
 
+def get_books_by_ids(
+    db: Session, book_ids: List[int]
+) -> Tuple[List[models.Book], List[int]]:
+    """gets instances of Book model by a list of ids with one IN query,
+    authors and reviews are loaded for all of them in one query each
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (List[int]): Primary keys of Book model
+
+    Returns:
+        Tuple[List[models.Book], List[int]]: books in the requested order
+        and ids of missing books
+    """
+    books = (
+        db.query(models.Book)
+        .filter(models.Book.id.in_(book_ids))
+        .options(*book_relationships())
+        .all()
+    )
+    return order_by_ids(books, book_ids)
+
+
 # https://sqlmodel.tiangolo.com/tutorial/fastapi/update/
 def update_book(
     db: Session, book_id: int, updated_book: schemas.BookUpdate
@@ -52,25 +93,30 @@ def update_book(
         models.Book: returns updated instance of Book model
     """
     book = get_book_by_id(db=db, book_id=book_id)
-
-    for key, value in updated_book.dict(exclude_unset=True).items():
-        if key == "author_id":
-            book_authors = db.query(models.Book).get(book_id)
-            book_authors.authors.clear()
-            db.add(book_authors)
-            db.commit()
-            authors = db.query(Author).filter(Author.id.in_(value))
-            if authors.count() == len(value):
-                book.authors.extend(authors)
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="Authors is not found"
-                )
+    values = updated_book.dict(exclude_unset=True)
+    # authors are checked before anything changes, a missing one leaves the
+    # book as it is
+    if "author_id" in values:
+        authors = db.query(Author).filter(Author.id.in_(values["author_id"])).all()
+        if len(authors) != len(values["author_id"]):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Authors is not found"
+            )
+        book.authors = authors
+
+    for key, value in values.items():
         setattr(book, key, value)
 
+    book.version = models.Book.version + 1
     db.add(book)
+    db.flush()
+    outbox.record_change(db, models.Book, outbox.UPDATE, models.Book.id == book_id)
+    documents.render_documents(db, [book_id])
+    invalidation.notify(db, "books", [book_id], "books")
     db.commit()
+    get_cache().invalidate("books")
     db.refresh(book)
+    get_title_index().changed(db, book)
     return book
 
 
@@ -84,13 +130,42 @@ def get_books_by_author_id(db: Session, author_id: int) -> List[models.Book]:
     Returns:
         List[models.Book]: returns list of instances of Book model
     """
-    author = db.query(Author).filter(Author.id == author_id).first()
+    author = db.query(Author.id).filter(Author.id == author_id).first()
     if not author:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Author with id {author_id} is not found",
         )
-    return author.books
+    return (
+        db.query(models.Book)
+        .options(*book_relationships())
+        .filter(models.Book.authors.any(Author.id == author_id))
+        .order_by(models.Book.id)
+        .all()
+    )
+
+
+def filter_books(
+    db: Session,
+    genre: Union[schemas.BookGenre, None],
+    type: Union[schemas.BookType, None],
+) -> Query:
+    """builds query of books with filters
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        genre (Union[schemas.BookGenre, None]): filter by genre
+        type (Union[schemas.BookType, None]): filter by type
+
+    Returns:
+        Query: query of Book model
+    """
+    books = db.query(models.Book)
+    if genre:
+        books = books.filter(models.Book.genre == genre)
+    if type:
+        books = books.filter(models.Book.type == type)
+    return books
 
 
 def get_books(
@@ -112,12 +187,104 @@ def get_books(
     Returns:
         List[models.Book]: returns list of instances of Book model
     """
-    books = db.query(models.Book).order_by(models.Book.id)
-    if genre:
-        books = books.filter(models.Book.genre == genre)
-    if type:
-        books = books.filter(models.Book.type == type)
-    return books.offset(offset).limit(limit).all()
+    return (
+        filter_books(db=db, genre=genre, type=type)
+        .options(*book_relationships())
+        .order_by(models.Book.id)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+
+def count_books(
+    db: Session,
+    genre: Union[schemas.BookGenre, None],
+    type: Union[schemas.BookType, None],
+) -> Tuple[int, bool]:
+    """counts books with filters, approximately for broad filters
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        genre (Union[schemas.BookGenre, None]): filter by genre
+        type (Union[schemas.BookType, None]): filter by type
+
+    Returns:
+        Tuple[int, bool]: number of books and true if the number is exact
+    """
+    return count_rows(db, filter_books(db=db, genre=genre, type=type), "books")
+
+
+def facet_columns() -> dict:
+    """expressions books are counted by in facets, ratings are bucketed
+    by their whole part and years by decade
+
+    Returns:
+        dict: facet name and expression
+    """
+    rating = models.Book.rating
+    return {
+        "genre": models.Book.genre,
+        "type": models.Book.type,
+        "rating": case(
+            *[(rating >= bucket, bucket) for bucket in range(5, 0, -1)], else_=0
+        ),
+        "decade": models.Book.year - models.Book.year % 10,
+    }
+
+
+def count_facets(
+    db: Session,
+    genre: Union[schemas.BookGenre, None],
+    type: Union[schemas.BookType, None],
+) -> dict:
+    """counts books with filters per genre, type, rating and decade in one
+    query, on postgres with GROUPING SETS, which reads books once, elsewhere
+    with UNION ALL of one GROUP BY per facet. Counts without filters
+    are cached until the next write to books or ratings
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        genre (Union[schemas.BookGenre, None]): filter by genre
+        type (Union[schemas.BookType, None]): filter by type
+
+    Returns:
+        dict: number of books per value of every facet and their total
+    """
+
+    def query_facets() -> dict:
+        books = filter_books(db=db, genre=genre, type=type)
+        columns = facet_columns()
+        if db.get_bind().dialect.name == "postgresql":
+            facet = case(
+                *[
+                    (func.grouping(column) == 0, name)
+                    for name, column in columns.items()
+                ]
+            )
+            grouped = (
+                books.with_entities(facet, *columns.values(), func.count())
+                .group_by(func.grouping_sets(*columns.values()))
+                .all()
+            )
+            names = list(columns)
+            rows = [(row[0], row[1 + names.index(row[0])], row[-1]) for row in grouped]
+        else:
+            parts = [
+                books.with_entities(literal(name), column, func.count()).group_by(
+                    column
+                )
+                for name, column in columns.items()
+            ]
+            rows = parts[0].union_all(*parts[1:]).all()
+        facets: Dict[str, Dict[str, int]] = {name: {} for name in columns}
+        for name, value, count in sorted(rows, key=lambda row: (row[0], row[1])):
+            facets[name][str(value)] = count
+        return {"total": sum(facets["genre"].values()), **facets}
+
+    if genre or type:
+        return query_facets()
+    return get_cache().get_or_set("books", "facets", query_facets)
 
 
 def get_books_by_rating(
@@ -139,7 +306,7 @@ def get_books_by_rating(
     Returns:
         List[models.Book]: returns list of instances of Book model with specific rating
     """
-    books = db.query(models.Book)
+    books = db.query(models.Book).options(*book_relationships())
     if genre:
         books.filter(models.Book.genre == genre)
     books = (
@@ -152,10 +319,9 @@ def get_books_by_rating(
     return books
 
 
-def get_recommendations(
-    db: Session, genre: str, offset: int, limit: int
-) -> List[models.Book]:
-    """gets list of instances of Book model from database with specific genre
+def get_recommendations(db: Session, genre: str, offset: int, limit: int) -> List[dict]:
+    """gets list of books from database with specific genre, cached until
+    the next write to books
 
     Args:
         db (Session): Manages persistence operations for ORM-mapped objects
@@ -164,24 +330,34 @@ def get_recommendations(
         limit (int): Query parameter, the number of items returned from a query
 
     Returns:
-        List[models.Book]: returns list of instances of Book model with pregerred genre
+        List[dict]: returns list of serialized books with pregerred genre
     """
-    avg_rating = (
-        db.query(func.avg(models.Book.rating))
-        .filter(models.Book.genre == genre)
-        .group_by(models.Book.genre)
-        .scalar_subquery()
-    )
-    books = (
-        db.query(models.Book)
-        .filter(models.Book.genre == genre)
-        .where(models.Book.rating >= avg_rating)
-        .order_by(models.Book.rating.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+
+    def query_recommendations() -> List[dict]:
+        avg_rating = (
+            db.query(func.avg(models.Book.rating))
+            .filter(models.Book.genre == genre)
+            .group_by(models.Book.genre)
+            .scalar_subquery()
+        )
+        books = (
+            db.query(models.Book)
+            .options(*book_relationships())
+            .filter(models.Book.genre == genre)
+            .where(models.Book.rating >= avg_rating)
+            .order_by(models.Book.rating.desc())
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+        return jsonable_encoder([schemas.Book.from_orm(book) for book in books])
+
+    return get_cache().get_or_set(
+        "books",
+        f"recommendations:{genre}:{offset}:{limit}",
+        query_recommendations,
+        ttl=RECOMMENDATIONS_TTL,
     )
-    return books
 
 
 # https://stackoverflow.com/questions/68394091/fastapi-sqlalchemy-pydantic-%E2%86%92-how-to-process-many-to-many-relations
@@ -214,8 +390,14 @@ def create_book(db: Session, book: schemas.BookCreate) -> models.Book:
         )
     new_book.authors.extend(authors)
     db.add(new_book)
+    db.flush()
+    outbox.record_change(db, models.Book, outbox.CREATE, models.Book.id == new_book.id)
+    documents.render_documents(db, [new_book.id])
+    invalidation.notify(db, "books", [new_book.id], "books")
     db.commit()
+    get_cache().invalidate("books")
     db.refresh(new_book)
+    get_title_index().changed(db, new_book)
     return new_book
 
 
@@ -238,20 +420,16 @@ def delete_book(db: Session, book_id: int) -> None:
     # remove authors from a book
     book_authors = db.query(models.Book).get(book_id)
     book_authors.authors.clear()
-    db.add(book_authors)
-    db.commit()
+    db.flush()
     # delete reviews
-    book_reviews = (
-        db.query(models.Book)
-        .join(models.Book.reviews)
-        .filter(models.Book.id == book_id)
-        .first()
-    )
-    if book_reviews:
-        for review in book_reviews.reviews:
-            r = db.query(Review).filter(Review.id == review.id)
-            r.delete()
-            db.commit()
+    outbox.record_change(db, Review, outbox.DELETE, Review.book_id == book_id)
+    sync.record_deletion(db, Review, Review.book_id == book_id)
+    db.query(Review).filter(Review.book_id == book_id).delete(synchronize_session=False)
     # remove book
+    outbox.record_change(db, models.Book, outbox.DELETE, models.Book.id == book_id)
+    sync.record_deletion(db, models.Book, models.Book.id == book_id)
     book.delete()
+    invalidation.notify(db, "books", [book_id], "books")
     db.commit()
+    get_cache().invalidate("books")
+    get_title_index().removed(db, book_id)
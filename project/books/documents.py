@@ -0,0 +1,177 @@
+from typing import List
+from typing import Union
+
+from fastapi import HTTPException
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_
+from sqlalchemy import delete
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from project import models
+from project import outbox
+from project.books import schemas
+from project.cache import dumps
+
+
+def book_relationships() -> tuple:
+    """loader options which fetch authors and reviews of a list of books
+    in one query per relationship instead of one query per book
+
+    Returns:
+        tuple: loader options for Query.options
+    """
+    return (selectinload(models.Book.authors), selectinload(models.Book.reviews))
+
+
+def render_book(book: models.Book) -> bytes:
+    """serializes book the way GET /books/{book_id} returns it
+
+    Args:
+        book (models.Book): book with authors and reviews
+
+    Returns:
+        bytes: JSON document
+    """
+    return dumps(jsonable_encoder(schemas.Book.from_orm(book)))
+
+
+def save_documents(db: Session, documents: List[dict]) -> None:
+    """inserts or replaces documents in one statement, commit is left to caller
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        documents (List[dict]): book_id, version and body of every document
+    """
+    if not documents:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(models.BookDocument).values(documents)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[models.BookDocument.book_id],
+            set_={
+                "version": statement.excluded.version,
+                "body": statement.excluded.body,
+            },
+        )
+    )
+
+
+def render_documents(db: Session, book_ids: Union[List[int], Select]) -> None:
+    """regenerates documents of books in the transaction of their change,
+    call it after the change is flushed. Documents of books whose reviews
+    changed are rendered by the worker, see project.jobs.BOOK_DOCUMENT.
+    Reads never store documents
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (Union[List[int], Select]): Primary keys of Book model
+        or a select of them
+    """
+    books = (
+        db.query(models.Book)
+        .filter(models.Book.id.in_(book_ids))
+        .options(*book_relationships())
+        # rows changed by UPDATE statements are stale in the session
+        .populate_existing()
+        .all()
+    )
+    save_documents(
+        db,
+        [
+            {"book_id": book.id, "version": book.version, "body": render_book(book)}
+            for book in books
+        ],
+    )
+
+
+def touch_books(db: Session, *criteria) -> None:
+    """bumps version of books matching criteria, for changes of their authors
+    or reviews which are embedded in their documents. Call it before rows
+    are deleted and render_documents after the change is flushed
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        criteria: filters of changed books, e.g. Book.id.in_(...)
+    """
+    db.execute(
+        update(models.Book)
+        .where(*criteria)
+        .values(version=models.Book.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    outbox.record_change(db, models.Book, outbox.UPDATE, *criteria)
+
+
+def drop_documents(db: Session, book_ids: List[int]) -> None:
+    """removes documents of books whose reviews changed while their rating,
+    which bumps the version, is recomputed later by the worker
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (List[int]): Primary keys of Book model
+    """
+    db.execute(
+        delete(models.BookDocument).where(models.BookDocument.book_id.in_(book_ids))
+    )
+
+
+def get_document(db: Session, book_id: int) -> Union[bytes, None]:
+    """gets document of book if it was rendered at the current version
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_id (int): Primary key of Book model
+
+    Returns:
+        Union[bytes, None]
+    """
+    return (
+        db.query(models.BookDocument.body)
+        .join(
+            models.Book,
+            and_(
+                models.Book.id == models.BookDocument.book_id,
+                models.Book.version == models.BookDocument.version,
+            ),
+        )
+        .filter(models.BookDocument.book_id == book_id)
+        .scalar()
+    )
+
+
+def get_book_document(db: Session, book_id: int) -> bytes:
+    """gets JSON document of book with one query, a missing or outdated
+    document is rendered without storing it, so reads never write
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_id (int): Primary key of Book model
+
+    Raises:
+        HTTPException: Handles no value
+
+    Returns:
+        bytes
+    """
+    body = get_document(db, book_id)
+    if body is not None:
+        return body
+    book = (
+        db.query(models.Book)
+        .filter(models.Book.id == book_id)
+        .options(*book_relationships())
+        .first()
+    )
+    if not book:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Book with id {book_id} is not found",
+        )
+    return render_book(book)
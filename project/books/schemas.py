@@ -1,3 +1,4 @@
+from typing import Dict
 from typing import List
 from typing import Union
 
@@ -103,3 +104,34 @@ class Book(BookBase):
         """config class for book"""
 
         orm_mode = True
+
+
+class BookFacets(BaseModel):
+    """
+    BookFacets schema to show number of books per genre, type, rating and decade
+    """
+
+    total: int
+    genre: Dict[str, int]
+    type: Dict[str, int]
+    rating: Dict[str, int]
+    decade: Dict[str, int]
+
+
+class BookSuggestion(BaseModel):
+    """
+    BookSuggestion schema to show autocompleted book with its id and title
+    """
+
+    id: int
+    title: str
+
+
+class BookBatch(BaseModel):
+    """
+    BookBatch schema to show requested books in the requested order and ids
+    of books which were not found
+    """
+
+    items: List[Book]
+    missing: List[int]
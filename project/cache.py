@@ -0,0 +1,318 @@
+import json
+import os
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+# memory:// for a cache per process, redis://host:port/db for a shared one
+CACHE_URL = os.environ.get("CACHE_URL", "memory://")
+CACHE_PREFIX = os.environ.get("CACHE_PREFIX", "edvantis")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10_000))
+CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", 300))
+
+
+def dumps(value: Any) -> bytes:
+    """serializes value without pickle
+
+    Args:
+        value (Any): json compatible value
+
+    Returns:
+        bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    """deserializes value created by dumps
+
+    Args:
+        data (bytes)
+
+    Returns:
+        Any
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Cache(ABC):
+    """
+    Cache stores json compatible values under namespaced keys. Every namespace
+    has a version, invalidating the namespace bumps the version, so all of its
+    entries become stale at once without deleting them one by one
+    """
+
+    def __init__(
+        self, prefix: str = CACHE_PREFIX, default_ttl: int = CACHE_DEFAULT_TTL
+    ):
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    @abstractmethod
+    def get_many_raw(self, keys: List[str]) -> List[Optional[bytes]]:
+        """gets raw values of keys, None for missing ones"""
+
+    @abstractmethod
+    def set_raw(self, key: str, data: bytes, ttl: Optional[int]) -> None:
+        """stores raw value with time to live in seconds"""
+
+    @abstractmethod
+    def delete_raw(self, key: str) -> None:
+        """removes raw value"""
+
+    @abstractmethod
+    def incr_raw(self, key: str) -> int:
+        """atomically increments integer value and returns the new one"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """removes all entries"""
+
+    def version_key(self, namespace: str) -> str:
+        """gets key of the namespace version"""
+        return f"{self.prefix}:{namespace}:version"
+
+    def entry_key(self, namespace: str, key: str) -> str:
+        """gets key of a namespaced entry"""
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def lookup(self, namespace: str, key: str) -> Tuple[int, Optional[Any]]:
+        """gets current namespace version and the entry, if it is not stale
+
+        Args:
+            namespace (str): e.g. "books"
+            key (str): key inside the namespace
+
+        Returns:
+            Tuple[int, Optional[Any]]: namespace version and value or None
+        """
+        version, entry = self.get_many_raw(
+            [self.version_key(namespace), self.entry_key(namespace, key)]
+        )
+        version = int(version or 0)
+        if entry is None:
+            return version, None
+        entry_version, value = loads(entry)
+        if entry_version != version:
+            return version, None
+        return version, value
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """gets value, None if missing, expired or invalidated
+
+        Args:
+            namespace (str): e.g. "books"
+            key (str): key inside the namespace
+
+        Returns:
+            Optional[Any]
+        """
+        return self.lookup(namespace, key)[1]
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        *,
+        ttl: Optional[int] = None,
+        version: Optional[int] = None,
+    ) -> None:
+        """stores value
+
+        Args:
+            namespace (str): e.g. "books"
+            key (str): key inside the namespace
+            value (Any): json compatible value
+            ttl (Optional[int], optional): seconds to live. Defaults to default_ttl.
+            version (Optional[int], optional): namespace version the value was
+            computed at. Defaults to the current version.
+        """
+        if version is None:
+            version = int(self.get_many_raw([self.version_key(namespace)])[0] or 0)
+        self.set_raw(
+            self.entry_key(namespace, key),
+            dumps([version, value]),
+            self.default_ttl if ttl is None else ttl,
+        )
+
+    def get_or_set(
+        self,
+        namespace: str,
+        key: str,
+        factory: Callable[[], Any],
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """gets value or computes and stores it. The value is stored with the
+        version read before computing, so a write which invalidates the namespace
+        meanwhile makes the stored value stale right away
+
+        Args:
+            namespace (str): e.g. "books"
+            key (str): key inside the namespace
+            factory (Callable[[], Any]): computes json compatible value
+            ttl (Optional[int], optional): seconds to live. Defaults to default_ttl.
+
+        Returns:
+            Any
+        """
+        version, value = self.lookup(namespace, key)
+        if value is None:
+            value = factory()
+            self.set(namespace, key, value, ttl=ttl, version=version)
+        return value
+
+    def delete(self, namespace: str, key: str) -> None:
+        """removes value
+
+        Args:
+            namespace (str): e.g. "books"
+            key (str): key inside the namespace
+        """
+        self.delete_raw(self.entry_key(namespace, key))
+
+    def invalidate(self, *namespaces: str) -> None:
+        """makes all entries of namespaces stale, called by CRUD modules after writes
+
+        Args:
+            namespaces (str): e.g. "books", "reviews"
+        """
+        for namespace in namespaces:
+            self.incr_raw(self.version_key(namespace))
+
+
+class LocalCache(Cache):
+    """
+    LocalCache keeps entries in process memory, least recently used ones are
+    evicted when max_entries is reached
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+        # called before every lookup, set by project.invalidation to check
+        # the cache against the database now and then
+        self.version_check: Optional[Callable[[], None]] = None
+
+    def lookup(self, namespace: str, key: str) -> Tuple[int, Optional[Any]]:
+        # read once, the listener may unset it meanwhile. pylint infers
+        # only the None set in __init__
+        version_check = self.version_check
+        if version_check is not None:
+            version_check()  # pylint: disable=not-callable
+        return super().lookup(namespace, key)
+
+    def get_many_raw(self, keys: List[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        values = []
+        with self.lock:
+            for key in keys:
+                if key in self.versions:
+                    values.append(str(self.versions[key]).encode())
+                    continue
+                entry = self.entries.get(key)
+                if entry is None:
+                    values.append(None)
+                elif entry[0] is not None and entry[0] <= now:
+                    del self.entries[key]
+                    values.append(None)
+                else:
+                    self.entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set_raw(self, key: str, data: bytes, ttl: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (expires_at, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_raw(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def incr_raw(self, key: str) -> int:
+        # versions are never evicted, otherwise stale entries could come back
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+            return self.versions[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+
+
+class RedisCache(Cache):
+    """
+    RedisCache keeps entries in a server speaking the Redis protocol,
+    shared by all workers
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCache":
+        """creates cache connected to url, e.g. redis://localhost:6379/0"""
+        if redis is None:
+            raise RuntimeError("redis package is required for CACHE_URL " + url)
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get_many_raw(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.client.mget(keys)
+
+    def set_raw(self, key: str, data: bytes, ttl: Optional[int]) -> None:
+        self.client.set(key, data, ex=ttl or None)
+
+    def delete_raw(self, key: str) -> None:
+        self.client.delete(key)
+
+    def incr_raw(self, key: str) -> int:
+        return self.client.incr(key)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+@lru_cache(maxsize=None)
+def get_cache() -> Cache:
+    """gets cache configured by CACHE_URL, created once per process
+
+    Returns:
+        Cache
+    """
+    if CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache.from_url(CACHE_URL)
+    return LocalCache()
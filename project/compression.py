@@ -0,0 +1,384 @@
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict
+from typing import List
+from typing import Union
+
+from starlette.datastructures import Headers
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+# smaller bodies fit in a packet anyway and are sent as they are
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+# media types, a trailing slash allows the whole type, e.g. text/
+COMPRESSIBLE_TYPES = tuple(
+    os.environ.get(
+        "COMPRESSIBLE_TYPES",
+        "application/json,application/javascript,application/xml,image/svg+xml,text/",
+    ).split(",")
+)
+# levels for responses compressed on every request, higher ones cost
+# much more CPU for a few percent of JSON
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", 3))
+# totals per content coding are logged at most this often, 0 turns it off
+COMPRESSION_STATS_LOG_SECONDS = float(
+    os.environ.get("COMPRESSION_STATS_LOG_SECONDS", 300)
+)
+
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+
+
+def available_encodings() -> List[str]:
+    """gets content codings the server can produce, preferred first
+
+    Returns:
+        List[str]
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    if brotli is not None:
+        encodings.append(BROTLI)
+    encodings.append(GZIP)
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> Union[str, None]:
+    """picks the content coding with the highest weight in Accept-Encoding,
+    ties go to the better compression
+
+    Args:
+        accept_encoding (str): value of the request header, e.g. "gzip, br;q=0.9"
+
+    Returns:
+        Union[str, None]: None when the body has to be sent as it is
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, *params = item.split(";")
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name.strip():
+            weights[name.strip()] = weight
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    """checks that a response may be compressed by its headers
+
+    Args:
+        headers (Headers): response headers
+
+    Returns:
+        bool
+    """
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return bool(media_type) and any(
+        media_type.startswith(allowed)
+        if allowed.endswith("/")
+        else media_type == allowed
+        for allowed in COMPRESSIBLE_TYPES
+    )
+
+
+class Encoder:
+    """
+    Encoder compresses a response body with one content coding, at once
+    or chunk by chunk, and measures the CPU time it takes
+    """
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        self.size_in = 0
+        self.size_out = 0
+        self.cpu_time = 0.0
+        if encoding == ZSTD:
+            self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == BROTLI:
+            self.compressor = brotli.Compressor(
+                mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY
+            )
+        else:
+            self.compressor = zlib.compressobj(
+                GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def _compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == BROTLI:
+            output = self.compressor.process(data)
+            return output + self.compressor.flush() if flush else output
+        output = self.compressor.compress(data)
+        if not flush:
+            return output
+        if self.encoding == ZSTD:
+            return output + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return output + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+    def compress(self, data: bytes, flush: bool = False, last: bool = False) -> bytes:
+        """compresses next part of the body
+
+        Args:
+            data (bytes): part of the body
+            flush (bool, optional): make everything so far decodable by the
+            client, used for chunks of streamed responses. Defaults to False.
+            last (bool, optional): ends the compressed stream. Defaults to False.
+
+        Returns:
+            bytes: compressed data, may be empty
+        """
+        started = time.thread_time()
+        output = self._compress(data, flush and not last) if data else b""
+        if last:
+            output += self._finish()
+        self.cpu_time += time.thread_time() - started
+        self.size_in += len(data)
+        self.size_out += len(output)
+        return output
+
+    @property
+    def ratio(self) -> float:
+        """original size divided by compressed size"""
+        return self.size_in / self.size_out if self.size_out else 0.0
+
+    def server_timing(self) -> str:
+        """formats the compression as a Server-Timing header value
+
+        Returns:
+            str: header value
+        """
+        return (
+            f"compress;dur={self.cpu_time * 1000:.2f};"
+            f'desc="{self.encoding} {self.ratio:.1f}x"'
+        )
+
+
+class CompressionStats:
+    """
+    CompressionStats sums compressed responses of the process per content coding
+    and logs the totals every COMPRESSION_STATS_LOG_SECONDS
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # encoding: [responses, bytes in, bytes out, CPU seconds]
+        self.totals: Dict[str, List[float]] = {}
+        self.logged_at = time.monotonic()
+
+    def record(self, encoder: Encoder) -> None:
+        """adds one compressed response
+
+        Args:
+            encoder (Encoder): encoder of the finished response
+        """
+        with self.lock:
+            totals = self.totals.setdefault(encoder.encoding, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += encoder.size_in
+            totals[2] += encoder.size_out
+            totals[3] += encoder.cpu_time
+            now = time.monotonic()
+            due = bool(COMPRESSION_STATS_LOG_SECONDS) and (
+                now - self.logged_at >= COMPRESSION_STATS_LOG_SECONDS
+            )
+            if due:
+                self.logged_at = now
+        if due:
+            self.log()
+
+    def log(self) -> None:
+        """logs totals of every content coding"""
+        for encoding, totals in self.snapshot().items():
+            logger.info(
+                "%s compressed %d responses from %d to %d bytes (%.2fx) in %.2f ms",
+                encoding,
+                totals["responses"],
+                totals["bytes_in"],
+                totals["bytes_out"],
+                totals["ratio"],
+                totals["cpu_ms"],
+            )
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """gets totals and the overall ratio per content coding
+
+        Returns:
+            Dict[str, Dict[str, float]]
+        """
+        with self.lock:
+            return {
+                encoding: {
+                    "responses": responses,
+                    "bytes_in": size_in,
+                    "bytes_out": size_out,
+                    "ratio": round(size_in / size_out, 2) if size_out else 0.0,
+                    "cpu_ms": round(cpu_time * 1000, 2),
+                }
+                for encoding, (responses, size_in, size_out, cpu_time) in (
+                    self.totals.items()
+                )
+            }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionResponder:
+    """
+    CompressionResponder compresses the messages of one response, a complete
+    body is compressed at once when it is over the minimum size, a streamed
+    one chunk by chunk, every chunk is flushed so batches reach the client
+    as soon as they are produced
+    """
+
+    def __init__(self, send: Send, encoding: Union[str, None], minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Union[Message, None] = None
+        self.encoder: Union[Encoder, None] = None
+        # body is passed through as it is
+        self.passthrough = False
+
+    def _start(self, headers: MutableHeaders) -> None:
+        self.encoder = Encoder(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        etag = headers.get("etag")
+        # the compressed body is another representation of the resource
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    def _finish(self) -> None:
+        compression_stats.record(self.encoder)
+        logger.debug(
+            "compressed %d bytes to %d with %s in %.2fms",
+            self.encoder.size_in,
+            self.encoder.size_out,
+            self.encoding,
+            self.encoder.cpu_time * 1000,
+        )
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(scope=message)
+            status = message["status"]
+            if status < 200 or status in (204, 304) or not is_compressible(headers):
+                self.passthrough = True
+            else:
+                headers.add_vary_header("Accept-Encoding")
+                self.passthrough = self.encoding is None
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # sent with the first body, when the size is known
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(scope=start)
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self._start(headers)
+            if more_body:
+                # the streamed size is unknown, the server sends it chunked
+                del headers["Content-Length"]
+                await self.send(start)
+            else:
+                body = self.encoder.compress(body, last=True)
+                headers["Content-Length"] = str(len(body))
+                headers.append("Server-Timing", self.encoder.server_timing())
+                self._finish()
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+
+        body = self.encoder.compress(body, flush=True, last=not more_body)
+        if not more_body:
+            self._finish()
+        if body or not more_body:
+            await self.send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+
+class CompressionMiddleware:
+    """
+    CompressionMiddleware compresses responses of allowed media types with
+    zstd, brotli or gzip, the best one accepted by the client and installed
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if scope["method"] == "HEAD":
+            encoding = None
+        responder = CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+def get_compression_stats() -> Dict[str, Dict[str, float]]:
+    """gets compression totals of this process per content coding
+
+    Returns:
+        Dict[str, Dict[str, float]]
+    """
+    return compression_stats.snapshot()
@@ -1,10 +1,24 @@
+import itertools
 import os
+import time
+from typing import Callable
 
 from dotenv import find_dotenv
 from dotenv import load_dotenv
+from fastapi import Request
+from fastapi import Response
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import StaticPool
+
+from project import profiling
+from project import slow_query_log
 
 
 load_dotenv(find_dotenv())
@@ -18,16 +32,235 @@ DB_NAME = "edvantis_project"
 SQLALCHEMY_DATABASE_URL = (
     f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
+# e.g. sqlite:///./edvantis.db for a single node deployment without Postgres
+DATABASE_URL = os.environ.get("DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+
+# comma separated URLs of read replicas, e.g.
+# postgresql+psycopg2://postgres:password@db_replica:5432/edvantis_project
+DB_REPLICA_URLS = [
+    url.strip() for url in os.environ.get("DB_REPLICA_URLS", "").split(",") if url
+]
+# reads of a client are sent to the primary for this long after its last write
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+LAST_WRITE_COOKIE = "last_write"
+# connections per worker process, the worker threadpool is sized to match
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+
+# applied to every SQLite connection: WAL lets readers run alongside the writer,
+# NORMAL sync is durable in WAL mode, foreign keys are off by default in SQLite
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+    "cache_size": -20000,
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+}
+
+
+def set_sqlite_pragmas(
+    dbapi_connection, connection_record
+):  # pylint: disable=unused-argument
+    """tunes a new SQLite connection and turns off transaction handling
+    of the sqlite3 driver, so SAVEPOINT works and a transaction starts at
+    the first statement, see begin_sqlite_transaction"""
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def begin_sqlite_transaction(conn) -> None:
+    """starts SQLite transaction, sent through the driver connection
+    so it is not counted as a statement of the request like the implicit
+    BEGIN of psycopg2. Connections of write_engine begin IMMEDIATE"""
+    mode = conn.get_execution_options().get("sqlite_begin", "DEFERRED")
+    conn.connection.execute(f"BEGIN {mode}")
+
+
+def write_engine(bind: Engine) -> Engine:
+    """engine of sessions which write, on SQLite their transactions take the
+    write lock at BEGIN. A deferred transaction which reads first has to
+    upgrade its lock on the first write, and SQLite fails the upgrade with
+    "database is locked" right away instead of waiting for busy_timeout
+
+    Args:
+        bind (Engine): engine of the primary
+
+    Returns:
+        Engine: sharing connections of bind
+    """
+    return bind.execution_options(sqlite_begin="IMMEDIATE")
+
+
+def create_database_engine(url: str) -> Engine:
+    """creates engine for Postgres or SQLite url, connections of SQLite
+    are tuned with SQLITE_PRAGMAS
+
+    Args:
+        url (str): database url
+
+    Returns:
+        Engine
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    if make_url(url).database in (None, "", ":memory:"):
+        # every connection to an in-memory database would get an empty one
+        pool_kwargs = {"poolclass": StaticPool}
+    else:
+        # keep connections open instead of reconnecting and tuning on every checkout
+        pool_kwargs = {
+            "poolclass": QueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+        }
+    sqlite_engine = create_engine(
+        url, connect_args={"check_same_thread": False}, **pool_kwargs
+    )
+    event.listen(sqlite_engine, "connect", set_sqlite_pragmas)
+    event.listen(sqlite_engine, "begin", begin_sqlite_transaction)
+    return sqlite_engine
+
+
+engine = create_database_engine(DATABASE_URL)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=write_engine(engine)
+)
+# read only sessions of the primary, they do not hold the write lock of SQLite
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replica_engines = [create_database_engine(url) for url in DB_REPLICA_URLS]
+replica_sessions = itertools.cycle(
+    [
+        sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+        for replica_engine in replica_engines
+    ]
+)
 
 Base = declarative_base()
 
 
-def get_db():
-    """database generator"""
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):  # pylint: disable=unused-argument,too-many-arguments
+    """remembers when the statement started"""
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):  # pylint: disable=unused-argument,too-many-arguments
+    """adds the finished statement to the stats of the current request
+    and to the slow query log if it took too long"""
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    profiling.record_query(duration)
+    slow_query_log.capture(conn, cursor, statement, parameters, duration, executemany)
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context) -> None:
+    """drops start time of the failed statement"""
+    if context.connection is not None and context.cursor is not None:
+        start_times = context.connection.info.get("query_start_time")
+        if start_times:
+            start_times.pop()
+
+
+def dispose_engines(close: bool = True) -> None:
+    """drops pooled connections of primary and replica engines
+
+    Args:
+        close (bool, optional): close connections, pass False in a forked
+        child so connections of the parent are left alone. Defaults to True.
+    """
+    for each_engine in [engine, *replica_engines]:
+        each_engine.dispose(close=close)
+
+
+def on_first_write(db: Session, callback: Callable[[], None]) -> None:
+    """calls callback once the session flushes changed objects or executes
+    an INSERT, UPDATE or DELETE statement
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        callback (Callable[[], None]): called at most once
+    """
+
+    def wrote() -> None:
+        if not db.info.get("wrote"):
+            db.info["wrote"] = True
+            callback()
+
+    def after_flush(session, flush_context):  # pylint: disable=unused-argument
+        wrote()
+
+    def do_orm_execute(state) -> None:
+        if state.is_insert or state.is_update or state.is_delete:
+            wrote()
+
+    event.listen(db, "after_flush", after_flush)
+    event.listen(db, "do_orm_execute", do_orm_execute)
+
+
+def get_db(response: Response):
+    """database generator for the primary, a session which writes marks
+    the client as a recent writer so its next reads are not served by
+    a lagging replica"""
     db = SessionLocal()
+    on_first_write(
+        db,
+        lambda: response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+        ),
+    )
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def wrote_recently(request: Request) -> bool:
+    """checks if the client has written to the primary recently
+
+    Args:
+        request (Request): incoming request
+
+    Returns:
+        bool: returns true if the last write is within READ_YOUR_WRITES_SECONDS
+    """
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - last_write < READ_YOUR_WRITES_SECONDS
+
+
+def get_primary_read_db():
+    """database generator for read only endpoints which must not lag behind
+    the primary, its session does not take the write lock of SQLite"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    """database generator for read only endpoints, uses replicas in turn
+    and falls back to the primary without replicas or after a recent write"""
+    if replica_engines and not wrote_recently(request):
+        db = next(replica_sessions, ReadSessionLocal)()
+    else:
+        db = ReadSessionLocal()
     try:
         yield db
     finally:
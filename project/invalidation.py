@@ -0,0 +1,283 @@
+import logging
+import os
+import selectors
+import socket
+import threading
+from datetime import datetime
+from datetime import timedelta
+from functools import lru_cache
+from typing import Dict
+from typing import Iterable
+from typing import Tuple
+from typing import Union
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from project import models
+from project.cache import dumps
+from project.cache import get_cache
+from project.cache import loads
+from project.cache import LocalCache
+from project.database import engine
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = os.environ.get("CACHE_CHANNEL", "cache_invalidation")
+# reads compare the cache with the tables this often, in case notifications
+# were missed, 0 turns the check off
+CACHE_VERSION_CHECK_SECONDS = float(os.environ.get("CACHE_VERSION_CHECK_SECONDS", 5))
+# rows are stamped before their transaction commits, a row committed this
+# much later than stamped is still noticed by the next check. A later commit
+# is missed by the check, its NOTIFY, sent on commit, still invalidates
+CACHE_SETTLE_SECONDS = float(os.environ.get("CACHE_SETTLE_SECONDS", 2))
+CACHE_LISTEN_RETRY_SECONDS = float(os.environ.get("CACHE_LISTEN_RETRY_SECONDS", 1))
+# payload of NOTIFY is limited to 8000 bytes, more ids are left out
+NOTIFY_MAX_IDS = 100
+
+ALL_NAMESPACES = ("authors", "books", "reviews", "users")
+# namespaces holding values computed from rows of each table
+TABLE_NAMESPACES: Dict[str, Tuple[str, ...]] = {
+    "authors": ("authors", "books"),
+    "books": ("books",),
+    "reviews": ("reviews", "books", "users"),
+    "users": ("users", "reviews", "books"),
+    "tombstones": ALL_NAMESPACES,
+}
+
+
+def origin() -> str:
+    """identifies this process, workers forked from a preloaded app differ by pid
+
+    Returns:
+        str
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def is_enabled(bind: Engine) -> bool:
+    """checks that caches of other workers need notifications, a Redis cache
+    is shared and other databases have no LISTEN/NOTIFY
+
+    Args:
+        bind (Engine): database engine
+
+    Returns:
+        bool
+    """
+    return bind.dialect.name == "postgresql" and isinstance(get_cache(), LocalCache)
+
+
+def notify(db: Session, entity: str, ids: Iterable[int], *namespaces: str) -> None:
+    """sends NOTIFY in the transaction of the change, Postgres delivers it
+    to other workers on commit only. Call it before commit, the cache of this
+    process is invalidated after commit as before
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        entity (str): table of changed rows, e.g. "books"
+        ids (Iterable[int]): primary keys of changed rows
+        namespaces (str): cache namespaces to invalidate, e.g. "books", "reviews"
+    """
+    if not is_enabled(db.get_bind()):
+        return
+    ids = list(ids)
+    payload = {
+        "origin": origin(),
+        "entity": entity,
+        # None stands for too many rows to list
+        "ids": ids if len(ids) <= NOTIFY_MAX_IDS else None,
+        "namespaces": list(namespaces),
+    }
+    db.execute(select(func.pg_notify(CACHE_CHANNEL, dumps(payload).decode())))
+
+
+def read_watermarks(bind: Engine) -> Dict[str, Union[datetime, None]]:
+    """gets the latest change time of every table with one statement,
+    each is an endpoint of an updated_at index
+
+    Args:
+        bind (Engine): database engine
+
+    Returns:
+        Dict[str, Union[datetime, None]]: None for an empty table
+    """
+    columns = {
+        "authors": models.Author.updated_at,
+        "books": models.Book.updated_at,
+        "reviews": models.Review.updated_at,
+        "users": models.User.updated_at,
+        "tombstones": models.Tombstone.deleted_at,
+    }
+    statement = select(
+        *(
+            select(func.max(column)).scalar_subquery().label(table)
+            for table, column in columns.items()
+        )
+    )
+    with bind.connect() as conn:
+        return dict(conn.execute(statement).mappings().one())
+
+
+class InvalidationListener:
+    """
+    InvalidationListener keeps the local cache of a worker in step with writes
+    of other workers. A thread LISTENs on its own connection and invalidates
+    namespaces named by notifications, all namespaces after (re)connecting,
+    as notifications sent meanwhile are lost. Reads compare the cache with
+    change times of the tables every check_seconds as a safety net
+    """
+
+    def __init__(
+        self,
+        bind: Engine = engine,
+        cache: Union[LocalCache, None] = None,
+        check_seconds: float = CACHE_VERSION_CHECK_SECONDS,
+    ):
+        self.bind = bind
+        self.cache = cache or get_cache()
+        self.check_seconds = check_seconds
+        self.checked_at = datetime.now()
+        self.check_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread: Union[threading.Thread, None] = None
+
+    def invalidate_all(self) -> None:
+        """makes every namespace of the cache stale"""
+        self.cache.invalidate(*ALL_NAMESPACES)
+
+    def handle(self, payload: str) -> None:
+        """invalidates namespaces named by a notification of another process
+
+        Args:
+            payload (str): JSON sent by notify
+        """
+        try:
+            message = loads(payload)
+            namespaces = message["namespaces"]
+        except (ValueError, TypeError, KeyError):
+            logger.warning("invalid cache notification %r", payload)
+            return
+        if message.get("origin") == origin():
+            # invalidated right after commit
+            return
+        self.cache.invalidate(*namespaces)
+        logger.debug(
+            "%s %s changed by %s",
+            message.get("entity"),
+            message.get("ids"),
+            message.get("origin"),
+        )
+
+    def check_versions(self) -> None:
+        """invalidates namespaces of tables changed since the previous check,
+        at most once per check_seconds and without waiting for another thread
+        which is checking"""
+        check_after = timedelta(seconds=self.check_seconds)
+        if datetime.now() - self.checked_at < check_after or self.check_lock.locked():
+            return
+        with self.check_lock:
+            now = datetime.now()
+            # a thread which got the lock first has just checked
+            if now - self.checked_at < check_after:
+                return
+            try:
+                # anything stamped earlier was committed and seen by the last check
+                since = self.checked_at - timedelta(seconds=CACHE_SETTLE_SECONDS)
+                watermarks = read_watermarks(self.bind)
+                self.checked_at = now
+                stale = {
+                    namespace
+                    for table, changed_at in watermarks.items()
+                    if changed_at is not None and changed_at > since
+                    for namespace in TABLE_NAMESPACES[table]
+                }
+                if stale:
+                    self.cache.invalidate(*sorted(stale))
+            except Exception:  # pylint: disable=broad-except
+                # the cache is checked again on the next read
+                logger.exception("could not check cache versions")
+
+    def listen(self) -> None:
+        """waits for notifications on one connection until it fails or stop"""
+        # a connection of its own, not held out of the pool of requests
+        cargs, cparams = self.bind.dialect.create_connect_args(self.bind.url)
+        connection = self.bind.dialect.connect(*cargs, **cparams)
+        selector = selectors.DefaultSelector()
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(f'LISTEN "{CACHE_CHANNEL}"')
+            cursor.close()
+            self.invalidate_all()
+            logger.info("listening for cache notifications on %s", CACHE_CHANNEL)
+            selector.register(connection, selectors.EVENT_READ)
+            while not self.stopped.is_set():
+                # wakes up now and then to notice stop
+                if selector.select(timeout=1):
+                    connection.poll()
+                    while connection.notifies:
+                        self.handle(connection.notifies.pop(0).payload)
+        finally:
+            selector.close()
+            connection.close()
+
+    def run(self) -> None:
+        """listens until stopped, reconnects after failures"""
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("cache notifications are interrupted")
+                self.stopped.wait(CACHE_LISTEN_RETRY_SECONDS)
+
+    def start(self) -> threading.Thread:
+        """starts listening in the background and checking on cache reads
+
+        Returns:
+            threading.Thread
+        """
+        if self.check_seconds:
+            self.cache.version_check = self.check_versions
+        self.thread = threading.Thread(
+            target=self.run, name="cache-listener", daemon=True
+        )
+        self.thread.start()
+        return self.thread
+
+    def stop(self) -> None:
+        """stops listening and checking"""
+        self.stopped.set()
+        self.cache.version_check = None
+        if self.thread is not None:
+            self.thread.join()
+
+
+@lru_cache(maxsize=None)
+def get_listener() -> InvalidationListener:
+    """gets listener of this process, created once
+
+    Returns:
+        InvalidationListener
+    """
+    return InvalidationListener()
+
+
+def start_listener() -> Union[threading.Thread, None]:
+    """starts listener when caches of workers need notifications
+
+    Returns:
+        Union[threading.Thread, None]: None when they do not
+    """
+    if not is_enabled(engine):
+        return None
+    return get_listener().start()
+
+
+def stop_listener() -> None:
+    """stops listener if start_listener started it"""
+    if is_enabled(engine):
+        get_listener().stop()
@@ -0,0 +1,97 @@
+import os
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+from project.models import AggregateJob
+
+
+# 1 to recompute book ratings and user ranks in the worker instead of the request
+AGGREGATES_DEFERRED = os.environ.get("AGGREGATES_DEFERRED", "0") == "1"
+AGGREGATE_JOBS_BATCH_SIZE = int(os.environ.get("AGGREGATE_JOBS_BATCH_SIZE", 500))
+
+BOOK_RATING = "book_rating"
+USER_RANK = "user_rank"
+# documents of books whose reviews changed are rendered by the worker,
+# reading all reviews of a book does not belong in the write transaction
+BOOK_DOCUMENT = "book_document"
+
+
+def upsert_jobs(db: Session, values: List[dict]):
+    """builds INSERT of jobs which touches a pending job of the same target
+    instead. Touching locks the pending job till the write commits, so a worker
+    cannot claim it and recompute without the write
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        values (List[dict]): kind and target_id of jobs
+
+    Returns:
+        Insert: statement for AggregateJob
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(AggregateJob).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=[AggregateJob.kind, AggregateJob.target_id],
+        set_={"created_at": statement.excluded.created_at},
+    )
+
+
+def enqueue_jobs(
+    db: Session,
+    book_ids: Iterable[int] = (),
+    user_ids: Iterable[int] = (),
+    document_ids: Iterable[int] = (),
+) -> None:
+    """adds recomputation jobs in the transaction of the write which needs them,
+    a target has at most one pending job, so a burst of writes on one book
+    is coalesced into one recomputation
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (Iterable[int], optional): books to recompute rating of
+        user_ids (Iterable[int], optional): users to recompute rank of
+        document_ids (Iterable[int], optional): books to render document of
+    """
+    values = [{"kind": BOOK_RATING, "target_id": book_id} for book_id in set(book_ids)]
+    values += [{"kind": USER_RANK, "target_id": user_id} for user_id in set(user_ids)]
+    values += [
+        {"kind": BOOK_DOCUMENT, "target_id": book_id} for book_id in set(document_ids)
+    ]
+    if values:
+        db.execute(upsert_jobs(db, values))
+
+
+def claim_jobs(
+    db: Session, batch_size: int = AGGREGATE_JOBS_BATCH_SIZE
+) -> List[Tuple[str, int]]:
+    """takes oldest pending jobs off the queue. Rows are locked with SKIP LOCKED,
+    so concurrent workers claim different jobs, and deleted in the transaction
+    of the worker, so jobs come back if the worker fails before commit
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        batch_size (int, optional): Defaults to AGGREGATE_JOBS_BATCH_SIZE.
+
+    Returns:
+        List[Tuple[str, int]]: kind and target id of claimed jobs
+    """
+    rows = (
+        db.query(AggregateJob.id, AggregateJob.kind, AggregateJob.target_id)
+        .order_by(AggregateJob.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if rows:
+        db.execute(
+            delete(AggregateJob)
+            .where(AggregateJob.id.in_([row.id for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+    return [(row.kind, row.target_id) for row in rows]
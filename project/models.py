@@ -1,13 +1,20 @@
 from datetime import datetime
 
+from sqlalchemy import BigInteger
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy import DDL
+from sqlalchemy import event
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy import Table
+from sqlalchemy import UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 from project.database import Base
 
@@ -27,12 +34,22 @@ class Author(Base):
     """
 
     __tablename__ = "authors"
+    # changes after a sync position, see project.sync
+    __table_args__ = (Index("ix_authors_updated_at", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String)
     last_name = Column(String)
     middle_name = Column(String)
     image_file = Column(String)
+    # maintained by every ORM and Core update, see project.sync
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=func.now(),
+    )
 
     books = relationship(
         "Book", secondary=AuthorBook, back_populates="authors", cascade="all, delete"
@@ -45,12 +62,33 @@ class Author(Base):
         return str(self.__dict__)
 
 
+# trigram index for fuzzy search of authors by full name, postgres only,
+# queries use the same expression, see project.authors.search.search_name
+AUTHOR_SEARCH_INDEX = (
+    "CREATE INDEX ix_authors_search_name ON authors USING gin (("
+    "coalesce(first_name, '') || ' ' || coalesce(middle_name, '') || ' ' || "
+    "coalesce(last_name, '')) gin_trgm_ops)"
+)
+event.listen(
+    Author.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Author.__table__,
+    "after_create",
+    DDL(AUTHOR_SEARCH_INDEX).execute_if(dialect="postgresql"),
+)
+
+
 class Book(Base):
     """
     Books table contains main information about books
     """
 
     __tablename__ = "books"
+    # changes after a sync position, see project.sync
+    __table_args__ = (Index("ix_books_updated_at", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -61,6 +99,16 @@ class Book(Base):
     pages = Column(Integer, nullable=False)
     genre = Column(String, nullable=False)
     type = Column(String, nullable=False)
+    # incremented on every change, see project.outbox
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # maintained by every ORM and Core update, see project.sync
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=func.now(),
+    )
 
     reviews = relationship("Review", backref="book", passive_deletes=True)
     authors = relationship(
@@ -75,18 +123,50 @@ class Book(Base):
         return str(self.__dict__)
 
 
+class BookDocument(Base):
+    """
+    Book documents table keeps rendered JSON of book details, a document is
+    served while its version equals the version of the book, see
+    project.books.documents
+    """
+
+    __tablename__ = "book_documents"
+
+    book_id = Column(
+        Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True
+    )
+    version = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"BookDocument(book_id={self.book_id}, version={self.version})"
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
+
+
 class User(Base):
     """
     Users table contains main information about users
     """
 
     __tablename__ = "users"
+    # changes after a sync position, see project.sync
+    __table_args__ = (Index("ix_users_updated_at", "updated_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, nullable=False, unique=True)
     email = Column(String, nullable=False, unique=True)
     password = Column(String, nullable=False)
     rank = Column(String, nullable=False, default="9 kyu")
+    # maintained by every ORM and Core update, see project.sync
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=func.now(),
+    )
 
     reviews = relationship("Review", backref="user", passive_deletes=True)
 
@@ -103,6 +183,23 @@ class Review(Base):
     """
 
     __tablename__ = "reviews"
+    # newest first listing of reviews filtered by book, user, rating
+    # and creation time
+    __table_args__ = (
+        Index("ix_reviews_book_id_created_at", "book_id", "created_at", "id"),
+        Index(
+            "ix_reviews_book_id_rating_created_at",
+            "book_id",
+            "rating",
+            "created_at",
+            "id",
+        ),
+        Index("ix_reviews_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_reviews_rating_created_at", "rating", "created_at", "id"),
+        Index("ix_reviews_created_at", "created_at", "id"),
+        # changes after a sync position, see project.sync
+        Index("ix_reviews_updated_at", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -110,6 +207,16 @@ class Review(Base):
     rating = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
     book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"))
+    # incremented on every change, see project.outbox
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # maintained by every ORM and Core update, see project.sync
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=func.now(),
+    )
 
     # book = relationship("Book", back_populates="reviews")
     # user = relationship("User", back_populates="reviews")
@@ -119,3 +226,100 @@ class Review(Base):
 
     def __str__(self) -> str:
         return str(self.__dict__)
+
+
+class AggregateJob(Base):
+    """
+    Aggregate jobs table is a queue of pending recomputations of book ratings,
+    user ranks and book documents, a target has at most one pending job
+    """
+
+    __tablename__ = "aggregate_jobs"
+    __table_args__ = (
+        UniqueConstraint("kind", "target_id", name="uq_aggregate_jobs_kind_target_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    target_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self) -> str:
+        return (
+            f"AggregateJob(id={self.id}, kind={self.kind}, target_id={self.target_id})"
+        )
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
+
+
+class OutboxEvent(Base):
+    """
+    Outbox table contains changes of books and reviews, written in the
+    transaction of the change and read by consumers in the order of
+    (transaction_id, id)
+    """
+
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_transaction_id", "transaction_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    # id of the writing transaction on Postgres, 0 on SQLite
+    transaction_id = Column(BigInteger, nullable=False, server_default="0")
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self) -> str:
+        return (
+            f"OutboxEvent(id={self.id}, entity={self.entity}, "
+            f"entity_id={self.entity_id}, operation={self.operation})"
+        )
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
+
+
+class OutboxCheckpoint(Base):
+    """
+    Outbox checkpoints table contains transaction id and id of the last
+    outbox event processed by every consumer
+    """
+
+    __tablename__ = "outbox_checkpoints"
+
+    consumer = Column(String, primary_key=True)
+    transaction_id = Column(BigInteger, nullable=False, server_default="0")
+    position = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        DateTime, default=datetime.now, onupdate=datetime.now, nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"OutboxCheckpoint(consumer={self.consumer}, position={self.position})"
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
+
+
+class Tombstone(Base):
+    """
+    Tombstones table keeps ids of deleted rows, so delta sync can report them
+    """
+
+    __tablename__ = "tombstones"
+    __table_args__ = (Index("ix_tombstones_deleted_at", "deleted_at", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    # name of the table the row was deleted from
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"Tombstone(entity={self.entity}, entity_id={self.entity_id})"
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
@@ -0,0 +1,216 @@
+import os
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from typing import List
+from typing import Tuple
+
+from sqlalchemy import BigInteger
+from sqlalchemy import DateTime
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import literal
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from project.models import OutboxCheckpoint
+from project.models import OutboxEvent
+
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 500))
+# without any consumer events are kept this many days, e.g. for one to come
+OUTBOX_RETENTION_DAYS = float(os.environ.get("OUTBOX_RETENTION_DAYS", 7))
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+# transaction id and id of an event, events are consumed in this order
+Position = Tuple[int, int]
+
+
+def is_postgres(db: Session) -> bool:
+    """checks the dialect, Postgres runs writers concurrently while SQLite
+    commits one writer after another
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+
+    Returns:
+        bool
+    """
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def record_change(db: Session, model, operation: str, *criteria) -> None:
+    """writes outbox events for rows of model matching criteria with one
+    INSERT ... SELECT in the transaction of the change. Call it after the rows
+    are inserted or updated and before they are deleted
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        model: Book or Review model
+        operation (str): CREATE, UPDATE or DELETE
+        criteria: filters of changed rows, e.g. Review.id == 1
+    """
+    # a deleted row gets the version following its last change
+    version = model.version + 1 if operation == DELETE else model.version
+    transaction_id = func.txid_current() if is_postgres(db) else literal(0, BigInteger)
+    rows = select(
+        transaction_id,
+        literal(model.__tablename__),
+        model.id,
+        literal(operation),
+        version,
+        literal(datetime.now(), DateTime),
+    ).where(*criteria)
+    db.execute(
+        insert(OutboxEvent).from_select(
+            [
+                "transaction_id",
+                "entity",
+                "entity_id",
+                "operation",
+                "version",
+                "created_at",
+            ],
+            rows,
+        )
+    )
+
+
+def get_checkpoint(db: Session, consumer: str) -> Position:
+    """gets position of the last event processed by consumer
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        consumer (str): name of consumer, e.g. "search_index"
+
+    Returns:
+        Position: (0, 0) for a new consumer
+    """
+    checkpoint = (
+        db.query(OutboxCheckpoint.transaction_id, OutboxCheckpoint.position)
+        .filter(OutboxCheckpoint.consumer == consumer)
+        .first()
+    )
+    return tuple(checkpoint) if checkpoint else (0, 0)
+
+
+def save_checkpoint(db: Session, consumer: str, event: OutboxEvent) -> None:
+    """stores position of the last event processed by consumer, commit is
+    left to caller
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        consumer (str): name of consumer
+        event (OutboxEvent): last processed event
+    """
+    dialect = postgresql if is_postgres(db) else sqlite
+    statement = dialect.insert(OutboxCheckpoint).values(
+        consumer=consumer,
+        transaction_id=event.transaction_id,
+        position=event.id,
+        updated_at=datetime.now(),
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[OutboxCheckpoint.consumer],
+            set_={
+                "transaction_id": statement.excluded.transaction_id,
+                "position": statement.excluded.position,
+                "updated_at": statement.excluded.updated_at,
+            },
+        )
+    )
+
+
+def read_changes(
+    db: Session, consumer: str, batch_size: int = OUTBOX_BATCH_SIZE
+) -> List[OutboxEvent]:
+    """gets next events after the checkpoint of consumer, oldest first.
+    Ids are taken before commit, on Postgres a transaction still in progress
+    may hold lower ids than committed ones. Events are read in the order of
+    their transactions there, up to the oldest transaction in progress, so
+    none is skipped however late it commits
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        consumer (str): name of consumer
+        batch_size (int, optional): Defaults to OUTBOX_BATCH_SIZE.
+
+    Returns:
+        List[OutboxEvent]
+    """
+    events = db.query(OutboxEvent).filter(
+        tuple_(OutboxEvent.transaction_id, OutboxEvent.id)
+        > tuple_(*get_checkpoint(db, consumer))
+    )
+    if is_postgres(db):
+        events = events.filter(
+            OutboxEvent.transaction_id
+            < func.txid_snapshot_xmin(func.txid_current_snapshot())
+        )
+    return (
+        events.order_by(OutboxEvent.transaction_id, OutboxEvent.id)
+        .limit(batch_size)
+        .all()
+    )
+
+
+def consume(
+    db: Session,
+    consumer: str,
+    handler: Callable[[List[OutboxEvent]], None],
+    batch_size: int = OUTBOX_BATCH_SIZE,
+) -> int:
+    """passes next batch of events to handler and moves the checkpoint past it.
+    The checkpoint is committed together with whatever handler wrote with db,
+    so an index kept in the database is updated exactly once per event
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        consumer (str): name of consumer
+        handler (Callable[[List[OutboxEvent]], None]): applies events
+        batch_size (int, optional): Defaults to OUTBOX_BATCH_SIZE.
+
+    Returns:
+        int: number of consumed events, 0 when consumer is up to date
+    """
+    events = read_changes(db, consumer, batch_size)
+    if not events:
+        db.rollback()
+        return 0
+    handler(events)
+    save_checkpoint(db, consumer, events[-1])
+    db.commit()
+    return len(events)
+
+
+def prune(db: Session) -> int:
+    """deletes events processed by every consumer or, while no consumer
+    is registered, events older than OUTBOX_RETENTION_DAYS
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+
+    Returns:
+        int: number of deleted events
+    """
+    position = (
+        db.query(OutboxCheckpoint.transaction_id, OutboxCheckpoint.position)
+        .order_by(OutboxCheckpoint.transaction_id, OutboxCheckpoint.position)
+        .first()
+    )
+    if position is None:
+        expired = datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS)
+        pruned = OutboxEvent.created_at < expired
+    else:
+        pruned = tuple_(OutboxEvent.transaction_id, OutboxEvent.id) <= tuple_(*position)
+    result = db.execute(delete(OutboxEvent).where(pruned))
+    db.commit()
+    return result.rowcount
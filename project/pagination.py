@@ -0,0 +1,110 @@
+import base64
+import binascii
+import os
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+from fastapi import Response
+from fastapi import status
+from sqlalchemy import text
+from sqlalchemy.orm import Query
+from sqlalchemy.orm import Session
+
+
+# below this many estimated rows a list is counted exactly
+EXACT_COUNT_THRESHOLD = int(os.environ.get("EXACT_COUNT_THRESHOLD", 10000))
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """encodes position of the last returned row as an opaque cursor
+
+    Args:
+        created_at (datetime): sort key of the last row
+        row_id (int): primary key of the last row, breaks ties
+
+    Returns:
+        str: url safe cursor
+    """
+    value = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """decodes cursor created by encode_cursor
+
+    Args:
+        cursor (str): url safe cursor
+
+    Raises:
+        HTTPException: Handles invalid cursor
+
+    Returns:
+        Tuple[datetime, int]: sort key and primary key of the last returned row
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, row_id = value.split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from error
+
+
+def estimate_rows(db: Session, query: Query, table: str) -> int:
+    """estimates number of rows of a query from postgres statistics,
+    unfiltered tables use pg_class.reltuples, filtered queries the planner estimate
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        query (Query): filtered query
+        table (str): name of the queried table
+
+    Returns:
+        int: estimated number of rows, negative if table was never analyzed
+    """
+    if query.whereclause is None:
+        reltuples = db.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+            {"table": table},
+        ).scalar()
+        return int(reltuples)
+    compiled = query.statement.compile(dialect=db.get_bind().dialect)
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        .scalar()
+    )
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_rows(db: Session, query: Query, table: str) -> Tuple[int, bool]:
+    """counts rows of a query, exactly for small and selective results and
+    approximately for broad ones, so a full table count(*) is never run
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        query (Query): filtered query without ordering and paging
+        table (str): name of the queried table
+
+    Returns:
+        Tuple[int, bool]: number of rows and true if the number is exact
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        estimate = estimate_rows(db, query, table)
+        if estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate, False
+    return query.order_by(None).count(), True
+
+
+def set_total_count(response: Response, total: Tuple[int, bool]) -> None:
+    """adds X-Total-Count and X-Total-Count-Exact headers to response
+
+    Args:
+        response (Response): response of a list endpoint
+        total (Tuple[int, bool]): result of count_rows
+    """
+    count, exact = total
+    response.headers["X-Total-Count"] = str(count)
+    response.headers["X-Total-Count-Exact"] = "true" if exact else "false"
@@ -0,0 +1,168 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Dict
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+
+logger = logging.getLogger(__name__)
+
+# maximum number of SQL statements per route, keyed by "METHOD /path/template",
+# lists include up to two statements for the optional total count,
+# review writes include outbox events of the review and of its book and
+# a job for the worker to render the book document, see project.jobs, deletes also
+# write tombstones, see project.sync. On Postgres writes also notify other
+# workers to invalidate their caches, see project.invalidation. Book details
+# take one statement when their document is current
+QUERY_BUDGETS: Dict[str, int] = {
+    "GET /authors/": 3,
+    "GET /authors/search": 2,
+    "GET /authors/autocomplete": 1,
+    "GET /authors/batch": 1,
+    "GET /authors/{author_id}": 1,
+    "GET /books/": 5,
+    "GET /books/autocomplete": 1,
+    "GET /books/batch": 3,
+    "GET /books/facets": 1,
+    "GET /books/rating/{rating}": 3,
+    "GET /books/recommendations/{genre}": 3,
+    "GET /books/{book_id}": 4,
+    "GET /books/authors/{author_id}": 4,
+    "GET /reviews/": 3,
+    "GET /reviews/batch": 1,
+    "GET /reviews/{review_id}": 1,
+    "POST /reviews/": 9,
+    "POST /reviews/bulk": 11,
+    "PUT /reviews/{review_id}": 8,
+    "DELETE /reviews/{review_id}": 9,
+    "GET /sync/": 5,
+    "GET /users/": 4,
+    "GET /users/profile": 2,
+}
+DEFAULT_QUERY_BUDGET = 20
+
+_ENFORCE_BUDGETS = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised in test mode when an endpoint issues more statements than its budget
+    """
+
+
+class QueryStats:
+    """
+    QueryStats collects the number of SQL statements and the time spent in the database
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, duration: float) -> None:
+        """adds one executed statement
+
+        Args:
+            duration (float): time spent executing the statement in seconds
+        """
+        self.count += 1
+        self.duration += duration
+
+    def server_timing(self) -> str:
+        """formats stats as a Server-Timing header value
+
+        Returns:
+            str: header value
+        """
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+def record_query(duration: float) -> None:
+    """adds statement to the stats of the current request, if any
+
+    Args:
+        duration (float): time spent executing the statement in seconds
+    """
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(duration)
+
+
+def enforce_query_budgets(enabled: bool = True) -> None:
+    """turns query budget enforcement on or off, used by the test suite
+
+    Args:
+        enabled (bool, optional): Defaults to True.
+    """
+    global _ENFORCE_BUDGETS  # pylint: disable=global-statement
+    _ENFORCE_BUDGETS = enabled
+
+
+def get_route_name(scope: Scope) -> str:
+    """gets name of the matched route, e.g. "GET /books/{book_id}"
+
+    Args:
+        scope (Scope): ASGI connection scope
+
+    Returns:
+        str: method and path template
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", scope.get("path", ""))
+    return f"{scope.get('method', '')} {path}"
+
+
+class QueryCountMiddleware:
+    """
+    QueryCountMiddleware counts SQL statements per request, reports them
+    in the Server-Timing header and logs, and checks them against the route budget
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                route_name = get_route_name(scope)
+                logger.info(
+                    "%s %s queries=%d db=%.2fms total=%.2fms",
+                    route_name,
+                    message["status"],
+                    stats.count,
+                    stats.duration * 1000,
+                    (time.perf_counter() - started) * 1000,
+                )
+                budget = QUERY_BUDGETS.get(route_name, DEFAULT_QUERY_BUDGET)
+                if _ENFORCE_BUDGETS and stats.count > budget:
+                    raise QueryBudgetExceeded(
+                        f"{route_name} issued {stats.count} queries, budget is {budget}"
+                    )
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
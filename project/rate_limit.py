@@ -0,0 +1,199 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+from typing import Tuple
+
+from fastapi import Depends
+from fastapi import HTTPException
+from fastapi import Request
+from fastapi import status
+from fastapi.security import OAuth2PasswordRequestForm
+
+try:
+    import redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+# memory:// for limits per process, redis://host:port/db for limits shared by workers
+RATE_LIMIT_URL = os.environ.get("RATE_LIMIT_URL", "memory://")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))
+
+LOGIN_USERNAME_BURST = int(os.environ.get("LOGIN_USERNAME_BURST", 5))
+LOGIN_USERNAME_PER_MINUTE = float(os.environ.get("LOGIN_USERNAME_PER_MINUTE", 5))
+LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", 20))
+LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE", 30))
+REGISTRATION_IP_BURST = int(os.environ.get("REGISTRATION_IP_BURST", 10))
+REGISTRATION_IP_PER_MINUTE = float(os.environ.get("REGISTRATION_IP_PER_MINUTE", 5))
+
+
+class MemoryBucketStore:
+    """
+    MemoryBucketStore keeps token buckets in process memory as compact
+    (tokens, updated_at, full_at) tuples. A bucket which is full again carries
+    no information, so buckets idle for longer than their refill time are dropped
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # least recently updated first
+        self.buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """takes one token from the bucket
+
+        Args:
+            key (str): bucket key, e.g. "login:ip:127.0.0.1"
+            capacity (int): maximum number of tokens, the allowed burst
+            rate (float): tokens added per second
+
+        Returns:
+            Tuple[bool, float]: true if token was taken, seconds until next token
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            tokens, updated_at, _ = self.buckets.pop(key, (capacity, now, 0))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            full_at = now + (capacity - tokens) / rate
+            self.buckets[key] = (tokens, now, full_at)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def expire(self, now: float) -> None:
+        """drops buckets which are full again, oldest first"""
+        while self.buckets:
+            key, (_, _, full_at) = next(iter(self.buckets.items()))
+            if full_at > now:
+                break
+            del self.buckets[key]
+
+
+class RedisBucketStore:
+    """
+    RedisBucketStore keeps token buckets in a server speaking the Redis
+    protocol, shared by all workers. A bucket is updated atomically by a script
+    and expires once it is full again
+    """
+
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(self.SCRIPT)
+
+    def consume(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """takes one token from the bucket, see MemoryBucketStore.consume"""
+        allowed, tokens = self.script(keys=[key], args=[capacity, rate, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / rate
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    """gets bucket store configured by RATE_LIMIT_URL, created once per process"""
+    if RATE_LIMIT_URL.startswith(("redis://", "rediss://", "unix://")):
+        if redis is None:
+            raise RuntimeError("redis package is required for RATE_LIMIT_URL")
+        return RedisBucketStore(redis.Redis.from_url(RATE_LIMIT_URL))
+    return MemoryBucketStore()
+
+
+def check_limits(limits: List[Tuple[str, int, float]]) -> None:
+    """takes a token from every bucket, rejects request if any bucket is empty
+
+    Args:
+        limits (List[Tuple[str, int, float]]): bucket key, burst, tokens per minute
+
+    Raises:
+        HTTPException: Handles too many attempts
+    """
+    retry_after = 0.0
+    for key, burst, per_minute in limits:
+        allowed, wait = get_store().consume(key, burst, per_minute / 60)
+        if not allowed:
+            retry_after = max(retry_after, wait)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def get_client_ip(request: Request) -> str:
+    """gets address of the client
+
+    Args:
+        request (Request)
+
+    Returns:
+        str
+    """
+    return request.client.host if request.client else "unknown"
+
+
+def limit_login(
+    request: Request, form_data: OAuth2PasswordRequestForm = Depends()
+) -> None:
+    """dependency which limits login attempts per username and per client address
+    before the password is checked
+
+    Args:
+        request (Request)
+        form_data (OAuth2PasswordRequestForm, optional): Defaults to Depends().
+    """
+    check_limits(
+        [
+            (
+                f"login:user:{form_data.username.lower()}",
+                LOGIN_USERNAME_BURST,
+                LOGIN_USERNAME_PER_MINUTE,
+            ),
+            (f"login:ip:{get_client_ip(request)}", LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE),
+        ]
+    )
+
+
+def limit_registration(request: Request) -> None:
+    """dependency which limits registrations per client address
+    before the password is hashed
+
+    Args:
+        request (Request)
+    """
+    check_limits(
+        [
+            (
+                f"registration:ip:{get_client_ip(request)}",
+                REGISTRATION_IP_BURST,
+                REGISTRATION_IP_PER_MINUTE,
+            )
+        ]
+    )
@@ -1,21 +1,114 @@
+from collections import defaultdict
+from collections import deque
+from datetime import datetime
 from typing import List
+from typing import Tuple
+from typing import Union
 
 from fastapi import HTTPException
 from fastapi import status
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
+from project import invalidation
+from project import jobs
 from project import models
+from project import outbox
+from project import sync
+from project.books import documents
+from project.cache import get_cache
 from project.models import Book
 from project.models import User
+from project.pagination import count_rows
+from project.pagination import decode_cursor
 from project.reviews import schemas
 from project.utils import get_user_rank
+from project.utils import order_by_ids
+
+
+def update_book_rating(db: Session, book_ids: List[int]) -> int:
+    """recomputes average rating of books with a single UPDATE statement,
+    the version bump outdates their documents
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (List[int]): Primary keys of Book model
+
+    Returns:
+        int: number of updated books
+    """
+    average = (
+        select(func.avg(models.Review.rating))
+        .where(models.Review.book_id == Book.id)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(Book)
+        .where(Book.id.in_(book_ids))
+        .values(rating=func.coalesce(average, 0), version=Book.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        outbox.record_change(db, Book, outbox.UPDATE, Book.id.in_(book_ids))
+    return result.rowcount
+
+
+def update_user_rank(db: Session, user_id: int) -> None:
+    """recomputes rank of user from the number of its reviews
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        user_id (int): Primary key of User model
+    """
+    reviews_number = (
+        db.query(func.count(models.Review.id))
+        .filter(models.Review.user_id == user_id)
+        .scalar()
+    )
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(rank=get_user_rank(reviews_number))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recompute_aggregates(
+    db: Session, book_ids: List[int], user_ids: List[int] = ()
+) -> None:
+    """recomputes book ratings and user ranks in the current transaction
+    or enqueues them for the worker if AGGREGATES_DEFERRED is set,
+    documents of the books are rendered by the worker either way
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_ids (List[int]): Primary keys of Book model
+        user_ids (List[int], optional): Primary keys of User model
+    """
+    if jobs.AGGREGATES_DEFERRED:
+        jobs.enqueue_jobs(db, book_ids=book_ids, user_ids=user_ids)
+        if book_ids:
+            documents.drop_documents(db, list(book_ids))
+        return
+    if book_ids:
+        update_book_rating(db, list(book_ids))
+        jobs.enqueue_jobs(db, document_ids=book_ids)
+    for user_id in user_ids:
+        update_user_rank(db, user_id)
 
 
 def create_review(
     db: Session, review: schemas.ReviewCreate, user: User
 ) -> models.Review:
-    """creates instance of Review model and adds it to database
+    """creates instance of Review model and adds it to database,
+    book rating and user rank are updated in the same transaction
+    or enqueued for the worker
 
     Args:
         db (Session): Manages persistence operations for ORM-mapped objects
@@ -26,12 +119,10 @@ def create_review(
     Returns:
         returns instance of Review model
     """
-    book = db.query(Book).filter(Book.id == review.book_id).first()
-    if not book:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Book with id {review.book_id} is not found",
-        )
+    book_not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Book with id {review.book_id} is not found",
+    )
     new_review = models.Review(
         user_id=user.id,
         text=review.text,
@@ -39,40 +130,265 @@ def create_review(
         book_id=review.book_id,
     )
     db.add(new_review)
+    try:
+        # id comes back with INSERT ... RETURNING, no refresh needed
+        db.flush()
+    except IntegrityError as error:
+        db.rollback()
+        raise book_not_found from error
+    outbox.record_change(
+        db, models.Review, outbox.CREATE, models.Review.id == new_review.id
+    )
+    if jobs.AGGREGATES_DEFERRED:
+        # missing book is reported by the foreign key on flush
+        jobs.enqueue_jobs(db, book_ids=[review.book_id], user_ids=[user.id])
+        documents.drop_documents(db, [review.book_id])
+    else:
+        if not update_book_rating(db, [review.book_id]):
+            db.rollback()
+            raise book_not_found
+        jobs.enqueue_jobs(db, document_ids=[review.book_id])
+        update_user_rank(db, user.id)
+    invalidation.notify(db, "reviews", [new_review.id], "books", "reviews")
+    # keep loaded values instead of expiring them on commit
+    db.expunge(new_review)
     db.commit()
-    book.reviews.append(new_review)
-    rating = (
-        db.query(func.avg(models.Review.rating))
-        .filter(models.Review.book_id == review.book_id)
-        .group_by(models.Review.book_id)
-        .first()
-    )
-    book.rating = float(rating[0])
-    db.add(book)
-    user = db.query(User).filter(User.id == user.id).first()
-    rank = get_user_rank(len(user.reviews))
-    user.rank = rank
-    db.add(user)
+    get_cache().invalidate("books", "reviews")
+    return new_review
+
+
+def insert_reviews(db: Session, values: List[dict]) -> List[models.Review]:
+    """inserts reviews with one multi-row INSERT statement, ids come back
+    with RETURNING or, on SQLite, from the id of the last row
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        values (List[dict]): column values of new reviews of one user,
+        all with the same created_at
+
+    Returns:
+        List[models.Review]: returns new instances of Review model in the order of values
+    """
+    statement = insert(models.Review).values(values)
+    if not db.get_bind().dialect.full_returning:
+        # SQLite runs one writer at a time, rows of one statement get
+        # consecutive ids up to the last inserted one
+        last_id = db.execute(statement).lastrowid
+        ids = range(last_id - len(values) + 1, last_id + 1)
+        return [
+            models.Review(id=review_id, **value)
+            for review_id, value in zip(ids, values)
+        ]
+    # postgres does not promise RETURNING rows in the order of VALUES, rows
+    # are matched to values by their content, equal ones in the order of ids
+    rows = db.execute(
+        statement.returning(
+            models.Review.id,
+            models.Review.book_id,
+            models.Review.text,
+            models.Review.rating,
+        )
+    ).all()
+    waiting = defaultdict(deque)
+    for index, value in enumerate(values):
+        waiting[value["book_id"], value["text"], value["rating"]].append(index)
+    ids = [0] * len(values)
+    for review_id, book_id, text, rating in sorted(rows):
+        ids[waiting[book_id, text, rating].popleft()] = review_id
+    return [
+        models.Review(id=review_id, **value) for review_id, value in zip(ids, values)
+    ]
+
+
+def create_reviews(
+    db: Session, reviews: List[schemas.ReviewCreate], user: User
+) -> List[schemas.ReviewBulkItem]:
+    """creates many instances of Review model in one transaction,
+    rating of every affected book and rank of user are recomputed once
+    or enqueued for the worker
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        reviews (List[schemas.ReviewCreate]): New Review instances
+        user (User): author of reviews
+
+    Returns:
+        List[schemas.ReviewBulkItem]: returns status of every review in request order
+    """
+    book_ids = {review.book_id for review in reviews}
+    existing_ids = {
+        row.id for row in db.query(Book.id).filter(Book.id.in_(book_ids)).all()
+    }
+    results = []
+    values = []
+    now = datetime.now()
+    for index, review in enumerate(reviews):
+        if review.book_id in existing_ids:
+            values.append(
+                {
+                    "user_id": user.id,
+                    "text": review.text,
+                    "rating": review.rating,
+                    "book_id": review.book_id,
+                    "created_at": now,
+                }
+            )
+            results.append(
+                schemas.ReviewBulkItem(
+                    index=index, status=schemas.ReviewBulkStatus.CREATED
+                )
+            )
+        else:
+            results.append(
+                schemas.ReviewBulkItem(
+                    index=index,
+                    status=schemas.ReviewBulkStatus.BOOK_NOT_FOUND,
+                    detail=f"Book with id {review.book_id} is not found",
+                )
+            )
+    if not values:
+        return results
+
+    new_reviews = insert_reviews(db, values)
+    outbox.record_change(
+        db,
+        models.Review,
+        outbox.CREATE,
+        models.Review.id.in_([new_review.id for new_review in new_reviews]),
+    )
+    invalidation.notify(
+        db,
+        "reviews",
+        [new_review.id for new_review in new_reviews],
+        "books",
+        "reviews",
+    )
+    new_reviews = iter(new_reviews)
+    recompute_aggregates(
+        db, list({value["book_id"] for value in values}), user_ids=[user.id]
+    )
     db.commit()
-    db.refresh(book)
-    db.refresh(user)
-    db.refresh(new_review)
+    get_cache().invalidate("books", "reviews")
+    for result in results:
+        if result.status == schemas.ReviewBulkStatus.CREATED:
+            result.review = schemas.Review.from_orm(next(new_reviews))
+    return results
 
-    return new_review
+
+def filter_reviews(
+    db: Session,
+    book_id: Union[int, None] = None,
+    user_id: Union[int, None] = None,
+    rating: Union[schemas.ReviewRating, None] = None,
+    created_from: Union[datetime, None] = None,
+    created_to: Union[datetime, None] = None,
+) -> Query:
+    """builds query of reviews with filters
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_id (Union[int, None]): filter by book
+        user_id (Union[int, None]): filter by user
+        rating (Union[schemas.ReviewRating, None]): filter by rating
+        created_from (Union[datetime, None]): filter by creation time, inclusive
+        created_to (Union[datetime, None]): filter by creation time, exclusive
+
+    Returns:
+        Query: query of Review model
+    """
+    reviews = db.query(models.Review)
+    if book_id is not None:
+        reviews = reviews.filter(models.Review.book_id == book_id)
+    if user_id is not None:
+        reviews = reviews.filter(models.Review.user_id == user_id)
+    if rating is not None:
+        reviews = reviews.filter(models.Review.rating == rating)
+    if created_from is not None:
+        reviews = reviews.filter(models.Review.created_at >= created_from)
+    if created_to is not None:
+        reviews = reviews.filter(models.Review.created_at < created_to)
+    return reviews
 
 
-def get_reviews(db: Session, offset: int, limit: int) -> List[models.Review]:
-    """gets list of instances of Review model from database
+def get_reviews(
+    db: Session,
+    offset: int,
+    limit: int,
+    book_id: Union[int, None] = None,
+    user_id: Union[int, None] = None,
+    rating: Union[schemas.ReviewRating, None] = None,
+    created_from: Union[datetime, None] = None,
+    created_to: Union[datetime, None] = None,
+    cursor: Union[str, None] = None,
+) -> List[models.Review]:
+    """gets list of instances of Review model from database, newest first
 
     Args:
         db (Session): Manages persistence operations for ORM-mapped objects
         offset (int): Query parameter, the number of items to skip before returning
         limit (int): Query parameter, the number of items returned from a query
+        book_id (Union[int, None]): filter by book
+        user_id (Union[int, None]): filter by user
+        rating (Union[schemas.ReviewRating, None]): filter by rating
+        created_from (Union[datetime, None]): filter by creation time, inclusive
+        created_to (Union[datetime, None]): filter by creation time, exclusive
+        cursor (Union[str, None]): position after which the page starts,
+        returned by previous page
 
     Returns:
         List[models.Review]: returns list of instances of Review model
     """
-    return db.query(models.Review).offset(offset).limit(limit).all()
+    reviews = filter_reviews(
+        db=db,
+        book_id=book_id,
+        user_id=user_id,
+        rating=rating,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    if cursor is not None:
+        reviews = reviews.filter(
+            tuple_(models.Review.created_at, models.Review.id)
+            < tuple_(*decode_cursor(cursor))
+        )
+    return (
+        reviews.order_by(models.Review.created_at.desc(), models.Review.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+
+def count_reviews(
+    db: Session,
+    book_id: Union[int, None] = None,
+    user_id: Union[int, None] = None,
+    rating: Union[schemas.ReviewRating, None] = None,
+    created_from: Union[datetime, None] = None,
+    created_to: Union[datetime, None] = None,
+) -> Tuple[int, bool]:
+    """counts reviews with filters, approximately for broad filters
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        book_id (Union[int, None]): filter by book
+        user_id (Union[int, None]): filter by user
+        rating (Union[schemas.ReviewRating, None]): filter by rating
+        created_from (Union[datetime, None]): filter by creation time, inclusive
+        created_to (Union[datetime, None]): filter by creation time, exclusive
+
+    Returns:
+        Tuple[int, bool]: number of reviews and true if the number is exact
+    """
+    reviews = filter_reviews(
+        db=db,
+        book_id=book_id,
+        user_id=user_id,
+        rating=rating,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    return count_rows(db, reviews, "reviews")
 
 
 def get_review_by_id(db: Session, review_id: int) -> models.Review:
@@ -97,10 +413,28 @@ def get_review_by_id(db: Session, review_id: int) -> models.Review:
     return review
 
 
+def get_reviews_by_ids(
+    db: Session, review_ids: List[int]
+) -> Tuple[List[models.Review], List[int]]:
+    """gets instances of Review model by a list of ids with one IN query
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        review_ids (List[int]): Primary keys of Review model
+
+    Returns:
+        Tuple[List[models.Review], List[int]]: reviews in the requested order
+        and ids of missing reviews
+    """
+    reviews = db.query(models.Review).filter(models.Review.id.in_(review_ids)).all()
+    return order_by_ids(reviews, review_ids)
+
+
 def update_review(
     db: Session, review_id: int, updated_review: schemas.ReviewUpdate, user: User
 ) -> models.Review:
-    """updates instance of Review model from database by its id
+    """updates instance of Review model from database by its id,
+    book rating is updated in the same transaction or enqueued for the worker
 
     Args:
         db (Session): Manages persistence operations for ORM-mapped objects
@@ -125,27 +459,26 @@ def update_review(
             detail="Access denied",
         )
 
-    for key, value in updated_review.dict(exclude_unset=True).items():
+    values = updated_review.dict(exclude_unset=True)
+    for key, value in values.items():
         setattr(review, key, value)
-    db.add(review)
-    db.commit()
-    db.refresh(review)
-    book = db.query(Book).filter(Book.id == review.book_id).first()
-    rating = (
-        db.query(func.avg(models.Review.rating))
-        .filter(models.Review.book_id == review.book_id)
-        .group_by(models.Review.book_id)
-        .first()
-    )
-    book.rating = float(rating[0])
-    db.add(book)
+    review.version = models.Review.version + 1
+    db.flush()
+    outbox.record_change(
+        db, models.Review, outbox.UPDATE, models.Review.id == review_id
+    )
+    # the document of the book embeds the review, also when only text changed
+    recompute_aggregates(db, [review.book_id])
+    invalidation.notify(db, "reviews", [review_id], "books", "reviews")
+    db.expunge(review)
     db.commit()
-    db.refresh(book)
+    get_cache().invalidate("books", "reviews")
     return review
 
 
 def delete_review(db: Session, review_id: int, user: User) -> None:
-    """deletes instance of Review model from database by its id
+    """deletes instance of Review model from database by its id,
+    book rating is updated in the same transaction or enqueued for the worker
 
     Args:
         db (Session): Manages persistence operations for ORM-mapped objects
@@ -154,34 +487,25 @@ def delete_review(db: Session, review_id: int, user: User) -> None:
     Raises:
         HTTPException: Handle no value
     """
-    review = db.query(models.Review).filter(models.Review.id == review_id)
-    if not review.first():
+    review = db.query(models.Review).filter(models.Review.id == review_id).first()
+    if not review:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Review with id {review_id} is not found",
         )
-    if review.first().user_id != user.id:
+    if review.user_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied",
         )
-    book = db.query(Book).filter(Book.id == review.first().book_id).first()
-    book.reviews.remove(review.first())
-    review.delete()
+    outbox.record_change(
+        db, models.Review, outbox.DELETE, models.Review.id == review_id
+    )
+    sync.record_deletion(db, models.Review, models.Review.id == review_id)
+    db.query(models.Review).filter(models.Review.id == review_id).delete(
+        synchronize_session=False
+    )
+    recompute_aggregates(db, [review.book_id])
+    invalidation.notify(db, "reviews", [review_id], "books", "reviews")
     db.commit()
-    if len(book.reviews) >= 1:
-        rating = (
-            db.query(func.avg(models.Review.rating))
-            .filter(models.Review.book_id == review.first().book_id)
-            .group_by(models.Review.book_id)
-            .first()
-        )
-        book.rating = float(rating[0])
-        db.add(book)
-        db.commit()
-        db.refresh(book)
-    if len(book.reviews) == 0:
-        book.rating = 0
-        db.add(book)
-        db.commit()
-        db.refresh(book)
+    get_cache().invalidate("books", "reviews")
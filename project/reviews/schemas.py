@@ -1,9 +1,11 @@
 from datetime import datetime
 from enum import IntEnum
+from typing import List
 from typing import Union
 
 from pydantic import BaseModel
 from pydantic import validator
+from strenum import StrEnum
 
 
 class ReviewRating(IntEnum):
@@ -66,3 +68,34 @@ class Review(ReviewBase):
         """config class for review"""
 
         orm_mode = True
+
+
+class ReviewBulkStatus(StrEnum):
+    """
+    Enum class for status of a review in bulk submission
+    """
+
+    CREATED = "created"
+    BOOK_NOT_FOUND = "book_not_found"
+
+
+class ReviewBulkItem(BaseModel):
+    """
+    ReviewBulkItem schema to show result of one review in bulk submission
+    with its position in the request, status, created review or error detail
+    """
+
+    index: int
+    status: ReviewBulkStatus
+    review: Union[Review, None] = None
+    detail: Union[str, None] = None
+
+
+class ReviewBatch(BaseModel):
+    """
+    ReviewBatch schema to show requested reviews in the requested order and ids
+    of reviews which were not found
+    """
+
+    items: List[Review]
+    missing: List[int]
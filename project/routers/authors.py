@@ -3,17 +3,22 @@ from typing import List
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import Query
+from fastapi import Response
 from fastapi import status
 from sqlalchemy.orm import Session
 
 from project import database
 from project.authors import crud
 from project.authors import schemas
+from project.authors import search
+from project.pagination import set_total_count
+from project.utils import parse_ids
 
 router = APIRouter(prefix="/authors", tags=["Authors"])
 
 
 get_db = database.get_db
+get_read_db = database.get_read_db
 
 
 @router.post("/", response_model=schemas.Author, status_code=status.HTTP_201_CREATED)
@@ -34,27 +39,107 @@ def create_author(
 
 @router.get("/", response_model=List[schemas.Author])
 def get_all_authors(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     offset: int = 0,
     limit: int = Query(default=5, lte=10),
+    total: bool = False,
 ) -> List[schemas.Author]:
     """get method to show all authors
 
     Args:
-        db (Session, optional): Defaults to Depends(get_db).
+        response (Response): response to add the total count to
+        db (Session, optional): Defaults to Depends(get_read_db).
         offset (int, optional): Defaults to 0.
         limit (int, optional): Defaults to Query(default=5, lte=10).
+        total (bool, optional): add X-Total-Count header. Defaults to False.
 
     Returns:
         List[schemas.Author]
     """
+    if total:
+        set_total_count(response, crud.count_authors(db=db))
     return crud.get_authors(db=db, offset=offset, limit=limit)
 
 
+# declared before /{author_id}, which would take "search" for an id
+@router.get("/search", response_model=List[schemas.Author])
+def search_authors(
+    query: str = Query(alias="q", min_length=2, max_length=100),
+    limit: int = Query(default=10, gt=0, le=50),
+    db: Session = Depends(get_read_db),
+) -> List[schemas.Author]:
+    """get method to find authors by full name, tolerates typos
+
+    Args:
+        query (str): part of the name, e.g. "tolkein", sent as q
+        limit (int, optional): Defaults to Query(default=10, gt=0, le=50).
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        List[schemas.Author]: best match first
+    """
+    return search.search_authors(db=db, query=query, limit=limit)
+
+
+@router.get("/autocomplete", response_model=List[schemas.AuthorSuggestion])
+def autocomplete_authors(
+    query: str = Query(alias="q", min_length=1, max_length=100),
+    limit: int = Query(default=10, gt=0, le=50),
+    db: Session = Depends(get_read_db),
+) -> List[schemas.AuthorSuggestion]:
+    """get method to complete author names from their beginnings, served from
+    memory of the worker
+
+    Args:
+        query (str): beginnings of name parts, e.g. "j r tol", sent as q
+        limit (int, optional): Defaults to Query(default=10, gt=0, le=50).
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        List[schemas.AuthorSuggestion]
+    """
+    return [
+        schemas.AuthorSuggestion(id=author_id, name=name)
+        for author_id, name in search.autocomplete_authors(
+            db=db, query=query, limit=limit
+        )
+    ]
+
+
+@router.get("/batch", response_model=schemas.AuthorBatch)
+def get_authors_by_ids(
+    ids: str = Query(min_length=1, example="3,1,2"),
+    db: Session = Depends(get_read_db),
+) -> schemas.AuthorBatch:
+    """get method to show many authors by their ids with one query
+
+    Args:
+        ids (str): comma separated ids, at most BATCH_MAX_IDS
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        schemas.AuthorBatch: authors in the order of ids and ids of missing authors
+    """
+    authors, missing = crud.get_authors_by_ids(db=db, author_ids=parse_ids(ids))
+    return schemas.AuthorBatch(items=authors, missing=missing)
+
+
 @router.get(
     "/{author_id}", response_model=schemas.Author, status_code=status.HTTP_200_OK
 )
-def get_author_by_id(author_id: int, db: Session = Depends(get_db)):
+def get_author_by_id(
+    author_id: int, db: Session = Depends(get_read_db)
+) -> schemas.Author:
+    """get method to show author by its id
+
+    Args:
+        author_id (int)
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        schemas.Author
+    """
     return crud.get_author_by_id(db=db, author_id=author_id)
 
 
@@ -5,17 +5,23 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import Path
 from fastapi import Query
+from fastapi import Response
 from fastapi import status
 from sqlalchemy.orm import Session
 
 from project import database
+from project.books import autocomplete
 from project.books import crud
+from project.books import documents
 from project.books import schemas
+from project.pagination import set_total_count
+from project.utils import parse_ids
 
 router = APIRouter(prefix="/books", tags=["Books"])
 
 
 get_db = database.get_db
+get_read_db = database.get_read_db
 
 
 @router.post("/", response_model=schemas.Book, status_code=status.HTTP_201_CREATED)
@@ -37,23 +43,29 @@ def create_book(
 
 @router.get("/", response_model=List[schemas.Book], status_code=status.HTTP_200_OK)
 def get_all_books(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     genre: Union[schemas.BookGenre, None] = None,
     type: Union[schemas.BookType, None] = None,
     offset: int = 0,
     limit: int = Query(default=10, lte=15),
+    total: bool = False,
 ) -> List[schemas.Book]:
     """get method to show all books
 
     Args:
-        db (Session, optional): Defaults to Depends(get_db).
+        response (Response): response to add the total count to
+        db (Session, optional): Defaults to Depends(get_read_db).
         offset (int, optional):  Defaults to 0.
         limit (int, optional):  Defaults to Query(default=10, lte=15).
         genre (Union[schemas.BookGenre, None]): filter by genre
         type (Union[schemas.BookType, None]): filter by type
+        total (bool, optional): add X-Total-Count header. Defaults to False.
     Returns:
         List[schemas.Book]
     """
+    if total:
+        set_total_count(response, crud.count_books(db=db, genre=genre, type=type))
     return crud.get_books(db=db, offset=offset, limit=limit, genre=genre, type=type)
 
 
@@ -64,7 +76,7 @@ def get_all_books(
 )
 def get_books_with_rating(
     rating: int = Path(title="The rating of the book", ge=1, le=5),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     genre: Union[schemas.BookGenre, None] = None,
     offset: int = 0,
     limit: int = Query(default=3, lte=5),
@@ -73,7 +85,7 @@ def get_books_with_rating(
 
     Args:
         rating (int, optional): Defaults to Path(title="The rating of the book", ge=1, le=5).
-        db (Session, optional): Defaults to Depends(get_db).
+        db (Session, optional): Defaults to Depends(get_read_db).
         offset (int, optional): Defaults to 0.
         limit (int, optional): Defaults to Query(default=3, lte=5).
         genre (Union[schemas.BookGenre, None]): filter by genre
@@ -93,7 +105,7 @@ def get_books_with_rating(
 )
 def get_recommendations(
     genre: schemas.BookGenre,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     offset: int = 0,
     limit: int = Query(default=3, lte=5),
 ) -> List[schemas.Book]:
@@ -101,7 +113,7 @@ def get_recommendations(
 
     Args:
         genre (schemas.BookGenre): _description_
-        db (Session, optional): Defaults to Depends(get_db).
+        db (Session, optional): Defaults to Depends(get_read_db).
         offset (int, optional): Defaults to 0.
         limit (int, optional): Defaults to Query(default=3, lte=5).
 
@@ -111,18 +123,87 @@ def get_recommendations(
     return crud.get_recommendations(db=db, genre=genre, offset=offset, limit=limit)
 
 
+@router.get("/facets", response_model=schemas.BookFacets)
+def get_book_facets(
+    db: Session = Depends(get_read_db),
+    genre: Union[schemas.BookGenre, None] = None,
+    type: Union[schemas.BookType, None] = None,
+) -> schemas.BookFacets:
+    """get method to count books per genre, type, rating and decade,
+    declared before /{book_id}
+
+    Args:
+        db (Session, optional): Defaults to Depends(get_read_db).
+        genre (Union[schemas.BookGenre, None]): filter by genre
+        type (Union[schemas.BookType, None]): filter by type
+
+    Returns:
+        schemas.BookFacets
+    """
+    return crud.count_facets(db=db, genre=genre, type=type)
+
+
+# declared before /{book_id}, which would take "autocomplete" for an id
+@router.get("/autocomplete", response_model=List[schemas.BookSuggestion])
+def autocomplete_books(
+    prefix: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=10, gt=0, le=autocomplete.TOP_BOOKS),
+    db: Session = Depends(get_read_db),
+) -> List[schemas.BookSuggestion]:
+    """get method to complete book titles, best rated first, served from
+    a snapshot of titles shared by workers
+
+    Args:
+        prefix (str): beginning of the title or of one of its words
+        limit (int, optional): Defaults to Query(default=10, gt=0, le=TOP_BOOKS).
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        List[schemas.BookSuggestion]
+    """
+    return [
+        schemas.BookSuggestion(id=book_id, title=title)
+        for book_id, title in autocomplete.get_title_index().complete(
+            db=db, prefix=prefix, limit=limit
+        )
+    ]
+
+
+@router.get("/batch", response_model=schemas.BookBatch)
+def get_books_by_ids(
+    ids: str = Query(min_length=1, example="3,1,2"),
+    db: Session = Depends(get_read_db),
+) -> schemas.BookBatch:
+    """get method to show many books by their ids with a few queries,
+    declared before /{book_id}
+
+    Args:
+        ids (str): comma separated ids, at most BATCH_MAX_IDS
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        schemas.BookBatch: books in the order of ids and ids of missing books
+    """
+    books, missing = crud.get_books_by_ids(db=db, book_ids=parse_ids(ids))
+    return schemas.BookBatch(items=books, missing=missing)
+
+
 @router.get("/{book_id}", response_model=schemas.Book, status_code=status.HTTP_200_OK)
-def get_book_by_id(book_id: int, db: Session = Depends(get_db)) -> schemas.Book:
-    """get method to show book by its id
+def get_book_by_id(book_id: int, db: Session = Depends(get_read_db)) -> Response:
+    """get method to show book by its id, the JSON document rendered after
+    the last change of the book is sent as it is
 
     Args:
         book_id (int)
-        db (Session, optional): Defaults to Depends(get_db).
+        db (Session, optional): Defaults to Depends(get_read_db).
 
     Returns:
-        schemas.Book
+        Response: schemas.Book as JSON
     """
-    return crud.get_book_by_id(db=db, book_id=book_id)
+    return Response(
+        content=documents.get_book_document(db=db, book_id=book_id),
+        media_type="application/json",
+    )
 
 
 @router.get(
@@ -131,13 +212,13 @@ def get_book_by_id(book_id: int, db: Session = Depends(get_db)) -> schemas.Book:
     status_code=status.HTTP_200_OK,
 )
 def get_books_by_author_id(
-    author_id: int, db: Session = Depends(get_db)
+    author_id: int, db: Session = Depends(get_read_db)
 ) -> List[schemas.Book]:
     """get method to show books by their author id
 
     Args:
         author_id (int)
-        db (Session, optional): Defaults to Depends(get_db).
+        db (Session, optional): Defaults to Depends(get_read_db).
 
     Returns:
         List[schemas.Book]
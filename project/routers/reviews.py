@@ -1,14 +1,20 @@
+from datetime import datetime
 from typing import List
+from typing import Union
 
 from fastapi import APIRouter
+from fastapi import Body
 from fastapi import Depends
 from fastapi import Query
+from fastapi import Response
 from fastapi import status
 from sqlalchemy.orm import Session
 
 from project import database
 from project import utils
 from project.models import User
+from project.pagination import encode_cursor
+from project.pagination import set_total_count
 from project.reviews import crud
 from project.reviews import schemas
 
@@ -16,6 +22,7 @@ router = APIRouter(prefix="/reviews", tags=["Reviews"])
 
 
 get_db = database.get_db
+get_read_db = database.get_read_db
 
 
 @router.post("/", response_model=schemas.Review, status_code=status.HTTP_201_CREATED)
@@ -36,34 +43,120 @@ def create_review(
     return crud.create_review(db=db, review=review, user=current_user)
 
 
+@router.post(
+    "/bulk",
+    response_model=List[schemas.ReviewBulkItem],
+    status_code=status.HTTP_201_CREATED,
+)
+def create_reviews(
+    reviews: List[schemas.ReviewCreate] = Body(min_items=1, max_items=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(utils.get_current_user),
+) -> List[schemas.ReviewBulkItem]:
+    """post method to create many reviews at once
+
+    Args:
+        reviews (List[schemas.ReviewCreate]): up to 100 reviews
+        db (Session, optional): Defaults to Depends(get_db).
+
+    Returns:
+        List[schemas.ReviewBulkItem]: status of every review in request order
+    """
+    return crud.create_reviews(db=db, reviews=reviews, user=current_user)
+
+
 @router.get("/", response_model=List[schemas.Review], status_code=status.HTTP_200_OK)
 def get_all_reviews(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
+    book_id: Union[int, None] = None,
+    user_id: Union[int, None] = None,
+    rating: Union[schemas.ReviewRating, None] = None,
+    created_from: Union[datetime, None] = None,
+    created_to: Union[datetime, None] = None,
+    cursor: Union[str, None] = None,
     offset: int = 0,
     limit: int = Query(default=10, lte=15),
+    total: bool = False,
 ) -> List[schemas.Review]:
-    """get method to show all reviews
+    """get method to show all reviews, newest first. Link to the next page
+    is returned in X-Next-Cursor header
 
     Args:
-        db (Session, optional): Defaults to Depends(get_db).
+        response (Response): response to add the next page cursor and total count to
+        db (Session, optional): Defaults to Depends(get_read_db).
+        book_id (Union[int, None]): filter by book
+        user_id (Union[int, None]): filter by user
+        rating (Union[schemas.ReviewRating, None]): filter by rating
+        created_from (Union[datetime, None]): filter by creation time, inclusive
+        created_to (Union[datetime, None]): filter by creation time, exclusive
+        cursor (Union[str, None]): X-Next-Cursor of the previous page
         offset (int, optional): Defaults to 0.
         limit (int, optional): Defaults to Query(default=10, lte=15).
+        total (bool, optional): add X-Total-Count header. Defaults to False.
 
     Returns:
         List[schemas.Review]
     """
-    return crud.get_reviews(db=db, offset=offset, limit=limit)
+    if total:
+        set_total_count(
+            response,
+            crud.count_reviews(
+                db=db,
+                book_id=book_id,
+                user_id=user_id,
+                rating=rating,
+                created_from=created_from,
+                created_to=created_to,
+            ),
+        )
+    reviews = crud.get_reviews(
+        db=db,
+        offset=offset,
+        limit=limit,
+        book_id=book_id,
+        user_id=user_id,
+        rating=rating,
+        created_from=created_from,
+        created_to=created_to,
+        cursor=cursor,
+    )
+    if len(reviews) == limit:
+        last = reviews[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    return reviews
+
+
+# declared before /{review_id}, which would take "batch" for an id
+@router.get("/batch", response_model=schemas.ReviewBatch)
+def get_reviews_by_ids(
+    ids: str = Query(min_length=1, example="3,1,2"),
+    db: Session = Depends(get_read_db),
+) -> schemas.ReviewBatch:
+    """get method to show many reviews by their ids with one query
+
+    Args:
+        ids (str): comma separated ids, at most BATCH_MAX_IDS
+        db (Session, optional): Defaults to Depends(get_read_db).
+
+    Returns:
+        schemas.ReviewBatch: reviews in the order of ids and ids of missing reviews
+    """
+    reviews, missing = crud.get_reviews_by_ids(db=db, review_ids=utils.parse_ids(ids))
+    return schemas.ReviewBatch(items=reviews, missing=missing)
 
 
 @router.get(
     "/{review_id}", response_model=schemas.Review, status_code=status.HTTP_200_OK
 )
-def get_review_by_id(review_id: int, db: Session = Depends(get_db)) -> schemas.Review:
+def get_review_by_id(
+    review_id: int, db: Session = Depends(get_read_db)
+) -> schemas.Review:
     """get method to show review by its id
 
     Args:
         review_id (int)
-        db (Session, optional): Defaults to Depends(get_db).
+        db (Session, optional): Defaults to Depends(get_read_db).
 
     Returns:
         schemas.Review
@@ -0,0 +1,40 @@
+from typing import Union
+
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import Query
+from fastapi import status
+from sqlalchemy.orm import Session
+
+from project import database
+from project import sync
+from project.schemas import SyncPage
+
+router = APIRouter(prefix="/sync", tags=["Sync"])
+
+
+get_primary_read_db = database.get_primary_read_db
+
+
+@router.get("/", response_model=SyncPage, status_code=status.HTTP_200_OK)
+def get_changes(
+    since: Union[str, None] = None,
+    limit: int = Query(default=sync.SYNC_PAGE_SIZE, gt=0, le=1000),
+    # a lagging replica could hide settled rows behind the returned token
+    db: Session = Depends(get_primary_read_db),
+) -> SyncPage:
+    """get method to list ids of authors, books, reviews and users changed
+    or deleted after a sync token, call it again with the returned token
+    while has_more is true. A token older than the retention of tombstones
+    is answered with 410, the client starts over without since
+
+    Args:
+        since (Union[str, None], optional): token returned by the previous call,
+        omitted on the first sync
+        limit (int, optional): Defaults to Query(default=SYNC_PAGE_SIZE, gt=0, le=1000).
+        db (Session, optional): Defaults to Depends(get_primary_read_db).
+
+    Returns:
+        SyncPage
+    """
+    return sync.get_changes(db=db, token=since, limit=limit)
@@ -4,13 +4,16 @@ from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import Query
+from fastapi import Response
 from fastapi import status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from project import database
 from project import models
+from project import rate_limit
 from project import utils
+from project.pagination import set_total_count
 from project.schemas import Token
 from project.users import crud
 from project.users import schemas
@@ -19,10 +22,14 @@ router = APIRouter(prefix="/users", tags=["Users"])
 
 
 get_db = database.get_db
+get_read_db = database.get_read_db
 
 
 @router.post(
-    "/registration", response_model=schemas.User, status_code=status.HTTP_201_CREATED
+    "/registration",
+    response_model=schemas.User,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit.limit_registration)],
 )
 def create_user(
     user: schemas.UserCreate, db: Session = Depends(get_db)
@@ -40,7 +47,12 @@ def create_user(
     return crud.create_user(user=user, db=db)
 
 
-@router.post("/login", response_model=Token, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/login",
+    response_model=Token,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit.limit_login)],
+)
 def login(
     form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
 ) -> Token:
@@ -52,7 +64,8 @@ def login(
         Defaults to Depends(get_db).
 
     Raises:
-        HTTPException: Handle wrong password
+        HTTPException: Handle wrong password, too many attempts are rejected
+        with 429 by rate_limit.limit_login before the password is checked
 
     Returns:
         Token
@@ -69,20 +82,26 @@ def login(
 
 @router.get("/", response_model=List[schemas.User], status_code=status.HTTP_200_OK)
 def get_users(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     offset: int = 0,
     limit: int = Query(default=5, lte=10),
+    total: bool = False,
 ) -> List[schemas.User]:
     """get method to show all users
 
     Args:
-        db (Session, optional)  Defaults to Depends(get_db).
+        response (Response): response to add the total count to
+        db (Session, optional)  Defaults to Depends(get_read_db).
         offset (int, optional)  Defaults to 0.
         limit (int, optional)  Defaults to Query(default=5, lte=10).
+        total (bool, optional): add X-Total-Count header. Defaults to False.
 
     Returns:
         List[schemas.User]
     """
+    if total:
+        set_total_count(response, crud.count_users(db=db))
     return crud.get_users(db=db, offset=offset, limit=limit)
 
 
@@ -1,3 +1,4 @@
+from typing import List
 from typing import Union
 
 from pydantic import BaseModel
@@ -18,3 +19,25 @@ class TokenData(BaseModel):
     """
 
     username: Union[str, None] = None
+
+
+class SyncIds(BaseModel):
+    """
+    SyncIds schema describes ids of rows per entity
+    """
+
+    authors: List[int]
+    books: List[int]
+    reviews: List[int]
+    users: List[int]
+
+
+class SyncPage(BaseModel):
+    """
+    SyncPage schema describes changes after a sync token
+    """
+
+    changed: SyncIds
+    deleted: SyncIds
+    next: str
+    has_more: bool
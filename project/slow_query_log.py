@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any
+from typing import Optional
+from typing import Union
+
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 500))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_SAMPLE_RATE", 1.0))
+SLOW_QUERY_MAX_PER_MINUTE = int(os.environ.get("SLOW_QUERY_MAX_PER_MINUTE", 30))
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_LOG_FILE = os.environ.get("SLOW_QUERY_LOG_FILE", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", 10_000_000))
+SLOW_QUERY_LOG_BACKUP_COUNT = int(os.environ.get("SLOW_QUERY_LOG_BACKUP_COUNT", 5))
+
+MAX_PARAMETER_LENGTH = 200
+
+logger = logging.getLogger(__name__)
+logger.propagate = False
+
+
+class RateLimiter:
+    """
+    RateLimiter allows at most `limit` events per fixed window of `period` seconds
+    """
+
+    def __init__(self, limit: int, period: float = 60.0) -> None:
+        self.limit = limit
+        self.period = period
+        self.window_start = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """checks if one more event fits into the current window
+
+        Returns:
+            bool: returns true if event is allowed
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start >= self.period:
+                self.window_start = now
+                self.count = 0
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+
+rate_limiter = RateLimiter(SLOW_QUERY_MAX_PER_MINUTE)
+
+
+def get_logger() -> logging.Logger:
+    """gets slow query logger, the log file is opened on the first slow query
+
+    Returns:
+        logging.Logger
+    """
+    if not logger.handlers:
+        handler = RotatingFileHandler(
+            SLOW_QUERY_LOG_FILE,
+            maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=SLOW_QUERY_LOG_BACKUP_COUNT,
+            encoding="utf8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+    return logger
+
+
+def get_caller() -> Union[str, None]:
+    """finds the CRUD function which issued the current statement
+
+    Returns:
+        Union[str, None]: e.g. "project.books.crud.get_books_by_rating"
+    """
+    frame = sys._getframe(1)  # pylint: disable=protected-access
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("project.") and module.endswith(".crud"):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def shorten(value: Any) -> Any:
+    """truncates long bound parameters
+
+    Args:
+        value (Any): bound parameter
+
+    Returns:
+        Any: json serializable value
+    """
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    value = str(value)
+    if len(value) > MAX_PARAMETER_LENGTH:
+        return value[:MAX_PARAMETER_LENGTH] + "..."
+    return value
+
+
+def format_parameters(parameters: Any) -> Any:
+    """converts bound parameters to a json serializable value
+
+    Args:
+        parameters (Any): DBAPI parameters, dict or sequence
+
+    Returns:
+        Any
+    """
+    if isinstance(parameters, dict):
+        return {key: shorten(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shorten(value) for value in parameters]
+    return shorten(parameters)
+
+
+def explain(conn, cursor, statement: str, parameters: Any) -> Optional[Any]:
+    """gets the query plan of a SELECT statement without executing it
+
+    Args:
+        conn (Connection): connection the statement was executed on
+        cursor: DBAPI cursor the statement was executed with
+        statement (str): SQL text
+        parameters (Any): bound parameters
+
+    Returns:
+        Optional[Any]: query plan or None
+    """
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    dialect = conn.dialect.name
+    explain_cursor = cursor.connection.cursor()
+    try:
+        if dialect == "postgresql":
+            # a failed EXPLAIN must not abort the transaction of the request
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(
+                    f"EXPLAIN (ANALYZE false, FORMAT JSON) {statement}", parameters
+                )
+                return explain_cursor.fetchone()[0]
+            finally:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+        if dialect == "sqlite":
+            explain_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in explain_cursor.fetchall()]
+        return None
+    except Exception:  # pylint: disable=broad-except
+        logger.debug("could not explain slow query", exc_info=True)
+        return None
+    finally:
+        explain_cursor.close()
+
+
+def capture(
+    conn, cursor, statement: str, parameters: Any, duration: float, executemany: bool
+) -> bool:
+    """writes statement to the slow query log if it is over the threshold,
+    sampled and within the rate limit
+
+    Args:
+        conn (Connection): connection the statement was executed on
+        cursor: DBAPI cursor the statement was executed with
+        statement (str): SQL text
+        parameters (Any): bound parameters
+        duration (float): execution time in seconds
+        executemany (bool): true if statement was executed with many parameter sets
+
+    Returns:
+        bool: returns true if statement was captured
+    """
+    duration_ms = duration * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return False
+    if random.random() >= SLOW_QUERY_SAMPLE_RATE or not rate_limiter.allow():
+        return False
+    entry = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "duration_ms": round(duration_ms, 2),
+        "caller": get_caller(),
+        "statement": statement,
+        "parameters": None if executemany else format_parameters(parameters),
+        "plan": None,
+    }
+    if SLOW_QUERY_EXPLAIN and not executemany:
+        entry["plan"] = explain(conn, cursor, statement, parameters)
+    get_logger().warning(json.dumps(entry, default=str))
+    return True
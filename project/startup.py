@@ -0,0 +1,163 @@
+import logging
+import os
+from functools import lru_cache
+from typing import Union
+
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from anyio import to_thread
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from project import models
+from project.authors.search import warm_author_index
+from project.books.autocomplete import warm_title_index
+from project.database import DB_MAX_OVERFLOW
+from project.database import DB_POOL_SIZE
+from project.database import dispose_engines
+from project.database import engine
+from project.invalidation import start_listener
+from project.invalidation import stop_listener
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+CHECK_SCHEMA_REVISION = os.environ.get("CHECK_SCHEMA_REVISION", "1") == "1"
+# schema created by create_all at import before the app was under migration control
+BASELINE_REVISION = "b676193b9b18"
+
+
+@lru_cache(maxsize=None)
+def get_script_directory() -> ScriptDirectory:
+    """reads migration scripts once per process
+
+    Returns:
+        ScriptDirectory
+    """
+    return ScriptDirectory(MIGRATIONS_DIR)
+
+
+def get_head_revision() -> str:
+    """gets the newest Alembic revision of the code
+
+    Returns:
+        str: revision id
+    """
+    return get_script_directory().get_current_head()
+
+
+def get_alembic_config(bind: Engine) -> Config:
+    """configures Alembic for the migrations of the project and a database
+
+    Args:
+        bind (Engine): database engine
+
+    Returns:
+        Config
+    """
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    url = bind.url.render_as_string(hide_password=False)
+    config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    return config
+
+
+def get_current_revision(bind: Engine) -> Union[str, None]:
+    """gets the Alembic revision the database is stamped with
+
+    Args:
+        bind (Engine): database engine
+
+    Returns:
+        Union[str, None]: revision id or None for a database without migrations
+    """
+    with bind.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+@lru_cache(maxsize=None)
+def check_schema_revision(bind: Engine = engine) -> str:
+    """verifies that the database is migrated to the head revision,
+    checked once per process
+
+    Args:
+        bind (Engine, optional): database engine. Defaults to engine.
+
+    Raises:
+        RuntimeError: Handles database which is not at the head revision
+
+    Returns:
+        str: head revision
+    """
+    head = get_head_revision()
+    current = get_current_revision(bind)
+    if current != head:
+        raise RuntimeError(
+            f"Database revision is {current}, expected {head}. "
+            "Run `python -m project.startup` and `alembic upgrade head`"
+        )
+    logger.info("database is at revision %s", head)
+    return head
+
+
+def configure_threadpool() -> int:
+    """sizes the threadpool of sync handlers to the database connection pool,
+    so threads do not wait for connections and connections do not sit idle
+
+    Returns:
+        int: number of threads
+    """
+    threads = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    to_thread.current_default_thread_limiter().total_tokens = threads
+    return threads
+
+
+async def on_startup() -> None:
+    """startup hook of the application, all heavy work is left to first use
+    or done in the background. It is async, the threadpool is configured
+    for the event loop it runs in"""
+    configure_threadpool()
+    if CHECK_SCHEMA_REVISION:
+        check_schema_revision()
+    warm_author_index()
+    warm_title_index()
+    start_listener()
+
+
+def on_shutdown() -> None:
+    """shutdown hook of the application, stops listening for cache
+    notifications and closes pooled connections"""
+    stop_listener()
+    dispose_engines()
+
+
+def create_schema(bind: Engine = engine) -> None:
+    """puts the database under migration control, used once instead of
+    create_all on every start. Tables of an empty database are created and
+    stamped with the head revision. A schema created by create_all before
+    migrations is stamped with BASELINE_REVISION and migrated to head, as
+    create_all does not add columns to existing tables
+
+    Args:
+        bind (Engine, optional): database engine. Defaults to engine.
+    """
+    if get_current_revision(bind) is not None:
+        logger.info("database is already under migration control")
+        return
+    if not inspect(bind).get_table_names():
+        models.Base.metadata.create_all(bind=bind)
+        with bind.begin() as conn:
+            MigrationContext.configure(conn).stamp(get_script_directory(), "head")
+        logger.info("created tables of an empty database")
+        return
+    config = get_alembic_config(bind)
+    command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+    logger.info("migrated schema without revision from %s", BASELINE_REVISION)
+
+
+if __name__ == "__main__":
+    create_schema()
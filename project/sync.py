@@ -0,0 +1,265 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+from fastapi import HTTPException
+from fastapi import status
+from sqlalchemy import DateTime
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import literal
+from sqlalchemy import select
+from sqlalchemy import true
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from project import models
+
+
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", 100))
+# changes are returned only after this delay, so a transaction which stamped
+# its rows earlier but committed later is not skipped by a client. Rows of a
+# transaction which commits later than this after stamping are never returned
+# to clients past them. Writes of requests cannot take longer than
+# WORKER_TIMEOUT of gunicorn, which kills the worker and rolls them back
+SYNC_SETTLE_SECONDS = float(
+    os.environ.get("SYNC_SETTLE_SECONDS", os.environ.get("WORKER_TIMEOUT", 60))
+)
+# tombstones are pruned after this many days, clients which did not sync
+# for longer have to start over with a full sync
+SYNC_TOMBSTONE_RETENTION_DAYS = float(
+    os.environ.get("SYNC_TOMBSTONE_RETENTION_DAYS", 30)
+)
+
+ENTITIES = {
+    "authors": models.Author,
+    "books": models.Book,
+    "reviews": models.Review,
+    "users": models.User,
+}
+# stream of tombstones of all entities
+DELETED = "deleted"
+
+# timestamp and id of the last returned row, None id means the whole timestamp
+Position = Tuple[datetime, Union[int, None]]
+
+
+def record_deletion(db: Session, model, *criteria) -> None:
+    """writes tombstones for rows of model matching criteria with one
+    INSERT ... SELECT in the transaction of the change. Call it before
+    the rows are deleted, including rows removed by cascades
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        model: Author, Book, Review or User model
+        criteria: filters of deleted rows, e.g. Review.book_id == 1
+    """
+    rows = select(
+        literal(model.__tablename__), model.id, literal(datetime.now(), DateTime)
+    ).where(*criteria)
+    db.execute(
+        insert(models.Tombstone).from_select(
+            ["entity", "entity_id", "deleted_at"], rows
+        )
+    )
+
+
+def retention_horizon() -> datetime:
+    """gets the time before which tombstones may be pruned
+
+    Returns:
+        datetime
+    """
+    return datetime.now() - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def prune_tombstones(db: Session) -> int:
+    """deletes tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS,
+    commits the caller's transaction
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+
+    Returns:
+        int: number of deleted tombstones
+    """
+    result = db.execute(
+        delete(models.Tombstone).where(
+            models.Tombstone.deleted_at < retention_horizon()
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def encode_token(positions: Dict[str, Position]) -> str:
+    """encodes positions of all streams as an opaque sync token
+
+    Args:
+        positions (Dict[str, Position]): position per entity and DELETED
+
+    Returns:
+        str: url safe token
+    """
+    value = {
+        stream: [timestamp.isoformat(), row_id]
+        for stream, (timestamp, row_id) in positions.items()
+    }
+    data = json.dumps(value, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_token(token: str) -> Dict[str, Position]:
+    """decodes token created by encode_token
+
+    Args:
+        token (str): url safe token
+
+    Raises:
+        HTTPException: Handles invalid token
+
+    Returns:
+        Dict[str, Position]: position per entity and DELETED
+    """
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token.encode()))
+        positions = {}
+        for stream, (timestamp, row_id) in value.items():
+            if stream not in ENTITIES and stream != DELETED:
+                raise ValueError(stream)
+            if row_id is not None:
+                row_id = int(row_id)
+            positions[stream] = (datetime.fromisoformat(timestamp), row_id)
+        return positions
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token"
+        ) from error
+
+
+def after(timestamp_column, id_column, position: Union[Position, None]):
+    """filter of rows following position in (timestamp, id) order
+
+    Args:
+        timestamp_column: updated_at or deleted_at column
+        id_column: primary key column
+        position (Union[Position, None]): None for the first sync
+
+    Returns:
+        ColumnElement
+    """
+    if position is None:
+        return true()
+    timestamp, row_id = position
+    if row_id is None:
+        return timestamp_column > timestamp
+    return tuple_(timestamp_column, id_column) > tuple_(timestamp, row_id)
+
+
+def read_stream(
+    db: Session,
+    columns: tuple,
+    position: Union[Position, None],
+    settled: datetime,
+    limit: int,
+) -> Tuple[list, Union[Position, None], bool]:
+    """reads the next page of one stream, oldest change first
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        columns (tuple): updated_at or deleted_at column, primary key column
+        and other returned columns
+        position (Union[Position, None]): None for the first sync
+        settled (datetime): rows stamped later are left for the next call
+        limit (int): page size
+
+    Returns:
+        Tuple[list, Union[Position, None], bool]: rows, position of the next
+        page and true if the page is full and more rows may follow
+    """
+    timestamp_column, id_column = columns[:2]
+    rows = (
+        db.query(*columns)
+        .filter(after(timestamp_column, id_column, position))
+        .filter(timestamp_column <= settled)
+        .order_by(timestamp_column, id_column)
+        .limit(limit)
+        .all()
+    )
+    if len(rows) == limit:
+        return rows, (rows[-1][0], rows[-1][1]), True
+    # every row stamped up to settled is committed and returned by now
+    return rows, (settled, None), False
+
+
+def check_retention(position: Union[Position, None]) -> None:
+    """checks that no tombstone after position could have been pruned
+
+    Args:
+        position (Union[Position, None]): tombstones position of the token
+
+    Raises:
+        HTTPException: Handles token older than the retention of tombstones
+    """
+    if position is None or position[0] < retention_horizon():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, full resync required",
+        )
+
+
+def get_changes(db: Session, token: Union[str, None], limit: int) -> dict:
+    """gets ids of rows changed and deleted after token, every entity and the
+    tombstones are paged separately by (timestamp, id), so a page has at
+    most limit ids per entity and limit deleted ids in total
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        token (Union[str, None]): returned by the previous call, None for
+        the first sync, which returns every row
+        limit (int): page size of every stream
+
+    Returns:
+        dict: changed and deleted ids per entity, token of the next call and
+        true if it should be called right away for more changes
+    """
+    positions = decode_token(token) if token is not None else {}
+    if token is not None:
+        check_retention(positions.get(DELETED))
+    settled = datetime.now() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    changed: Dict[str, List[int]] = {}
+    deleted: Dict[str, List[int]] = {entity: [] for entity in ENTITIES}
+    next_positions: Dict[str, Position] = {}
+    has_more = False
+
+    for entity, model in ENTITIES.items():
+        rows, next_positions[entity], full = read_stream(
+            db, (model.updated_at, model.id), positions.get(entity), settled, limit
+        )
+        changed[entity] = [row_id for _, row_id in rows]
+        has_more = has_more or full
+
+    tombstone = models.Tombstone
+    rows, next_positions[DELETED], full = read_stream(
+        db,
+        (tombstone.deleted_at, tombstone.id, tombstone.entity, tombstone.entity_id),
+        positions.get(DELETED),
+        settled,
+        limit,
+    )
+    for _, _, entity, entity_id in rows:
+        deleted[entity].append(entity_id)
+
+    return {
+        "changed": changed,
+        "deleted": deleted,
+        "next": encode_token(next_positions),
+        "has_more": has_more or full,
+    }
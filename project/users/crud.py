@@ -1,10 +1,18 @@
 from typing import List
+from typing import Tuple
 
 from fastapi import HTTPException
 from fastapi import status
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm import Session
 
+from project import invalidation
 from project import models
+from project import outbox
+from project import sync
+from project.cache import get_cache
+from project.pagination import count_rows
+from project.reviews.crud import recompute_aggregates
 from project.users import schemas
 from project.utils import get_password_hash
 
@@ -35,7 +43,10 @@ def create_user(user: schemas.UserCreate, db: Session) -> models.User:
     hashed_pw = get_password_hash(user.password)
     new_user = models.User(username=user.username, email=user.email, password=hashed_pw)
     db.add(new_user)
+    db.flush()
+    invalidation.notify(db, "users", [new_user.id], "users")
     db.commit()
+    get_cache().invalidate("users")
     db.refresh(new_user)
     return new_user
 
@@ -73,10 +84,28 @@ def get_users(db: Session, offset: int, limit: int) -> List[models.User]:
     Returns:
         List[models.User]: returns list of instances of User model
     """
-    users = db.query(models.User).offset(offset).limit(limit).all()
+    users = (
+        db.query(models.User)
+        .options(selectinload(models.User.reviews))
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
     return users
 
 
+def count_users(db: Session) -> Tuple[int, bool]:
+    """counts users, approximately for large tables
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+
+    Returns:
+        Tuple[int, bool]: number of users and true if the number is exact
+    """
+    return count_rows(db, db.query(models.User), "users")
+
+
 def update_user(
     db: Session, current_user: models.User, updated_user: schemas.UserUpdate
 ) -> models.User:
@@ -126,7 +155,9 @@ def update_user(
         hashed_pw = get_password_hash(updated_user.password)
         c_user.password = hashed_pw
     db.add(c_user)
+    invalidation.notify(db, "users", [c_user.id], "users")
     db.commit()
+    get_cache().invalidate("users")
     db.refresh(c_user)
     return c_user
 
@@ -139,5 +170,22 @@ def delete_user(db: Session, current_user: models.User) -> None:
         current_user (models.User): current user model
     """
     user = db.query(models.User).filter(models.User.username == current_user.username)
+    reviewed = [
+        book_id
+        for book_id, in db.query(models.Review.book_id)
+        .filter(models.Review.user_id == current_user.id)
+        .distinct()
+    ]
+    # reviews go with the user by the foreign key cascade
+    outbox.record_change(
+        db, models.Review, outbox.DELETE, models.Review.user_id == current_user.id
+    )
+    sync.record_deletion(db, models.Review, models.Review.user_id == current_user.id)
+    sync.record_deletion(db, models.User, models.User.id == current_user.id)
     user.delete()
+    if reviewed:
+        # ratings, versions and documents of the books without the reviews
+        recompute_aggregates(db, reviewed)
+    invalidation.notify(db, "users", [current_user.id], "users", "reviews", "books")
     db.commit()
+    get_cache().invalidate("users", "reviews", "books")
@@ -1,11 +1,15 @@
 import os
+import re
+import unicodedata
 from datetime import datetime
 from datetime import timedelta
+from functools import lru_cache
 from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
 from typing import Union
 
-from dotenv import find_dotenv
-from dotenv import load_dotenv
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
@@ -21,11 +25,94 @@ from project.models import User
 from project.users.schemas import UserRank
 
 
-load_dotenv(find_dotenv())
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+WORD_PATTERN = re.compile(r"\w+")
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
+# most ids a batch endpoint fetches at once
+BATCH_MAX_IDS = int(os.environ.get("BATCH_MAX_IDS", 100))
+
+
+def normalize(value: str) -> str:
+    """lowercases value and strips accents, so "Émile" matches "emile"
+
+    Args:
+        value (str): e.g. author name, book title or query
+
+    Returns:
+        str
+    """
+    value = value.lower()
+    if value.isascii():
+        return value
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(value: str) -> List[str]:
+    """splits normalized value into words
+
+    Args:
+        value (str): e.g. author name, book title or query
+
+    Returns:
+        List[str]
+    """
+    return WORD_PATTERN.findall(normalize(value))
+
+
+def parse_ids(ids: str) -> List[int]:
+    """parses comma separated ids of a batch request, duplicates are dropped
+
+    Args:
+        ids (str): e.g. "3,1,2"
+
+    Raises:
+        HTTPException: Handles invalid or too many ids
+
+    Returns:
+        List[int]: ids in the requested order
+    """
+    try:
+        parsed = list(dict.fromkeys(int(value) for value in ids.split(",")))
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be comma separated integers",
+        ) from error
+    if len(parsed) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BATCH_MAX_IDS} ids can be requested at once",
+        )
+    return parsed
+
+
+def order_by_ids(rows: list, ids: List[int]) -> Tuple[list, List[int]]:
+    """puts rows fetched by an IN query into the requested order
+
+    Args:
+        rows (list): model instances with an id attribute
+        ids (List[int]): requested ids
+
+    Returns:
+        Tuple[list, List[int]]: found rows and ids which were not found
+    """
+    found: Dict[int, Any] = {row.id: row for row in rows}
+    return (
+        [found[row_id] for row_id in ids if row_id in found],
+        [row_id for row_id in ids if row_id not in found],
+    )
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    """builds bcrypt context on first use instead of at import
+
+    Returns:
+        CryptContext
+    """
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -38,7 +125,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         bool: returns true or false
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
@@ -50,12 +137,21 @@ def get_password_hash(password: str) -> str:
     Returns:
         str: hashed password
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 minutes
-JWT_SECRET_KEY = os.environ["JWT_SECRET_KEY"]  # secrets.token_hex(30)
+
+
+@lru_cache(maxsize=None)
+def get_jwt_secret_key() -> str:
+    """reads JWT secret key from environment on first use
+
+    Returns:
+        str: secret key, e.g. secrets.token_hex(30)
+    """
+    return os.environ["JWT_SECRET_KEY"]
 
 
 def create_access_token(subject: Union[str, Any], expires_delta: int = None) -> str:
@@ -75,7 +171,7 @@ def create_access_token(subject: Union[str, Any], expires_delta: int = None) ->
             minutes=ACCESS_TOKEN_EXPIRE_MINUTES
         )
     to_encode = {"exp": expires_delta, "sub": str(subject)}
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, get_jwt_secret_key(), ALGORITHM)
     return encoded_jwt
 
 
@@ -100,7 +196,7 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, get_jwt_secret_key(), algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return credentials_exception
@@ -141,6 +237,6 @@ def get_user_rank(reviews_number: int):
         rank = UserRank.KYU_2
     elif reviews_number < 90:
         rank = UserRank.KYU_1
-    elif reviews_number > 100:
+    else:
         rank = UserRank.DAN_1
     return rank
@@ -0,0 +1,155 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+from typing import Union
+
+from sqlalchemy.orm import Session
+
+from project import invalidation
+from project import jobs
+from project import outbox
+from project import sync
+from project.books import documents
+from project.cache import get_cache
+from project.database import SessionLocal
+from project.reviews.crud import update_book_rating
+from project.reviews.crud import update_user_rank
+
+
+logger = logging.getLogger(__name__)
+
+AGGREGATE_JOBS_POLL_SECONDS = float(os.environ.get("AGGREGATE_JOBS_POLL_SECONDS", 1))
+# how often consumed outbox events and expired tombstones of delta sync are pruned
+PRUNE_SECONDS = float(os.environ.get("PRUNE_SECONDS", 3600))
+
+
+def process_jobs(db: Session, batch_size: int = jobs.AGGREGATE_JOBS_BATCH_SIZE) -> int:
+    """claims a batch of jobs and recomputes their targets in one transaction,
+    ratings of all claimed books are recomputed with a single UPDATE,
+    then documents of these books are rendered
+
+    Args:
+        db (Session): Manages persistence operations for ORM-mapped objects
+        batch_size (int, optional): Defaults to jobs.AGGREGATE_JOBS_BATCH_SIZE.
+
+    Returns:
+        int: number of processed jobs
+    """
+    claimed = jobs.claim_jobs(db, batch_size)
+    if not claimed:
+        db.rollback()
+        return 0
+    targets = defaultdict(list)
+    for kind, target_id in claimed:
+        targets[kind].append(target_id)
+    if targets[jobs.BOOK_RATING]:
+        update_book_rating(db, targets[jobs.BOOK_RATING])
+    for user_id in targets[jobs.USER_RANK]:
+        update_user_rank(db, user_id)
+    rendered = set(targets[jobs.BOOK_RATING]) | set(targets[jobs.BOOK_DOCUMENT])
+    if rendered:
+        documents.render_documents(db, list(rendered))
+    invalidation.notify(db, "books", targets[jobs.BOOK_RATING], "books", "users")
+    db.commit()
+    get_cache().invalidate("books", "users")
+    logger.info(
+        "recomputed %d book ratings, %d user ranks and %d book documents",
+        len(targets[jobs.BOOK_RATING]),
+        len(targets[jobs.USER_RANK]),
+        len(rendered),
+    )
+    return len(claimed)
+
+
+def prune(session_factory: Callable[[], Session]) -> None:
+    """deletes consumed outbox events and expired tombstones, each in its own
+    transaction, a failure is retried on the next prune
+
+    Args:
+        session_factory (Callable[[], Session])
+    """
+    for name, prune_rows in (
+        ("outbox events", outbox.prune),
+        ("tombstones", sync.prune_tombstones),
+    ):
+        db = session_factory()
+        try:
+            logger.info("pruned %d %s", prune_rows(db), name)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("could not prune %s", name)
+            db.rollback()
+        finally:
+            db.close()
+
+
+def run(
+    session_factory: Callable[[], Session] = SessionLocal,
+    batch_size: int = jobs.AGGREGATE_JOBS_BATCH_SIZE,
+    poll_seconds: float = AGGREGATE_JOBS_POLL_SECONDS,
+    stop: Union[threading.Event, None] = None,
+) -> None:
+    """processes jobs until stopped, waits poll_seconds when the queue is empty,
+    prunes the outbox and tombstones every PRUNE_SECONDS
+
+    Args:
+        session_factory (Callable[[], Session], optional): Defaults to SessionLocal.
+        batch_size (int, optional): Defaults to jobs.AGGREGATE_JOBS_BATCH_SIZE.
+        poll_seconds (float, optional): Defaults to AGGREGATE_JOBS_POLL_SECONDS.
+        stop (Union[threading.Event, None], optional): set to finish
+        after the current batch
+    """
+    stop = stop or threading.Event()
+    pruned_at = None
+    while not stop.is_set():
+        if pruned_at is None or time.monotonic() - pruned_at > PRUNE_SECONDS:
+            prune(session_factory)
+            pruned_at = time.monotonic()
+        db = session_factory()
+        try:
+            processed = process_jobs(db, batch_size)
+        except Exception:  # pylint: disable=broad-except
+            # claimed jobs are released by the rollback and retried
+            logger.exception("could not process aggregate jobs")
+            db.rollback()
+            processed = 0
+        finally:
+            db.close()
+        if processed < batch_size:
+            stop.wait(poll_seconds)
+
+
+def main() -> None:
+    """entrypoint of the worker, stops gracefully on SIGINT and SIGTERM"""
+    parser = argparse.ArgumentParser(
+        description="Recompute book ratings and user ranks, render book documents"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=jobs.AGGREGATE_JOBS_BATCH_SIZE
+    )
+    parser.add_argument("--poll", type=float, default=AGGREGATE_JOBS_POLL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.once:
+        db = SessionLocal()
+        try:
+            while process_jobs(db, args.batch_size):
+                pass
+        finally:
+            db.close()
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run(batch_size=args.batch_size, poll_seconds=args.poll, stop=stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@ from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
-from ..db_for_tests import override_get_db, engine
-from project.database import Base
+from ..db_for_tests import override_get_db
+from ..db_for_tests import reset_tables
+from ..db_for_tests import TestingSessionLocal
+from project.authors.search import get_author_index
 from project.models import Author
 
 db = next(override_get_db())
@@ -14,8 +16,7 @@ db = next(override_get_db())
 @pytest.fixture(autouse=True, scope="class")
 def create_dummy_authors():
     """fixture to execute asserts before and after a test is run"""
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    reset_tables()
     author = Author(
         first_name="Averell",
         last_name="Povah",
@@ -99,6 +100,18 @@ class TestAuthor:
         assert response.status_code == 404
         assert response.json()["detail"] == f"Author with id {author_id} is not found"
 
+    def test_get_authors_by_ids(self):
+        """tests get method to show many authors by their ids"""
+        response = client.get("/authors/batch", params={"ids": "2,10,1,2"})
+        assert response.status_code == 200
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        batch = response.json()
+        assert [author["id"] for author in batch["items"]] == [2, 1]
+        assert batch["items"][1]["first_name"] == "Averell"
+        assert batch["missing"] == [10]
+        response = client.get("/authors/batch", params={"ids": "1,a"})
+        assert response.status_code == 400
+
     def test_update_author(self):
         """tests put method to show author by its id"""
         author_id = 1
@@ -126,3 +139,51 @@ class TestAuthor:
         response = client.delete(f"/authors/{author_id}")
         assert response.status_code == 404
         assert response.json()["detail"] == f"Author with id {author_id} is not found"
+
+
+@pytest.mark.usefixtures("create_dummy_authors")
+class TestAuthorSearch:
+    """tests fuzzy search and autocomplete of authors"""
+
+    def test_search_authors(self):
+        """tests get method to find authors by name with a typo"""
+        with TestingSessionLocal() as session:
+            get_author_index().rebuild(session)
+        response = client.get("/authors/search", params={"q": "povha"})
+        assert response.status_code == 200
+        assert [author["last_name"] for author in response.json()] == ["Povah"]
+
+        response = client.get("/authors/search", params={"q": "qwerty"})
+        assert response.status_code == 200
+        assert response.json() == []
+
+        response = client.get("/authors/search", params={"q": "a"})
+        assert response.status_code == 422
+
+    def test_autocomplete_authors(self):
+        """tests that autocomplete follows writes of authors"""
+        with TestingSessionLocal() as session:
+            get_author_index().rebuild(session)
+        response = client.get("/authors/autocomplete", params={"q": "a pov"})
+        assert response.status_code == 200
+        assert response.json() == [{"id": 1, "name": "Averell Astrid Povah"}]
+
+        response = client.put("/authors/1", json={"last_name": "Ševčík"})
+        assert response.status_code == 202
+        response = client.get("/authors/autocomplete", params={"q": "sevc"})
+        assert response.json() == [{"id": 1, "name": "Averell Astrid Ševčík"}]
+        response = client.get("/authors/autocomplete", params={"q": "pov"})
+        assert response.json() == []
+
+        response = client.post("/authors/", json={"first_name": "Skye"})
+        new_id = response.json()["id"]
+        response = client.get("/authors/autocomplete", params={"q": "sk"})
+        assert response.json() == [
+            {"id": 2, "name": "Skipp Bennoe"},
+            {"id": new_id, "name": "Skye"},
+        ]
+
+        response = client.delete("/authors/2")
+        assert response.status_code == 204
+        response = client.get("/authors/autocomplete", params={"q": "sk"})
+        assert response.json() == [{"id": new_id, "name": "Skye"}]
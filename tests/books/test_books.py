@@ -1,33 +1,48 @@
 import json
+import os
+import time
+from collections import Counter
 
 import pytest
 from fastapi.testclient import TestClient
 
 from ..db_for_tests import engine
 from ..db_for_tests import override_get_db
+from ..db_for_tests import reset_tables
 from main import app
+from project import jobs
+from project.books import autocomplete
+from project.books.autocomplete import get_title_index
+from project.books.autocomplete import TitleIndex
+from project.books.autocomplete import TitleSnapshot
+from project.books.autocomplete import write_snapshot
 from project.books.schemas import BookGenre
-from project.database import Base
 from project.models import Author
 from project.models import Book
+from project.models import BookDocument
 from project.models import Review
 from project.models import User
 from project.reviews.crud import create_review
+from project.reviews.crud import update_review
 from project.reviews.schemas import ReviewCreate
 from project.reviews.schemas import ReviewRating
+from project.reviews.schemas import ReviewUpdate
+from project.utils import BATCH_MAX_IDS
 from project.utils import get_password_hash
+from project.worker import process_jobs
 
 
 client = TestClient(app)
 
+BOOKS_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "books.json")
+
 db = next(override_get_db())
 
 
 @pytest.fixture(autouse=True, scope="class")
 def create_dummy_books():
     """fixture to execute asserts before and after a test is run"""
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    reset_tables()
 
     new_user = User(
         username="john123",
@@ -58,7 +73,7 @@ def create_dummy_books():
     db.add(author2)
     db.commit()
 
-    with open("/app/books.json", encoding="utf8") as file:
+    with open(BOOKS_FILE, encoding="utf8") as file:
         books = json.load(file)
     for book in books[:10]:
         new_book = Book(
@@ -186,6 +201,12 @@ class TestBook:
         assert len(books) == 2
         assert books[0]["id"] == 7
         assert books[1]["id"] == 8
+        assert "X-Total-Count" not in response.headers
+        # with total count
+        response = client.get("/books/", params={"limit": 2, "total": True})
+        assert response.status_code == 200, response.text
+        assert response.headers["X-Total-Count"] == "10"
+        assert response.headers["X-Total-Count-Exact"] == "true"
 
     def test_books_with_rating(self):
         """tests get method to show books with specific rating"""
@@ -234,6 +255,21 @@ class TestBook:
         assert response.status_code == 404
         assert response.json()["detail"] == f"Book with id {book_id} is not found"
 
+    def test_get_books_by_ids(self):
+        """tests get method to show many books by their ids with a few queries"""
+        response = client.get("/books/batch", params={"ids": "3,12,1"})
+        assert response.status_code == 200
+        # books, their authors and their reviews
+        assert 'desc="3 queries"' in response.headers["Server-Timing"]
+        batch = response.json()
+        assert [book["id"] for book in batch["items"]] == [3, 1]
+        assert batch["items"][1]["title"] == "Thalasseus maximus"
+        assert batch["items"][0] == client.get("/books/3").json()
+        assert batch["missing"] == [12]
+        ids = ",".join(str(book_id) for book_id in range(1, BATCH_MAX_IDS + 2))
+        response = client.get("/books/batch", params={"ids": ids})
+        assert response.status_code == 400
+
     def test_get_recommendation(self):
         """tests get method to show book with specific genre
         with rating more than average rating in this genre"""
@@ -272,6 +308,15 @@ class TestBook:
         books = response.json()
         assert len(books) == 10
 
+    def test_query_count(self):
+        """tests that lists of books load authors and reviews in batches"""
+        response = client.get("/books/", params={"limit": 15})
+        assert response.status_code == 200
+        assert 'desc="3 queries"' in response.headers["Server-Timing"]
+        response = client.get("/books/authors/1")
+        assert response.status_code == 200
+        assert 'desc="4 queries"' in response.headers["Server-Timing"]
+
     def test_update_book(self):
         """tests put method to update book by its id"""
 
@@ -303,3 +348,200 @@ class TestBook:
         response = client.put(f"/books/{book_id}", json=updated_book)
         assert response.status_code == 404
         assert response.json()["detail"] == "Authors is not found"
+        # the book keeps its authors
+        response = client.get(f"/books/{book_id}")
+        assert [author["id"] for author in response.json()["authors"]] == [2]
+        assert response.json()["title"] == "updated title"
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestBookAutocomplete:
+    """tests autocomplete of book titles"""
+
+    def test_autocomplete_books(self):
+        """tests that suggestions are ranked and follow writes of books"""
+        get_title_index().rebuild(engine, time.time())
+
+        def suggest(prefix):
+            response = client.get("/books/autocomplete", params={"prefix": prefix})
+            assert response.status_code == 200
+            assert 'desc="0 queries"' in response.headers["Server-Timing"]
+            return [book["id"] for book in response.json()]
+
+        # rated 5 and 5 first, then 2 and 2
+        assert suggest("P") == [4, 3]
+        # title or any of its words, every book once
+        assert suggest("vi") == [7, 8]
+        assert suggest("dendrocygna vid") == [8]
+        assert suggest("xyz") == []
+
+        payload = {
+            "title": "Vireo olivaceus",
+            "year": 2000,
+            "pages": 200,
+            "genre": "Horror",
+            "type": "Paper",
+            "author_id": [2],
+        }
+        response = client.post("/books/", json=payload)
+        assert response.status_code == 201
+        new_id = response.json()["id"]
+        assert suggest("vi") == [7, 8, new_id]
+
+        response = client.put("/books/7", json={"title": "Lama glama"})
+        assert response.status_code == 202
+        assert suggest("vi") == [8, new_id]
+        assert suggest("lama") == [7]
+
+        response = client.delete("/books/8")
+        assert response.status_code == 204
+        assert suggest("vi") == [new_id]
+
+    def test_missing_snapshot(self, tmp_path, monkeypatch):
+        """tests that lookups without a snapshot read the database and build
+        it in the background"""
+        monkeypatch.setattr(autocomplete, "BOOK_TITLES_REBUILD_DELAY", 0)
+        index = TitleIndex(str(tmp_path / "titles.idx"))
+        db = next(override_get_db())
+        # no file to load, the first lookup schedules the build
+        found = index.complete(db, "vi", 10)
+        # the build may be done and the thread gone already
+        thread = index.thread
+        assert found
+        if thread is not None:
+            thread.join()
+        assert index.snapshot is not None
+        assert index.complete(db, "vi", 10) == found
+        db.close()
+
+    def test_heavy_prefixes(self, tmp_path):
+        """tests that stored best books of common prefixes match a scan"""
+        books = [
+            (book_id, f"{word} {book_id}", book_id % 5, book_id % 7)
+            for book_id, word in enumerate(["the", "then", "tea", "zoo"] * 50, 1)
+        ]
+        scanned, stored = str(tmp_path / "scanned.idx"), str(tmp_path / "stored.idx")
+        write_snapshot(books, scanned, time.time(), heavy_prefix_keys=10_000)
+        write_snapshot(books, stored, time.time(), heavy_prefix_keys=3)
+        scanned, stored = TitleSnapshot(scanned), TitleSnapshot(stored)
+        assert not scanned.parts["heavy_keys"]
+        assert stored.parts["heavy_keys"]
+        for prefix in (b"t", b"th", b"the", b"then", b"te", b"z", b"1", b"12", b"x"):
+            assert scanned.entries(prefix, 10) == stored.entries(prefix, 10)
+        best = [stored.book(entry) for entry in stored.entries(b"t", 3)]
+        assert [score for _, _, score in best] == sorted(
+            (score for _, _, score in best), reverse=True
+        )
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestBookFacets:
+    """tests counts of books per facet"""
+
+    def test_book_facets(self):
+        """tests that facets are counted in one query and cached without filters"""
+        with open(BOOKS_FILE, encoding="utf8") as file:
+            books = json.load(file)[:10]
+        response = client.get("/books/facets")
+        assert response.status_code == 200
+        facets = response.json()
+        assert facets["total"] == 10
+        assert facets["genre"] == dict(Counter(book["genre"] for book in books))
+        assert facets["type"] == dict(Counter(book["type"] for book in books))
+        assert facets["decade"] == dict(
+            Counter(str(book["year"] - book["year"] % 10) for book in books)
+        )
+        # ratings 2.5, 4, 2 and 5, the rest has no reviews
+        assert facets["rating"] == {"0": 6, "2": 2, "4": 1, "5": 1}
+
+        response = client.get("/books/facets")
+        assert response.json() == facets
+        assert 'desc="0 queries"' in response.headers["Server-Timing"]
+
+        genre = books[0]["genre"]
+        response = client.get("/books/facets", params={"genre": genre})
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        filtered = response.json()
+        assert filtered["genre"] == {genre: facets["genre"][genre]}
+        assert filtered["total"] == sum(filtered["type"].values())
+
+        create_review(
+            db,
+            user=db.query(User).first(),
+            review=ReviewCreate(text="wow", rating=ReviewRating.FIVE, book_id=5),
+        )
+        response = client.get("/books/facets")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        assert response.json()["rating"] == {"0": 5, "2": 2, "4": 1, "5": 2}
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestBookDocuments:
+    """tests book details served from stored documents"""
+
+    def test_book_document(self, monkeypatch):
+        """tests that documents are read with one query and follow changes"""
+        # start without documents, the ones of the reviews of the fixture
+        # are rendered by their pending jobs first
+        while process_jobs(db):
+            pass
+        db.query(BookDocument).delete()
+        db.commit()
+        response = client.get("/books/1")
+        assert response.status_code == 200
+        # rendered on every read until a write stores it
+        assert 'desc="4 queries"' in response.headers["Server-Timing"]
+        book = response.json()
+        assert (
+            book == client.get("/books/batch", params={"ids": "1"}).json()["items"][0]
+        )
+        response = client.get("/books/1")
+        assert 'desc="4 queries"' in response.headers["Server-Timing"]
+        assert response.json() == book
+
+        response = client.put(
+            "/books/1",
+            json={"title": "new title", "year": 1999, "genre": BookGenre.FANTASY},
+        )
+        assert response.status_code == 202
+        response = client.get("/books/1")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        assert response.json()["title"] == "new title"
+
+        payload = {"first_name": "John", "last_name": "Doe"}
+        assert client.put("/authors/1", json=payload).status_code == 202
+        response = client.get("/books/1")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        assert response.json()["authors"][0]["first_name"] == "John"
+
+        user = db.query(User).first()
+        create_review(
+            db,
+            user=user,
+            review=ReviewCreate(text="fresh", rating=ReviewRating.FIVE, book_id=1),
+        )
+        # rendered on read until the worker stores the document
+        response = client.get("/books/1")
+        assert 'desc="4 queries"' in response.headers["Server-Timing"]
+        assert "fresh" in [review["text"] for review in response.json()["reviews"]]
+        assert process_jobs(db) == 1
+        response = client.get("/books/1")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        assert "fresh" in [review["text"] for review in response.json()["reviews"]]
+
+        fresh = db.query(Review).filter(Review.text == "fresh").one()
+        update_review(db, fresh.id, ReviewUpdate(text="edited"), user)
+        assert process_jobs(db) == 1
+        response = client.get("/books/1")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        assert "edited" in [review["text"] for review in response.json()["reviews"]]
+
+        # the rating is recomputed later, the stale document is dropped
+        monkeypatch.setattr(jobs, "AGGREGATES_DEFERRED", True)
+        create_review(
+            db,
+            user=user,
+            review=ReviewCreate(text="later", rating=ReviewRating.ONE, book_id=1),
+        )
+        response = client.get("/books/1")
+        assert "later" in [review["text"] for review in response.json()["reviews"]]
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import event
+
+from main import app
+from project.books.autocomplete import get_title_index
+from project.database import Base
+from project.database import get_db
+from project.database import get_primary_read_db
+from project.database import get_read_db
+from tests.db_for_tests import engine
+from tests.db_for_tests import override_get_db
+from tests.db_for_tests import TestingSessionLocal
+
+
+@pytest.fixture(autouse=True, scope="session")
+def create_schema():
+    """creates tables once per run, fixtures of test classes only empty them"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def title_snapshot(tmp_path_factory):
+    """keeps the snapshot of book titles of the run away from the one of the app"""
+    get_title_index().path = str(tmp_path_factory.mktemp("titles") / "titles.idx")
+
+
+@pytest.fixture
+def db_session():
+    """session for a single test, everything the test and the endpoints it calls
+    write is rolled back afterwards, so the test needs no data cleanup"""
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = TestingSessionLocal(bind=connection)
+    nested = connection.begin_nested()
+
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(session, transaction):  # pylint: disable=unused-argument
+        # commit of the code under test releases the savepoint, start a new one
+        nonlocal nested
+        if not nested.is_active:
+            nested = connection.begin_nested()
+
+    def override_get_session():
+        yield session
+
+    app.dependency_overrides[get_db] = override_get_session
+    app.dependency_overrides[get_read_db] = override_get_session
+    app.dependency_overrides[get_primary_read_db] = override_get_session
+    try:
+        yield session
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        app.dependency_overrides[get_primary_read_db] = override_get_db
+        session.close()
+        transaction.rollback()
+        connection.close()
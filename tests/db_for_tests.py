@@ -1,27 +1,28 @@
-from sqlalchemy import create_engine
+import os
+import tempfile
+
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
 from main import app
 from project.database import Base
-from project.database import DB_HOST
-from project.database import DB_PASS
-from project.database import DB_PORT
-from project.database import DB_USER
+from project.database import create_database_engine
 from project.database import get_db
+from project.database import get_primary_read_db
+from project.database import get_read_db
+from project.profiling import enforce_query_budgets
 
 
-DB_NAME = "edvantis_project_test"
-
-SQLALCHEMY_DATABASE_URL = (
-    f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# a fresh SQLite file per run by default, e.g.
+# postgresql+psycopg2://postgres:password@db:5432/edvantis_project_test
+# to run the suite against Postgres
+TEST_DATABASE_URL = os.environ.get(
+    "TEST_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_database_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base.metadata.drop_all(bind=engine)
-Base.metadata.create_all(bind=engine)
-
 
 def override_get_db():
     """database generator"""
@@ -32,4 +33,23 @@ def override_get_db():
         db.close()
 
 
+def reset_tables(bind: Engine = engine) -> None:
+    """removes all rows and restarts ids, much faster than recreating the schema
+
+    Args:
+        bind (Engine, optional): Defaults to engine.
+    """
+    tables = Base.metadata.sorted_tables
+    with bind.begin() as conn:
+        if bind.dialect.name == "postgresql":
+            names = ", ".join(table.name for table in tables)
+            conn.exec_driver_sql(f"TRUNCATE {names} RESTART IDENTITY CASCADE")
+            return
+        for table in reversed(tables):
+            conn.execute(table.delete())
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_primary_read_db] = override_get_db
+enforce_query_budgets()
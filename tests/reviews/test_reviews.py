@@ -1,9 +1,23 @@
+from datetime import datetime
+
 import pytest
 from fastapi.testclient import TestClient
 
+from ..db_for_tests import override_get_db
+from ..db_for_tests import TestingSessionLocal
 from main import app
+from project import jobs
+from project import outbox
+from project import worker
+from project.models import AggregateJob
+from project.models import Author
+from project.models import Book
+from project.models import OutboxCheckpoint
+from project.models import OutboxEvent
+from project.models import Review
 from project.reviews.schemas import ReviewRating
 from project.utils import create_access_token
+from project.worker import process_jobs
 from tests.books.test_books import create_dummy_books
 
 client = TestClient(app)
@@ -19,19 +33,50 @@ class TestReview:
         assert response.status_code == 200
         reviews = response.json()
         assert len(reviews) == 8
-        assert reviews[0]["user_id"] == 1
-        assert reviews[0]["rating"] == 4
-        assert reviews[-1]["user_id"] == 2
-        assert reviews[-1]["rating"] == 5
+        # newest first
+        assert reviews[0]["user_id"] == 2
+        assert reviews[0]["rating"] == 5
+        assert reviews[-1]["user_id"] == 1
+        assert reviews[-1]["rating"] == 4
+        assert "X-Next-Cursor" not in response.headers
         # with params
-        response = client.get("/reviews/", params={"offset": 4, "limit": 3})
+        response = client.get("/reviews/", params={"offset": 2, "limit": 3})
         assert response.status_code == 200
         reviews = response.json()
         assert len(reviews) == 3
-        assert reviews[0]["user_id"] == 1
+        assert reviews[0]["user_id"] == 2
         assert reviews[0]["rating"] == 2
-        assert reviews[0]["text"] == "not good"
-        assert reviews[2]["id"] == 7
+        assert reviews[1]["text"] == "not good"
+        assert reviews[2]["id"] == 4
+
+    def test_filter_reviews(self):
+        "test get method to show reviews with filters and cursor"
+        response = client.get("/reviews/", params={"book_id": 3, "total": True})
+        assert response.status_code == 200
+        assert [review["id"] for review in response.json()] == [6, 5]
+        assert response.headers["X-Total-Count"] == "2"
+        response = client.get("/reviews/", params={"user_id": 1, "rating": 5})
+        assert [review["id"] for review in response.json()] == [7]
+        response = client.get("/reviews/", params={"created_to": "2000-01-01T00:00:00"})
+        assert response.json() == []
+        # keyset paging
+        response = client.get("/reviews/", params={"limit": 5})
+        assert [review["id"] for review in response.json()] == [8, 7, 6, 5, 4]
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get("/reviews/", params={"limit": 5, "cursor": cursor})
+        assert [review["id"] for review in response.json()] == [3, 2, 1]
+        response = client.get("/reviews/", params={"cursor": "bad"})
+        assert response.status_code == 400
+
+    def test_get_reviews_by_ids(self):
+        """tests get method to show many reviews by their ids"""
+        response = client.get("/reviews/batch", params={"ids": "5,100,2"})
+        assert response.status_code == 200
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        batch = response.json()
+        assert [review["id"] for review in batch["items"]] == [5, 2]
+        assert batch["items"][0] == client.get("/reviews/5").json()
+        assert batch["missing"] == [100]
 
     def test_create_review(self):
         """tests post method to create new review"""
@@ -43,6 +88,9 @@ class TestReview:
             json=payload,
         )
         assert response.status_code == 201
+        # user lookup, insert, outbox, book rating, outbox, job for the book
+        # document, count of user reviews, user rank
+        assert 'desc="8 queries"' in response.headers["Server-Timing"]
         review = response.json()
         assert "created_at" in review
         assert review["user_id"] == 1
@@ -121,3 +169,183 @@ class TestReview:
             headers={"Authorization": f"Bearer {user_access_token}"},
         )
         assert response.status_code == 404
+
+    def test_create_reviews_bulk(self):
+        """tests post method to create many reviews at once"""
+        user_access_token = create_access_token("jane123")
+        payload = [
+            {"text": "bulk 1", "rating": ReviewRating.FIVE, "book_id": 6},
+            {"text": "bulk 2", "rating": ReviewRating.ONE, "book_id": 100},
+            {"text": "bulk 3", "rating": ReviewRating.THREE, "book_id": 6},
+        ]
+        response = client.post(
+            "/reviews/bulk",
+            headers={"Authorization": f"Bearer {user_access_token}"},
+            json=payload,
+        )
+        assert response.status_code == 201, response.text
+        items = response.json()
+        assert [item["status"] for item in items] == [
+            "created",
+            "book_not_found",
+            "created",
+        ]
+        assert items[0]["review"]["text"] == "bulk 1"
+        assert items[0]["review"]["user_id"] == 2
+        assert items[1]["review"] is None
+        assert items[1]["detail"] == "Book with id 100 is not found"
+        assert items[2]["review"]["rating"] == 3
+        for item in (items[0], items[2]):
+            review = client.get(f"/reviews/{item['review']['id']}").json()
+            assert review["text"] == item["review"]["text"]
+        response = client.get("/books/6")
+        assert response.json()["rating"] == 4
+        # empty list
+        response = client.post(
+            "/reviews/bulk",
+            headers={"Authorization": f"Bearer {user_access_token}"},
+            json=[],
+        )
+        assert response.status_code == 422
+
+    def test_deferred_aggregates(self, monkeypatch):
+        """tests that writes enqueue coalesced jobs which the worker processes"""
+        db = next(override_get_db())
+        # documents of books reviewed by other tests
+        while process_jobs(db):
+            pass
+        monkeypatch.setattr(jobs, "AGGREGATES_DEFERRED", True)
+        user_access_token = create_access_token("john123")
+        for rating in (ReviewRating.ONE, ReviewRating.TWO, ReviewRating.THREE):
+            response = client.post(
+                "/reviews/",
+                headers={"Authorization": f"Bearer {user_access_token}"},
+                json={"text": "deferred", "rating": rating, "book_id": 7},
+            )
+            assert response.status_code == 201
+            # user lookup, insert, outbox, jobs, stale book document
+            assert 'desc="5 queries"' in response.headers["Server-Timing"]
+        assert client.get("/books/7").json()["rating"] == 0
+
+        # one job for the book and one for the user
+        assert db.query(AggregateJob).count() == 2
+        assert process_jobs(db) == 2
+        assert process_jobs(db) == 0
+        assert client.get("/books/7").json()["rating"] == 2
+        db.close()
+
+    def test_outbox(self):
+        """tests that review writes are consumed from the outbox in batches"""
+        db = next(override_get_db())
+        consumed = []
+        while outbox.consume(db, "test", consumed.extend, batch_size=10):
+            pass
+        changes = [
+            (event.entity, event.entity_id, event.operation) for event in consumed
+        ]
+        assert ("reviews", 9, "create") in changes
+        assert ("reviews", 9, "update") in changes
+        assert ("reviews", 9, "delete") in changes
+        # every review of book 1 updated its rating
+        versions = [
+            event.version
+            for event in consumed
+            if event.entity == "books" and event.entity_id == 1
+        ]
+        assert versions == [2, 3]
+        assert outbox.get_checkpoint(db, "test") == (
+            consumed[-1].transaction_id,
+            consumed[-1].id,
+        )
+        assert outbox.consume(db, "test", consumed.extend) == 0
+
+        user_access_token = create_access_token("jane123")
+        response = client.put(
+            "/reviews/2",
+            headers={"Authorization": f"Bearer {user_access_token}"},
+            json={"rating": ReviewRating.THREE},
+        )
+        assert response.status_code == 202
+        batch = []
+        assert outbox.consume(db, "test", batch.extend) == 2
+        assert [(event.entity, event.entity_id, event.version) for event in batch] == [
+            ("reviews", 2, 2),
+            ("books", 1, 4),
+        ]
+        assert outbox.prune(db) == len(consumed) + 2
+        db.close()
+
+    def test_outbox_retention(self):
+        """tests that the worker prunes events nobody consumes after a while"""
+        db = next(override_get_db())
+        db.query(OutboxCheckpoint).delete()
+        db.query(OutboxEvent).delete()
+        for created_at in (datetime(2000, 1, 1), datetime.now()):
+            db.add(
+                OutboxEvent(
+                    entity="books",
+                    entity_id=1,
+                    operation=outbox.UPDATE,
+                    version=1,
+                    created_at=created_at,
+                )
+            )
+        db.commit()
+        worker.prune(TestingSessionLocal)
+        assert [event.created_at.year for event in db.query(OutboxEvent)] == [
+            datetime.now().year
+        ]
+        db.close()
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestReviewCascades:
+    """tests reviews removed together with their user or book"""
+
+    def test_outbox_cascades(self):
+        """tests that reviews deleted by cascades are written to the outbox"""
+        db = next(override_get_db())
+        while outbox.consume(db, "cascades", lambda events: None):
+            pass
+
+        user_access_token = create_access_token("john123")
+        response = client.delete(
+            "/users/profile", headers={"Authorization": f"Bearer {user_access_token}"}
+        )
+        assert response.status_code == 204
+        batch = []
+        outbox.consume(db, "cascades", batch.extend)
+        changes = {(event.entity, event.operation) for event in batch}
+        assert changes == {("reviews", "delete"), ("books", "update")}
+        assert sorted(
+            event.entity_id for event in batch if event.entity == "books"
+        ) == [1, 2, 3, 4]
+        # only reviews of jane123 are left
+        assert [
+            client.get(f"/books/{book_id}").json()["rating"] for book_id in (1, 2)
+        ] == [1, 5]
+
+        db.rollback()
+        sole = [
+            book_id
+            for book_id, in db.query(Book.id).filter(~Book.authors.any(Author.id == 2))
+        ]
+        reviews = [
+            review_id
+            for review_id, in db.query(Review.id).filter(Review.book_id.in_(sole))
+        ]
+        assert reviews
+        db.rollback()
+        assert client.delete("/authors/1").status_code == 204
+        batch = []
+        outbox.consume(db, "cascades", batch.extend)
+        deleted = {
+            entity: sorted(
+                event.entity_id
+                for event in batch
+                if event.entity == entity and event.operation == outbox.DELETE
+            )
+            for entity in ("books", "reviews")
+        }
+        assert deleted == {"books": sorted(sole), "reviews": sorted(reviews)}
+        db.close()
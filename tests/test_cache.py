@@ -0,0 +1,81 @@
+import fakeredis
+import pytest
+
+from project.cache import Cache
+from project.cache import LocalCache
+from project.cache import RedisCache
+
+
+@pytest.fixture(params=["local", "redis"])
+def cache(request):
+    """fixture with every cache backend, redis one runs against a fake server"""
+    if request.param == "redis":
+        return RedisCache(fakeredis.FakeRedis(), prefix="test")
+    return LocalCache(max_entries=3, prefix="test")
+
+
+def test_get_set_delete(cache):
+    """tests basic operations with json values"""
+    assert cache.get("books", "1") is None
+    cache.set("books", "1", {"id": 1, "title": "new book", "rating": 4.5})
+    assert cache.get("books", "1") == {"id": 1, "title": "new book", "rating": 4.5}
+    # same key in another namespace
+    assert cache.get("authors", "1") is None
+    cache.delete("books", "1")
+    assert cache.get("books", "1") is None
+
+
+def test_invalidate(cache):
+    """tests that bumping namespace version makes its entries stale"""
+    cache.set("books", "1", [1])
+    cache.set("authors", "1", [2])
+    cache.invalidate("books")
+    assert cache.get("books", "1") is None
+    assert cache.get("authors", "1") == [2]
+    cache.set("books", "1", [3])
+    assert cache.get("books", "1") == [3]
+
+
+def test_get_or_set(cache):
+    """tests that value computed before invalidation is not served after it"""
+    calls = []
+
+    def factory():
+        calls.append(1)
+        # a write happens while the value is being computed
+        cache.invalidate("books")
+        return len(calls)
+
+    assert cache.get_or_set("books", "list", factory) == 1
+    assert cache.get_or_set("books", "list", lambda: 10) == 10
+    assert cache.get_or_set("books", "list", lambda: 20) == 10
+
+
+def test_local_cache_eviction_and_ttl(monkeypatch):
+    """tests least recently used eviction and expiry"""
+    cache = LocalCache(max_entries=2)
+    cache.set("books", "1", 1)
+    cache.set("books", "2", 2)
+    cache.get("books", "1")
+    cache.set("books", "3", 3)
+    assert cache.get("books", "2") is None
+    assert cache.get("books", "1") == 1
+
+    now = 1000.0
+    monkeypatch.setattr("project.cache.time.monotonic", lambda: now)
+    cache.set("books", "4", 4, ttl=10)
+    now += 11
+    assert cache.get("books", "4") is None
+
+
+def test_incomplete_backend():
+    """tests that a backend without every raw operation cannot be created"""
+
+    class ReadOnlyCache(Cache):
+        """implements reads only"""
+
+        def get_many_raw(self, keys):
+            return [None] * len(keys)
+
+    with pytest.raises(TypeError):
+        ReadOnlyCache()
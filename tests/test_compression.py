@@ -0,0 +1,152 @@
+import asyncio
+import gzip
+import json
+import logging
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from main import app
+from project import compression
+from tests.books.test_books import create_dummy_books
+
+client = TestClient(app)
+
+
+def test_choose_encoding(monkeypatch):
+    """tests negotiation of the content coding"""
+    monkeypatch.setattr(compression, "zstandard", None)
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("") is None
+    assert compression.choose_encoding("identity") is None
+    assert compression.choose_encoding("gzip;q=0") is None
+    assert compression.choose_encoding("*") == "gzip"
+    # brotli is preferred once installed, unless the client weights it lower
+    monkeypatch.setattr(compression, "brotli", object())
+    assert compression.choose_encoding("gzip, br") == "br"
+    assert compression.choose_encoding("gzip, br;q=0.5") == "gzip"
+    assert compression.choose_encoding("br;q=bad, gzip") == "gzip"
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestCompression:
+    """tests compression of application responses"""
+
+    def test_compress_json(self):
+        """tests that large JSON is compressed and small responses are not"""
+        before = compression.get_compression_stats().get("gzip", {})
+        response = client.get(
+            "/books/", params={"limit": 15}, headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert "compress;dur=" in response.headers["Server-Timing"]
+        assert len(response.json()) == 10
+        size = len(response.content)
+        assert int(response.headers["Content-Length"]) < size
+        after = compression.get_compression_stats()["gzip"]
+        assert after["responses"] == before.get("responses", 0) + 1
+        assert after["bytes_in"] == before.get("bytes_in", 0) + size
+        assert after["ratio"] > 1
+
+        response = client.get(
+            "/books/", params={"limit": 15}, headers={"Accept-Encoding": "identity"}
+        )
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert int(response.headers["Content-Length"]) == size
+
+        response = client.get("/books/1", headers={"Accept-Encoding": "gzip"})
+        assert len(response.content) < compression.COMPRESSION_MIN_SIZE
+        assert "Content-Encoding" not in response.headers
+
+    def test_log_stats(self, monkeypatch, caplog):
+        """tests that totals per content coding reach the log"""
+        monkeypatch.setattr(compression, "COMPRESSION_STATS_LOG_SECONDS", 1e-9)
+        with caplog.at_level(logging.INFO, logger=compression.__name__):
+            client.get(
+                "/books/", params={"limit": 15}, headers={"Accept-Encoding": "gzip"}
+            )
+        assert any(
+            record.getMessage().startswith("gzip compressed")
+            for record in caplog.records
+        )
+
+
+def test_streaming():
+    """tests that every chunk of a streamed response is flushed compressed"""
+    batches = [
+        json.dumps([{"id": i, "title": f"Book {i}"} for i in range(batch, batch + 50)])
+        + "\n"
+        for batch in range(0, 150, 50)
+    ]
+
+    async def export(request):  # pylint: disable=unused-argument
+        async def rows():
+            for batch in batches:
+                yield batch
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    async def stream(request):  # pylint: disable=unused-argument
+        async def rows():
+            for batch in batches:
+                yield batch
+
+        return StreamingResponse(rows(), media_type="application/json")
+
+    streaming_app = compression.CompressionMiddleware(
+        Starlette(routes=[Route("/export", export), Route("/stream", stream)])
+    )
+
+    async def call(path):
+        messages = []
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "scheme": "http",
+            "query_string": b"",
+            "headers": [(b"accept-encoding", b"gzip")],
+            "server": ("testserver", 80),
+        }
+
+        requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # the client stays connected
+            await asyncio.Event().wait()
+
+        async def send(message):
+            messages.append(message)
+
+        await streaming_app(scope, receive, send)
+        return messages
+
+    # not in the allowlist
+    messages = asyncio.run(call("/export"))
+    assert b"content-encoding" not in dict(messages[0]["headers"])
+
+    messages = asyncio.run(call("/stream"))
+    headers = dict(messages[0]["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    bodies = [message for message in messages[1:] if message.get("more_body")]
+    assert len(bodies) == len(batches)
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for message, batch in zip(bodies, batches):
+        # decodable on arrival, without waiting for the rest
+        assert decoder.decompress(message["body"]).decode() == batch
+    assert messages[-1]["more_body"] is False
+    body = b"".join(message["body"] for message in messages[1:])
+    assert gzip.decompress(body).decode() == "".join(batches)
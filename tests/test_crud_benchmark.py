@@ -0,0 +1,21 @@
+from benchmarks.crud import run
+
+
+def test_crud_benchmark():
+    """tests that statements and fetched rows of CRUD calls are counted
+    and writes are rolled back between calls"""
+    result = run([200, 400], ["get_book_by_id", "get_books", "create_review"], repeat=2)
+    results = result["results"]
+    assert set(results["get_books"]) == {200, 400}
+    assert results["get_book_by_id"][200]["statements"] == 1
+    assert results["get_book_by_id"][200]["rows"] == 1
+    # books with their authors and reviews
+    assert results["get_books"][400]["statements"] == 3
+    assert results["get_books"][400]["rows"] > 20
+    # insert, outbox, rating, outbox, job for the book document,
+    # review count and rank update of the user
+    assert results["create_review"][200]["statements"] == 7
+    assert results["create_review"][200]["peak_kib"] > 0
+    summary = result["summary"]["get_books"]
+    assert summary["data_growth"] == 2
+    assert not summary["statements_vary"]
@@ -0,0 +1,121 @@
+import itertools
+import time
+
+from fastapi import Request
+from fastapi import Response
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from main import app
+from project import database
+from project.models import User
+from tests.db_for_tests import TestingSessionLocal
+
+client = TestClient(app)
+
+
+class FakeSession:
+    """stands in for a session bound to a replica"""
+
+    def close(self):
+        """nothing to close"""
+
+
+def make_request(cookie: str = "") -> Request:
+    """builds request with optional cookie header"""
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "headers": headers})
+
+
+def test_get_read_db_routing(monkeypatch):
+    """tests that reads go to replicas unless the client wrote recently"""
+    monkeypatch.setattr(database, "replica_engines", [object()])
+    monkeypatch.setattr(database, "replica_sessions", itertools.repeat(FakeSession))
+
+    db = next(database.get_read_db(make_request()))
+    assert isinstance(db, FakeSession)
+
+    cookie = f"{database.LAST_WRITE_COOKIE}={time.time()}"
+    db = next(database.get_read_db(make_request(cookie)))
+    assert not isinstance(db, FakeSession)
+    db.close()
+
+    stale = time.time() - database.READ_YOUR_WRITES_SECONDS - 1
+    cookie = f"{database.LAST_WRITE_COOKIE}={stale}"
+    db = next(database.get_read_db(make_request(cookie)))
+    assert isinstance(db, FakeSession)
+
+
+def test_sqlite_engine(tmp_path):
+    """tests that SQLite connections are tuned and support savepoints"""
+    engine = database.create_database_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+        conn.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+        with conn.begin():
+            conn.exec_driver_sql("INSERT INTO items VALUES (1)")
+            savepoint = conn.begin_nested()
+            conn.exec_driver_sql("INSERT INTO items VALUES (2)")
+            savepoint.rollback()
+        assert conn.exec_driver_sql("SELECT count(*) FROM items").scalar() == 1
+    engine.dispose()
+
+
+def test_db_session(db_session):
+    """tests that writes of endpoints are kept inside the transaction of the test"""
+    users = db_session.query(User).count()
+    db_session.add(User(username="rollback", email="rollback@mail.com", password="x"))
+    db_session.commit()
+    response = client.get("/users/", params={"total": True})
+    assert response.headers["X-Total-Count"] == str(users + 1)
+    other = TestingSessionLocal()
+    assert other.query(User).filter(User.username == "rollback").count() == 0
+    other.close()
+
+
+def test_get_db_marks_writers(monkeypatch):
+    """tests that only a session which writes sets the last write cookie"""
+    monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+    response = Response()
+    db = next(database.get_db(response))
+    db.query(User).count()
+    db.rollback()
+    assert "set-cookie" not in response.headers
+
+    db.query(User).filter(User.username == "nobody").delete()
+    assert response.headers["set-cookie"].startswith(database.LAST_WRITE_COOKIE)
+    db.rollback()
+    db.close()
+
+
+def test_sqlite_begin_immediate(tmp_path):
+    """tests that writing sessions take the write lock of SQLite at BEGIN"""
+    engine = database.create_database_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+    for bind, locked in ((engine, False), (database.write_engine(engine), True)):
+        with bind.connect() as first, engine.connect() as second:
+            second.exec_driver_sql("PRAGMA busy_timeout = 0")
+            with first.begin():
+                first.exec_driver_sql("SELECT count(*) FROM items").scalar()
+                try:
+                    with second.begin():
+                        second.exec_driver_sql("INSERT INTO items DEFAULT VALUES")
+                except OperationalError:
+                    assert locked
+                else:
+                    assert not locked
+            second.exec_driver_sql(
+                f"PRAGMA busy_timeout = {database.SQLITE_PRAGMAS['busy_timeout']}"
+            )
+    engine.dispose()
+
+
+def test_get_primary_read_db():
+    """tests that sessions of primary reads begin deferred, unlike writers"""
+    sessions = database.get_primary_read_db()
+    db = next(sessions)
+    assert db.get_bind() is database.engine
+    assert database.SessionLocal().get_bind() is not database.engine
+    sessions.close()
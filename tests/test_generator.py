@@ -0,0 +1,57 @@
+import json
+
+from sqlalchemy.orm import Session
+
+from benchmarks.generator import Dataset
+from benchmarks.generator import write_database
+from benchmarks.generator import write_files
+from project import models
+from project.database import create_database_engine
+from project.reviews.crud import update_book_rating
+from project.startup import create_schema
+
+
+def make_dataset(seed: int = 42) -> Dataset:
+    """small dataset with batches smaller than tables"""
+    return Dataset(reviews=500, books=20, users=30, authors=5, seed=seed, batch_size=64)
+
+
+def test_deterministic():
+    """tests that the same seed gives the same rows and popularity is skewed"""
+    reviews = [row for batch in make_dataset().reviews() for row in batch]
+    assert reviews == [row for batch in make_dataset().reviews() for row in batch]
+    assert reviews != [row for batch in make_dataset(7).reviews() for row in batch]
+    assert [row["id"] for row in reviews] == list(range(1, 501))
+    counts = sorted(
+        (sum(row["book_id"] == book_id for row in reviews) for book_id in range(1, 21)),
+        reverse=True,
+    )
+    # the most popular book gets far more reviews than an average one
+    assert counts[0] > 3 * 500 / 20
+
+
+def test_write_database(tmp_path):
+    """tests that inserted aggregates match the ones computed by the database"""
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'generated.db'}")
+    create_schema(engine)
+    counts = write_database(make_dataset(), engine)
+    assert counts["reviews"] == 500
+    assert counts["books"] == 20
+    with Session(bind=engine) as db:
+        ratings = dict(db.query(models.Book.id, models.Book.rating))
+        update_book_rating(db, list(ratings))
+        for book_id, rating in db.query(models.Book.id, models.Book.rating):
+            assert abs(ratings[book_id] - rating) < 0.01
+        assert db.query(models.User).filter(models.User.rank.is_(None)).count() == 0
+        assert db.query(models.User).filter(models.User.rank != "9 kyu").count() > 0
+    engine.dispose()
+
+
+def test_write_files(tmp_path):
+    """tests that every table is written as JSON lines"""
+    counts = write_files(make_dataset(), str(tmp_path))
+    assert counts["reviews"] == 500
+    with open(tmp_path / "books.jsonl", encoding="utf8") as file:
+        books = [json.loads(line) for line in file]
+    assert len(books) == 20
+    assert any(book["rating"] > 0 for book in books)
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy import select
+
+from .db_for_tests import engine
+from .db_for_tests import override_get_db
+from .db_for_tests import reset_tables
+from project import invalidation
+from project.cache import dumps
+from project.cache import loads
+from project.cache import LocalCache
+from project.models import Author
+
+
+class NotifySession:
+    """
+    NotifySession records statements of notify instead of running them
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def get_bind(self):
+        """gets engine of the tests"""
+        return engine
+
+    def execute(self, statement):
+        """records statement"""
+        self.statements.append(statement)
+
+
+def test_handle(monkeypatch):
+    """tests that notifications of other processes invalidate their namespaces"""
+    cache = LocalCache(prefix="test")
+    listener = invalidation.InvalidationListener(bind=engine, cache=cache)
+    cache.set("books", "facets", [1])
+    cache.set("authors", "1", [2])
+
+    monkeypatch.setattr(invalidation, "is_enabled", lambda bind: True)
+    db = NotifySession()
+    invalidation.notify(db, "books", [1, 2], "books")
+    invalidation.notify(db, "books", range(invalidation.NOTIFY_MAX_IDS + 1), "books")
+    payloads = [
+        statement.compile().params["pg_notify_3"] for statement in db.statements
+    ]
+    assert loads(payloads[0])["ids"] == [1, 2]
+    assert loads(payloads[1])["ids"] is None
+
+    # sent by this process and already invalidated after commit
+    listener.handle(payloads[0])
+    assert cache.get("books", "facets") == [1]
+
+    listener.handle(payloads[0].replace(invalidation.origin(), "other:1"))
+    assert cache.get("books", "facets") is None
+    assert cache.get("authors", "1") == [2]
+
+    listener.handle("not json")
+    assert cache.get("authors", "1") == [2]
+
+
+def test_check_versions(monkeypatch):
+    """tests that reads notice rows changed without a notification"""
+    reset_tables()
+    monkeypatch.setattr(invalidation, "CACHE_SETTLE_SECONDS", 0)
+    cache = LocalCache(prefix="test")
+    listener = invalidation.InvalidationListener(
+        bind=engine, cache=cache, check_seconds=0
+    )
+    cache.version_check = listener.check_versions
+    cache.set("authors", "1", [1])
+    cache.set("users", "1", [2])
+    assert cache.get("authors", "1") == [1]
+
+    db = next(override_get_db())
+    db.add(Author(first_name="John", last_name="Doe"))
+    db.commit()
+    db.close()
+    assert cache.get("authors", "1") is None
+    assert cache.get("users", "1") == [2]
+
+    # checked at most once per check_seconds
+    listener.check_seconds = 60
+    cache.set("authors", "1", [3])
+    db = next(override_get_db())
+    db.add(Author(first_name="Jane", last_name="Doe"))
+    db.commit()
+    db.close()
+    assert cache.get("authors", "1") == [3]
+
+
+@pytest.mark.skipif(
+    engine.dialect.name != "postgresql", reason="LISTEN/NOTIFY needs Postgres"
+)
+def test_listener():
+    """tests that a notification committed by another process reaches the cache"""
+    cache = LocalCache(prefix="test")
+    listener = invalidation.InvalidationListener(
+        bind=engine, cache=cache, check_seconds=0
+    )
+    listener.start()
+    try:
+        time.sleep(0.5)
+        cache.set("reviews", "1", [1])
+        payload = {"origin": "other:1", "entity": "reviews", "namespaces": ["reviews"]}
+        with engine.begin() as conn:
+            conn.execute(
+                select(
+                    func.pg_notify(invalidation.CACHE_CHANNEL, dumps(payload).decode())
+                )
+            )
+        deadline = time.monotonic() + 5
+        while cache.get_many_raw([cache.version_key("reviews")])[0] == b"1":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        listener.stop()
+    assert cache.version_check is None
@@ -0,0 +1,95 @@
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from project import rate_limit
+from project import utils
+from project.rate_limit import MemoryBucketStore
+from project.rate_limit import RedisBucketStore
+
+client = TestClient(app)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    """fixture with every bucket store, redis one runs against a fake server"""
+    if request.param == "redis":
+        return RedisBucketStore(fakeredis.FakeRedis())
+    return MemoryBucketStore(max_keys=3)
+
+
+@pytest.fixture
+def fresh_store(monkeypatch):
+    """fixture which gives the endpoints an empty bucket store"""
+    store = MemoryBucketStore()
+    monkeypatch.setattr(rate_limit, "get_store", lambda: store)
+    return store
+
+
+def test_consume(store):
+    """tests that burst is allowed and the next attempt has to wait"""
+    assert store.consume("login:ip:1", 3, 1.0) == (True, 0.0)
+    assert store.consume("login:ip:1", 3, 1.0) == (True, 0.0)
+    assert store.consume("login:ip:1", 3, 1.0) == (True, 0.0)
+    allowed, retry_after = store.consume("login:ip:1", 3, 1.0)
+    assert not allowed
+    assert 0 < retry_after <= 1
+    # other buckets are independent
+    assert store.consume("login:ip:2", 3, 1.0) == (True, 0.0)
+
+
+def test_refill(monkeypatch):
+    """tests that tokens come back over time and full buckets are dropped"""
+    now = [100.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    store = MemoryBucketStore()
+    assert store.consume("a", 2, 1.0)[0]
+    assert store.consume("a", 2, 1.0)[0]
+    assert not store.consume("a", 2, 1.0)[0]
+    now[0] += 1
+    assert store.consume("a", 2, 1.0)[0]
+    assert not store.consume("a", 2, 1.0)[0]
+    # "a" is full again after 2 seconds, so it is swept by the next call
+    now[0] += 2
+    store.consume("b", 2, 1.0)
+    assert list(store.buckets) == ["b"]
+
+
+def test_max_keys():
+    """tests that least recently updated buckets are evicted"""
+    store = MemoryBucketStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        store.consume(key, 5, 0.001)
+    assert list(store.buckets) == ["b", "c"]
+
+
+def test_login_rejected_before_bcrypt(fresh_store, monkeypatch):
+    """tests that attempts over the limit get 429 and never verify the password"""
+    calls = []
+    monkeypatch.setattr(utils, "verify_password", lambda *args: calls.append(args))
+    for _ in range(rate_limit.LOGIN_USERNAME_BURST):
+        fresh_store.consume(
+            "login:user:john123",
+            rate_limit.LOGIN_USERNAME_BURST,
+            rate_limit.LOGIN_USERNAME_PER_MINUTE / 60,
+        )
+    payload = {"username": "John123", "password": "password_wrong"}
+    response = client.post("/users/login", data=payload)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert not calls
+
+
+def test_registration_rejected_before_bcrypt(fresh_store, monkeypatch):
+    """tests that registrations over the limit get 429 and never hash the password"""
+    monkeypatch.setattr(rate_limit, "REGISTRATION_IP_BURST", 1)
+    monkeypatch.setattr(rate_limit, "REGISTRATION_IP_PER_MINUTE", 1)
+    calls = []
+    monkeypatch.setattr(utils, "get_password_hash", lambda *args: calls.append(args))
+    payload = {"username": "x"}
+    assert client.post("/users/registration", json=payload).status_code == 422
+    response = client.post("/users/registration", json=payload)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert not calls
@@ -0,0 +1,30 @@
+import json
+
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+from project import database  # pylint: disable=unused-import
+from project import slow_query_log
+
+
+def test_slow_query_log(tmp_path, monkeypatch):
+    """tests that slow queries are written with their plan and rate limited"""
+    log_file = tmp_path / "slow.log"
+    monkeypatch.setattr(slow_query_log, "SLOW_QUERY_THRESHOLD_MS", 0)
+    monkeypatch.setattr(slow_query_log, "SLOW_QUERY_LOG_FILE", str(log_file))
+    monkeypatch.setattr(slow_query_log, "rate_limiter", slow_query_log.RateLimiter(2))
+    monkeypatch.setattr(slow_query_log.logger, "handlers", [])
+
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE books (id INTEGER PRIMARY KEY, rating FLOAT)"))
+        for _ in range(3):
+            conn.execute(text("SELECT id FROM books WHERE rating >= :r"), {"r": 4})
+
+    entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+    # third query is over the limit
+    assert len(entries) == 2
+    assert entries[1]["statement"] == "SELECT id FROM books WHERE rating >= ?"
+    assert entries[1]["parameters"] == [4]
+    assert entries[1]["plan"]
+    assert entries[1]["duration_ms"] >= 0
@@ -0,0 +1,63 @@
+import anyio
+import pytest
+from alembic import command
+from anyio import to_thread
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import text
+
+from project import startup
+
+
+def test_schema_revision(tmp_path):
+    """tests that startup accepts only a database at the head revision"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    with pytest.raises(RuntimeError):
+        startup.check_schema_revision(engine)
+    startup.create_schema(engine)
+    assert startup.get_current_revision(engine) == startup.get_head_revision()
+    assert startup.check_schema_revision(engine) == startup.get_head_revision()
+
+
+def test_unversioned_schema(tmp_path):
+    """tests that a schema created by create_all before migrations is migrated"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    startup.create_schema(engine)
+    # back to the tables of the baseline, without the version table
+    config = startup.get_alembic_config(engine)
+    command.downgrade(config, startup.BASELINE_REVISION)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE alembic_version"))
+    assert "version" not in {
+        column["name"] for column in inspect(engine).get_columns("books")
+    }
+
+    startup.create_schema(engine)
+    assert startup.check_schema_revision(engine) == startup.get_head_revision()
+    assert "version" in {
+        column["name"] for column in inspect(engine).get_columns("books")
+    }
+
+
+def test_configure_threadpool():
+    """tests that sync handlers get one thread per pooled connection"""
+
+    async def configure():
+        threads = startup.configure_threadpool()
+        return threads, to_thread.current_default_thread_limiter().total_tokens
+
+    threads, tokens = anyio.run(configure)
+    assert threads == tokens == startup.DB_POOL_SIZE + startup.DB_MAX_OVERFLOW
+
+
+def test_on_startup(monkeypatch):
+    """tests that startup hooks run inside the event loop of the server"""
+    monkeypatch.setattr(startup, "CHECK_SCHEMA_REVISION", False)
+    for name in ("warm_author_index", "warm_title_index", "start_listener"):
+        monkeypatch.setattr(startup, name, lambda: None)
+
+    async def run_startup():
+        await startup.on_startup()
+        return to_thread.current_default_thread_limiter().total_tokens
+
+    assert anyio.run(run_startup) == startup.DB_POOL_SIZE + startup.DB_MAX_OVERFLOW
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from .db_for_tests import override_get_db
+from main import app
+from project import sync
+from project.models import Author
+from project.models import Book
+from project.models import Review
+from project.models import Tombstone
+from project.models import User
+from project.reviews.schemas import ReviewRating
+from project.utils import create_access_token
+from tests.books.test_books import create_dummy_books
+
+client = TestClient(app)
+
+
+def sync_pages(since=None, limit=100):
+    """follows pages of /sync/ until has_more is false
+
+    Returns:
+        tuple: changed ids, deleted ids, number of pages and the last token
+    """
+    changed = {entity: [] for entity in sync.ENTITIES}
+    deleted = {entity: [] for entity in sync.ENTITIES}
+    pages = 0
+    while True:
+        params = {"limit": limit} if since is None else {"since": since, "limit": limit}
+        response = client.get("/sync/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        pages += 1
+        for entity in sync.ENTITIES:
+            changed[entity] += page["changed"][entity]
+            deleted[entity] += page["deleted"][entity]
+        since = page["next"]
+        if not page["has_more"]:
+            return changed, deleted, pages, since
+
+
+@pytest.mark.usefixtures("create_dummy_books")
+class TestSync:
+    """tests delta sync"""
+
+    @pytest.fixture(autouse=True)
+    def settled(self, monkeypatch):
+        """returns changes right away"""
+        monkeypatch.setattr(sync, "SYNC_SETTLE_SECONDS", 0)
+
+    def test_sync(self):
+        """tests that a client gets every row once, then only the deltas"""
+        db = next(override_get_db())
+        response = client.get("/sync/")
+        assert response.headers["Server-Timing"].endswith('desc="5 queries"')
+
+        changed, deleted, pages, token = sync_pages(limit=3)
+        assert pages > 1
+        for entity, model in sync.ENTITIES.items():
+            ids = [row_id for row_id, in db.query(model.id).order_by(model.id)]
+            assert sorted(changed[entity]) == ids
+            assert len(set(changed[entity])) == len(ids)
+        assert deleted == {entity: [] for entity in sync.ENTITIES}
+        nothing = {entity: [] for entity in sync.ENTITIES}
+        assert sync_pages(token)[:2] == (nothing, nothing)
+
+        user_access_token = create_access_token("jane123")
+        response = client.put(
+            "/reviews/2",
+            headers={"Authorization": f"Bearer {user_access_token}"},
+            json={"rating": ReviewRating.THREE},
+        )
+        assert response.status_code in (200, 202)
+        changed, deleted, _, token = sync_pages(token)
+        assert changed["reviews"] == [2]
+        assert changed["authors"] == changed["users"] == []
+        assert deleted == nothing
+
+        response = client.delete(
+            "/reviews/2", headers={"Authorization": f"Bearer {user_access_token}"}
+        )
+        assert response.status_code == 204
+        changed, deleted, _, token = sync_pages(token)
+        assert deleted["reviews"] == [2]
+        assert changed["reviews"] == []
+
+        # reviews of a deleted book are deleted too
+        db.rollback()  # drops the snapshot read before the deletes
+        book_id = db.query(Review.book_id).filter(Review.id == 1).scalar()
+        review_ids = sorted(
+            row_id for row_id, in db.query(Review.id).filter(Review.book_id == book_id)
+        )
+        assert client.delete(f"/books/{book_id}").status_code == 204
+        changed, deleted, _, token = sync_pages(token)
+        assert deleted["books"] == [book_id]
+        assert sorted(deleted["reviews"]) == review_ids
+        db.close()
+
+    def test_updated_at(self):
+        """tests that updates made with a single UPDATE statement stamp rows"""
+        db = next(override_get_db())
+        author = db.query(Author).first()
+        stamped = author.updated_at
+        db.query(Author).filter(Author.id == author.id).update(
+            {"first_name": "Renamed"}, synchronize_session=False
+        )
+        db.commit()
+        assert (
+            db.query(Author.updated_at).filter(Author.id == author.id).scalar()
+            > stamped
+        )
+        for model in (Book, Review, User):
+            assert db.query(model).filter(model.updated_at.is_(None)).count() == 0
+        db.close()
+
+    def test_invalid_token(self):
+        """tests that a malformed token is rejected"""
+        assert client.get("/sync/", params={"since": "bad"}).status_code == 400
+        token = sync.encode_token({"orders": (sync.datetime.now(), None)})
+        assert client.get("/sync/", params={"since": token}).status_code == 400
+
+    def test_tombstone_retention(self, monkeypatch):
+        """tests that old tombstones are pruned and older tokens need a full sync"""
+        db = next(override_get_db())
+        token = sync_pages()[3]
+        db.add(Tombstone(entity="books", entity_id=1, deleted_at=datetime(2000, 1, 1)))
+        db.commit()
+        assert sync.prune_tombstones(db) == 1
+        assert client.get("/sync/", params={"since": token}).status_code == 200
+
+        monkeypatch.setattr(sync, "SYNC_TOMBSTONE_RETENTION_DAYS", 0)
+        response = client.get("/sync/", params={"since": token})
+        assert response.status_code == 410
+        assert client.get("/sync/").status_code == 200
+        db.close()
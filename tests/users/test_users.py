@@ -1,10 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
 
-from ..db_for_tests import engine
 from ..db_for_tests import override_get_db
+from ..db_for_tests import reset_tables
 from main import app
-from project.database import Base
 from project.models import User
 from project.utils import create_access_token
 from project.utils import get_password_hash
@@ -16,8 +15,7 @@ client = TestClient(app)
 @pytest.fixture(autouse=True, scope="class")
 def create_dummy_users():
     """fixture to execute asserts before and after a test is run"""
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    reset_tables()
 
     db = next(override_get_db())
     new_user = User(